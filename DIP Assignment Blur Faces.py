@@ -4,49 +4,132 @@ Created on Fri Jul 25 02:46:14 2025
 
 @author: 1215m
 """
+import threading
 import cv2
+from frame_pipeline import process_frames
+from face_tracking import FaceTracker
+from instrumentation import metrics
 
 videoPATH = r"street.mp4"
-video = cv2.VideoCapture(videoPATH)
-face_cascade = cv2.CascadeClassifier("face_detector.xml")
-
-def blur_face(img):
-    final_img = img.copy() #Clear Frame
-    blur_img = img.copy() #Blur Frame
-    rectangle = face_cascade.detectMultiScale(blur_img, scaleFactor=1.2, minNeighbors=5)
-    blur_img = cv2.blur(blur_img, (101, 101))
+cascadePATH = "face_detector.xml"
+
+# Pipeline settings (None = use the defaults from frame_pipeline)
+PIPELINE_WORKERS = None
+PIPELINE_QUEUE_DEPTH = None
+
+# Temporal mode: only run the face detector every DETECT_INTERVAL frames (or when the scene
+# changes more than MOTION_THRESHOLD) and track the faces in between
+TEMPORAL_MODE = True
+DETECT_INTERVAL = 10
+MOTION_THRESHOLD = 12.0
+
+# Faces are detected on a grayscale copy scaled down by DETECT_SCALE, then mapped back to full size
+DETECT_SCALE = 0.5
+# Blur settings: BLUR_MODE is "box" (101x101 box blur), "mosaic" (pixelate in MOSAIC_BLOCK sized blocks)
+# or "pyramid" (PYRAMID_LEVELS rounds of pyrDown, then scaled back up)
+BLUR_MODE = "box"
+BLUR_KERNEL = 101
+MOSAIC_BLOCK = 16
+PYRAMID_LEVELS = 4
+# Extra area blurred around every face, as a fraction of the face size
+BLUR_PADDING = 0.1
+
+# CascadeClassifier is not safe to share between threads, so every worker thread loads its own (one per file)
+_local = threading.local()
+
+def get_face_cascade(path=None):
+    path = path or cascadePATH
+    if not hasattr(_local, "face_cascades"):
+        _local.face_cascades = {}
+    if path not in _local.face_cascades:
+        _local.face_cascades[path] = cv2.CascadeClassifier(path)
+    return _local.face_cascades[path]
+
+# Runs the detector on a small grayscale copy of the frame and returns the boxes in full size coordinates
+# scale, cascade = detect scale and cascade file (None = DETECT_SCALE, cascadePATH)
+def detect_faces(img, scale=None, cascade=None):
+    scale = DETECT_SCALE if scale is None else scale
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    if scale != 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    with metrics.time("detect"):
+        rectangle = get_face_cascade(cascade).detectMultiScale(gray, scaleFactor=1.2, minNeighbors=5)
+    metrics.count("faces_detected", len(rectangle))
+    return [tuple(int(round(v / scale)) for v in box) for box in rectangle]
+
+# Blurs one region of the frame in place, mode = blur mode (None = BLUR_MODE)
+def blur_region(img, x0, y0, x1, y1, mode=None):
+    mode = mode or BLUR_MODE
+    roi = img[y0:y1, x0:x1]
+    h, w = roi.shape[:2]
+    if mode == "mosaic":
+        small = cv2.resize(roi, (max(w // MOSAIC_BLOCK, 1), max(h // MOSAIC_BLOCK, 1)), interpolation=cv2.INTER_AREA)
+        roi[:] = cv2.resize(small, (w, h), interpolation=cv2.INTER_NEAREST)
+    elif mode == "pyramid":
+        small = roi
+        for _ in range(PYRAMID_LEVELS):
+            if min(small.shape[:2]) < 2:
+                break
+            small = cv2.pyrDown(small)
+        roi[:] = cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR)
+    else:
+        # Blur a window grown by the kernel radius so the result matches blurring the whole frame
+        r = BLUR_KERNEL // 2
+        fh, fw = img.shape[:2]
+        wx0, wy0 = max(x0 - r, 0), max(y0 - r, 0)
+        wx1, wy1 = min(x1 + r, fw), min(y1 + r, fh)
+        blurred = cv2.blur(img[wy0:wy1, wx0:wx1], (BLUR_KERNEL, BLUR_KERNEL))
+        roi[:] = blurred[y0 - wy0:y1 - wy0, x0 - wx0:x1 - wx0]
+
+# Blurs every detected face of the frame in place (and returns the same frame)
+# Only the padded face areas are touched, so the cost depends on the face size, not the frame size
+# rectangle = face boxes found beforehand (eg. by the tracker), detects them if not given
+# mode, padding, scale, cascade = settings for this call (None = the module settings above)
+def blur_face(img, rectangle=None, mode=None, padding=None, scale=None, cascade=None):
+    if rectangle is None:
+        rectangle = detect_faces(img, scale, cascade)
+    padding = BLUR_PADDING if padding is None else padding
+    fh, fw = img.shape[:2]
     for (x, y, w, h) in rectangle:
-        final_img[y:y+h, x:x+w] = blur_img[y:y+h, x:x+w] #Overlay Blured Frame over Clear Frame on detected area
-        pass
+        px, py = int(w * padding / 2), int(h * padding / 2)
+        x0, y0 = max(x - px, 0), max(y - py, 0)
+        x1, y1 = min(x + w + px, fw), min(y + h + py, fh)
+        if x1 > x0 and y1 > y0:
+            with metrics.time("blur"):
+                blur_region(img, x0, y0, x1, y1, mode)
     
-    return final_img
+    return img
 
-# Check if camera opened successfully
-if (video.isOpened()== False):
-    print("Error opening video file")
+if __name__ == '__main__':
+    video = cv2.VideoCapture(videoPATH)
 
-vfps = video.get(cv2.CAP_PROP_FPS)
-vwidth = video.get(cv2.CAP_PROP_FRAME_WIDTH)
-vheight = video.get(cv2.CAP_PROP_FRAME_HEIGHT)
+    # Check if camera opened successfully
+    if (video.isOpened()== False):
+        print("Error opening video file")
 
-# Read until video is completed
-while(video.isOpened()):
-    
-    # Capture frame-by-frame
-    ret, frame = video.read()
-    if ret == True:
-        alterFrame = blur_face(frame) #Blur Current Frame
+    vfps = video.get(cv2.CAP_PROP_FPS)
+    vwidth = video.get(cv2.CAP_PROP_FRAME_WIDTH)
+    vheight = video.get(cv2.CAP_PROP_FRAME_HEIGHT)
+
+    # In temporal mode the tracker finds the faces in frame order, and the blurring runs on the workers
+    tracker = None
+    if TEMPORAL_MODE:
+        tracker = FaceTracker(detect_faces, interval=DETECT_INTERVAL, motion_threshold=MOTION_THRESHOLD)
+
+    # Read until video is completed
+    # Frames are decoded and blurred on background threads, and come back here in order
+    for alterFrame in process_frames(video, blur_face, PIPELINE_WORKERS, PIPELINE_QUEUE_DEPTH,
+                                     prepare=tracker.update if tracker else None):
         
         # Display the resulting frame
         cv2.imshow('Frame', alterFrame)
         
-    # Press Q on keyboard to exit
+        # Press Q on keyboard to exit
         if cv2.waitKey(25) & 0xFF == ord('q'):
             break
 
-# Break the loop
-    else:
-        break
+    cv2.destroyAllWindows()
+    video.release()
 
-cv2.destroyAllWindows()
-video.release()
+    if tracker:
+        print("Face tracking: " + tracker.report())
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Batch paragraph extraction over a directory (or glob) of scanned pages or multi-page TIFFs
+
+Pages are handed out to a pool of worker processes, at most a few per worker at a time so
+that thousands of pages never sit in the queue at once. Every worker writes the paragraph
+crops of its page to disk as soon as the page is done, so only the counts and timings come
+back to the main process. Nothing is plotted. The pages of a multi-page TIFF are handed out
+one by one too, and every worker decodes only its own page from the file (see page_source.py).
+
+Every page gets its own output folder, named by its path under the folder all the inputs
+share, so pages with the same file name in different folders don't overwrite each other.
+
+With --archive, the crops (or only the boxes, with --archive-refs) are sent back instead and
+written into one paragraph archive as the pages finish (see paragraph_archive.py).
+
+Usage: python batch_extract.py "Converted Paper (8)" --output "Extracted Paragraphs" --workers 8
+       python batch_extract.py "scans/*.png" --extractor main --report report.json
+       python batch_extract.py scans --archive paragraphs.zip --archive-compression 0
+       python batch_extract.py book.tif --workers 8
+"""
+import argparse
+import importlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import cv2
+from paragraph_archive import ParagraphArchiveWriter, ARCHIVE_COMPRESSION
+from page_source import list_pages, output_names, page_name, page_stem, read_page
+
+# Extractors that can be used, by their short name
+EXTRACTORS = {
+    "old_full": "paragraph_extract_old_full",
+    "main": "paragraph_extract_main",
+}
+EXTRACTOR = "old_full"
+OUTPUT_DIR = "Extracted Paragraphs"
+BATCH_WORKERS = os.cpu_count() or 1
+# Pages handed to the pool per worker before waiting for one to finish
+PAGES_PER_WORKER = 2
+
+
+# The paragraph crops of a (grayscale) page, whichever extractor is used
+# (paragraph_extract_old_full returns the column count with them)
+def _extract(module, gray):
+    result = module.extract_paragraphs(gray)
+    if isinstance(result, tuple):
+        return result[1]
+    return result
+
+
+# Worker processes already run one page each, so OpenCV's own threads would only compete with them
+def _init_worker():
+    cv2.setNumThreads(1)
+
+
+# Extracts one page and writes its paragraphs to output_dir/<output name>/ (nothing is written if output_dir is None)
+# page = image path or (path, page index) reference (see page_source.py)
+# output_name = the page's folder under output_dir, unique across the batch (see page_source.output_names),
+# the page stem if None
+# archive = "crops" or "boxes" returns them in the result instead, for the paragraph archive
+# Returns a small dict for the report
+def extract_page(page, extractor=EXTRACTOR, output_dir=OUTPUT_DIR, archive=None, output_name=None):
+    ref = page if isinstance(page, tuple) else (page, None)
+    result = {"page": page_name(ref), "paragraphs": 0, "seconds": 0.0, "error": None}
+    start = time.perf_counter()
+    try:
+        module = importlib.import_module(EXTRACTORS[extractor])
+        gray = read_page(ref)
+        if archive and hasattr(module, "find_page_layout"):
+            columns, boxes = module.find_page_layout(gray)
+            paragraphs = module.crop_paragraphs(gray, boxes)
+            result["columns"], result["boxes"] = len(columns), boxes
+        elif archive == "boxes":
+            raise ValueError(f"the {extractor} extractor has no paragraph boxes to archive")
+        else:
+            paragraphs = _extract(module, gray)
+        result["paragraphs"] = len(paragraphs)
+        if archive == "crops":
+            result["crops"] = paragraphs
+        elif output_dir and not archive:
+            output_sub = os.path.join(output_dir, output_name or page_stem(ref))
+            base = os.path.basename(output_sub)
+            os.makedirs(output_sub, exist_ok=True)
+            for i, para in enumerate(paragraphs):
+                cv2.imwrite(os.path.join(output_sub, f"{base}_paragraph_{i+1}.png"), para)
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+# Feeds the pages to the pool and collects the results as they finish (adding them to the archive, if any)
+def _run_pool(pages, extractor, output_dir, workers, mode, archive, results):
+    names = output_names([page if isinstance(page, tuple) else (page, None) for page in pages])
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        remaining = iter(pages)
+        pending = set()
+        refs = {}
+        while True:
+            # keep the pool fed, but only a few pages ahead of it
+            while len(pending) < workers * PAGES_PER_WORKER:
+                page = next(remaining, None)
+                if page is None:
+                    break
+                ref = page if isinstance(page, tuple) else (page, None)
+                job = pool.submit(extract_page, page, extractor, output_dir, mode, names[ref])
+                refs[job] = ref
+                pending.add(job)
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for job in done:
+                result = job.result()
+                crops = result.pop("crops", None)
+                if archive is not None and not result["error"]:
+                    archive.add_page(refs[job], result.get("boxes"), crops, result.get("columns"))
+                del refs[job]
+                results.append(result)
+                status = f"Error: {result['error']}" if result["error"] else f"{result['paragraphs']} paragraphs"
+                print(f" [{len(results)}/{len(pages)}] {os.path.basename(result['page'])}: {status} ({result['seconds']:.2f}s)")
+
+
+# Extracts all the pages in parallel, prints every page as it finishes and a summary at the end
+# pages = image paths or (path, page index) references, as given by page_source.list_pages
+# Returns the results of every page, in page order
+# archive_path = write everything into one paragraph archive instead of PNG files (archive_refs = boxes only)
+def run_batch(pages, extractor=EXTRACTOR, output_dir=OUTPUT_DIR, workers=BATCH_WORKERS, report_path=None,
+              archive_path=None, archive_compression=ARCHIVE_COMPRESSION, archive_refs=False):
+    print(f"{len(pages)} pages found")
+    results = []
+    archive = None
+    mode = None
+    if archive_path:
+        archive = ParagraphArchiveWriter(archive_path, archive_compression, store_crops=not archive_refs)
+        mode = "boxes" if archive_refs else "crops"
+    start = time.perf_counter()
+    try:
+        _run_pool(pages, extractor, output_dir, workers, mode, archive, results)
+    except BaseException:
+        if archive is not None:
+            archive.abort()
+        raise
+    if archive is not None:
+        archive.close()
+    total = time.perf_counter() - start
+
+    order = {page_name(page if isinstance(page, tuple) else (page, None)): i for i, page in enumerate(pages)}
+    results.sort(key=lambda r: order[r["page"]])
+    failed = sum(1 for result in results if result["error"])
+    paragraphs = sum(result["paragraphs"] for result in results)
+    print("\n Summary")
+    for result in results:
+        status = "FAILED" if result["error"] else f"{result['paragraphs']} paragraphs"
+        print(f" {result['page']}: {status} in {result['seconds']:.2f}s")
+    print(f" Total: {len(results)} pages ({failed} failed), {paragraphs} paragraphs in {total:.1f}s "
+          f"({len(results) / total if total > 0 else 0:.1f} pages/s)")
+
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump({"extractor": extractor, "seconds": total, "pages": results}, f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Extract the paragraphs of many scanned pages in parallel")
+    parser.add_argument("inputs", nargs="+", help="directories or glob patterns of page images or multi-page TIFFs")
+    parser.add_argument("--output", default=OUTPUT_DIR, help="folder for the paragraph images")
+    parser.add_argument("--no-save", action="store_true", help="only count the paragraphs, write no images")
+    parser.add_argument("--extractor", choices=sorted(EXTRACTORS), default=EXTRACTOR)
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--report", help="write the per-page counts and timings to this JSON file")
+    parser.add_argument("--archive", help="write all the paragraphs into this one archive file instead of PNG files")
+    parser.add_argument("--archive-compression", type=int, default=ARCHIVE_COMPRESSION, help="deflate level 0-9 (0 = none)")
+    parser.add_argument("--archive-refs", action="store_true", help="only keep the boxes, crops are cut from the source pages when read")
+    args = parser.parse_args()
+
+    run_batch(list_pages(args.inputs), args.extractor, None if args.no_save else args.output,
+              args.workers, args.report, args.archive, args.archive_compression, args.archive_refs)
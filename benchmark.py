@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Throughput benchmarks for the video and document stages
+
+Generates synthetic test videos (moving face-like patches, dark and bright scenes) at a
+few resolutions and synthetic multi-column pages, times every stage on them and writes the
+results as JSON (fps for video stages, ms per page / per call for the rest). Given the JSON
+of an earlier run, it also reports every stage that got slower than the threshold and exits
+with status 1, so runs can be compared over time.
+
+Usage: python benchmark.py --output bench.json [--baseline old_bench.json --threshold 0.15]
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+from synthetic_data import make_frames, make_video, make_page
+from script_loader import load_script
+from face_tracking import FaceTracker
+from watermark_compositor import build_layer, blend_layer
+from pip_compositor import PipLayer, PipCompositor, rounded_mask
+
+RESOLUTIONS = [(640, 360), (1280, 720), (1920, 1080)]
+FRAMES = 60
+PAGES = 4
+REPEATS = 3
+THRESHOLD = 0.15
+
+
+# Median wall time of run() over the repeats, setup() (untimed) gives its argument for every repeat
+def _time(run, setup=lambda: None, repeats=REPEATS):
+    times = []
+    for _ in range(repeats):
+        arg = setup()
+        start = time.perf_counter()
+        run(arg)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+# Frames per second of transform over the frames (every repeat works on fresh copies, for in place transforms)
+def _fps(transform, frames, repeats):
+    def run(copies):
+        for frame in copies:
+            transform(frame)
+    seconds = _time(run, lambda: [frame.copy() for frame in frames], repeats)
+    return {"fps": len(frames) / seconds if seconds > 0 else float("inf")}
+
+
+# Cascade file for the face detector: OpenCV's own copy if it has one, otherwise the blur script's
+def _cascade_path():
+    data = getattr(cv2, "data", None)
+    if data is not None:
+        path = os.path.join(data.haarcascades, "haarcascade_frontalface_default.xml")
+        if os.path.exists(path):
+            return path
+    return load_script("blur").cascadePATH
+
+
+# Watermark like the ones the watermark script makes: a BGR + alpha image with text-like marks
+def _make_watermark(size, corner):
+    width, height = size
+    wm = np.zeros((height, width, 4), np.uint8)
+    x = 20 if corner == 0 else width - width // 4 - 20
+    y = height - height // 10 - 20
+    cv2.putText(wm, "WATERMARK", (x, y), cv2.FONT_HERSHEY_SIMPLEX, width / 1200, (255, 255, 255, 255), 2)
+    return wm
+
+
+def bench_video(results, workdir, size, frames_count, repeats):
+    tag = f"{size[0]}x{size[1]}"
+    dark_frames = list(make_frames(size, frames_count, dark=True, seed=1))
+    bright_frames = list(make_frames(size, frames_count, dark=False, seed=2))
+
+    # face blurring, every frame detected vs detect-every-N with tracking
+    blur = load_script("blur")
+    blur.cascadePATH = _cascade_path()
+    results[f"blur_face/{tag}"] = _fps(blur.blur_face, bright_frames, repeats)
+
+    def tracked(copies):
+        tracker = FaceTracker(blur.detect_faces)
+        for frame in copies:
+            blur.blur_face(frame, tracker.update(frame))
+    seconds = _time(tracked, lambda: [frame.copy() for frame in bright_frames], repeats)
+    results[f"blur_face_tracked/{tag}"] = {"fps": len(bright_frames) / seconds}
+
+    # brightness
+    brightness = load_script("brightness")
+    results[f"adjust_brightness/{tag}"] = _fps(
+        lambda frame: brightness.adjust_brightness(frame, brightness.contrast, brightness.brightness),
+        dark_frames, repeats)
+
+    def adaptive(copies):
+        corrector = brightness.AdaptiveBrightness(brightness.day_threshold)
+        for frame in copies:
+            brightness.apply_lut(frame, corrector.update(frame))
+    seconds = _time(adaptive, lambda: [frame.copy() for frame in dark_frames], repeats)
+    results[f"adjust_brightness_adaptive/{tag}"] = {"fps": len(dark_frames) / seconds}
+
+    video_path = make_video(os.path.join(workdir, f"dark_{tag}.mp4"), size, frames_count, dark=True, seed=1)
+    seconds = _time(lambda _: brightness.is_nighttime(video_path, brightness.vid_sample_frames,
+                                                      brightness.day_threshold), repeats=repeats)
+    results[f"is_nighttime/{tag}"] = {"ms": seconds * 1000}
+
+    # watermarks, both blended as one precomposited layer
+    layer = build_layer([_make_watermark(size, 0), _make_watermark(size, 1)])
+    results[f"blend_layer/{tag}"] = _fps(lambda frame: blend_layer(frame, layer), bright_frames, repeats)
+
+    # picture in picture
+    overlay = load_script("overlay")
+    small = [cv2.resize(frame, (overlay.overlay_width, overlay.overlay_height)) for frame in dark_frames]
+    index = [0]
+    def paste(frame):
+        overlay.paste_overlay(frame, small[index[0] % len(small)])
+        index[0] += 1
+    results[f"pip_composite/{tag}"] = _fps(paste, bright_frames, repeats)
+
+    # three overlays: the looped vid with rounded corners, a see-through logo and a ticker along the bottom
+    width, height = size
+    clip_size = (overlay.overlay_width, overlay.overlay_height)
+    ticker_height = height // 12
+    compositor = PipCompositor([
+        PipLayer(overlay.OverlayLoop(video_path, clip_size), (20, 20, *clip_size), mask=rounded_mask(clip_size, 16)),
+        PipLayer(_make_watermark((160, 80), 0), (width - 180, 20, 160, 80), opacity=0.8, z=1),
+        PipLayer(np.full((ticker_height, width, 3), 40, np.uint8), (0, height - ticker_height, width, ticker_height), opacity=0.7),
+    ], size)
+    results[f"pip_layers/{tag}"] = _fps(lambda frame: compositor.composite(frame, compositor.prepare()), bright_frames, repeats)
+    compositor.release()
+
+
+# Runs extract_paragraphs of the given module over the pages, in ms per page
+def _bench_extractor(module_name, page_paths, repeats):
+    try:
+        module = importlib.import_module(module_name)
+    except ImportError as e:
+        return {"skipped": str(e)}
+    def run(_):
+        for path in page_paths:
+            module.extract_paragraphs(path)
+    seconds = _time(run, repeats=repeats)
+    return {"ms_per_page": seconds * 1000 / len(page_paths)}
+
+
+def bench_pages(results, workdir, pages, repeats):
+    page_paths = []
+    for i in range(pages):
+        page, _ = make_page(columns=1 + i % 3, seed=100 + i)
+        path = os.path.join(workdir, f"page_{i:03d}.png")
+        cv2.imwrite(path, page)
+        page_paths.append(path)
+
+    results["extract_paragraphs/paragraph_extract_main"] = _bench_extractor("paragraph_extract_main", page_paths, repeats)
+    results["extract_paragraphs/paragraph_extract_old_full"] = _bench_extractor("paragraph_extract_old_full", page_paths, repeats)
+
+
+# Runs all the benchmarks and returns the results with some information about the machine
+def run_benchmarks(resolutions=RESOLUTIONS, frames=FRAMES, pages=PAGES, repeats=REPEATS):
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+        for size in resolutions:
+            bench_video(results, workdir, size, frames, repeats)
+        bench_pages(results, workdir, pages, repeats)
+
+    meta = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "frames": frames,
+        "pages": pages,
+        "repeats": repeats,
+    }
+    return {"meta": meta, "results": results}
+
+
+# Compares results against a baseline run, returns the stages that got slower by more than threshold
+# (fps going down, or ms going up)
+def find_regressions(results, baseline, threshold=THRESHOLD):
+    regressions = []
+    for name, now in results["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before:
+            continue
+        for key, higher_is_better in (("fps", True), ("ms", False), ("ms_per_page", False)):
+            if key not in now or key not in before or not before[key]:
+                continue
+            change = (now[key] - before[key]) / before[key]
+            if (-change if higher_is_better else change) > threshold:
+                regressions.append((name, key, before[key], now[key], change))
+    return regressions
+
+
+def _parse_resolution(text):
+    width, height = text.lower().split("x")
+    return (int(width), int(height))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the video and document stages on synthetic data")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed slowdown before it counts as a regression (0.15 = 15%%)")
+    parser.add_argument("--resolutions", default=",".join(f"{w}x{h}" for w, h in RESOLUTIONS))
+    parser.add_argument("--frames", type=int, default=FRAMES)
+    parser.add_argument("--pages", type=int, default=PAGES)
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    args = parser.parse_args()
+
+    report = run_benchmarks([_parse_resolution(r) for r in args.resolutions.split(",")],
+                            args.frames, args.pages, args.repeats)
+    for name, values in report["results"].items():
+        print(f"{name:55s} " + ", ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}" for k, v in values.items()))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = find_regressions(report, baseline, args.threshold)
+        for name, key, before, now, change in regressions:
+            print(f"REGRESSION {name}: {key} {before:.2f} -> {now:.2f} ({change:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions over {args.threshold:.0%}")
@@ -1,6 +1,11 @@
 ''' Importing from library '''
 import cv2
 import numpy as np
+from collections import deque
+from functools import lru_cache
+from frame_pipeline import run_pipeline
+from frame_cache import open_capture
+from instrumentation import metrics
 
 ''' Variables '''
 
@@ -19,8 +24,96 @@ brightness = 50
 vid_sample_frames = 30
 day_threshold = 100
 
+# amount of worker threads and max frames in flight for the decode -> brighten -> encode pipeline
+# (None = use the defaults from frame_pipeline)
+pipeline_workers = None
+pipeline_queue_depth = None
+
+# values for the faster night detection
+# frames are shrunk to this width before measuring their brightness
+luma_sample_width = 160
+# stop sampling early once at least min_samples are taken and the average brightness is
+# more than confidence_z standard errors above or below the daytime threshold
+min_samples = 5
+confidence_z = 3.0
+# sample frames at most this many frames apart are reached by grabbing the frames in between
+# (no colour conversion, no seeking back to a keyframe), further apart ones by seeking
+max_grab_stride = 120
+# single pass: decide day or night from the first single_pass_frames frames while they are decoded,
+# and reuse those frames for the brightened video instead of opening and decoding the video twice
+# (faster, but only the start of the video is looked at, so a video that gets darker or brighter
+# later on can be judged differently than by sampling the whole video)
+single_pass = False
+single_pass_frames = 60
+
+# adaptive mode: correct every video scene by scene (also mixed day/night videos) instead of
+# brightening whole night videos by a fixed amount
+adaptive = False
+# amount of recent frames whose brightness histograms are combined to measure the scene brightness
+adaptive_window = 15
+# the correction is only recalculated when the scene brightness moved this much (0-255) since the last time
+adaptive_shift = 8.0
+# scene brightness the correction aims for, and the max gain allowed to get there
+adaptive_target = 110.0
+adaptive_max_gain = 2.0
+# only correct the brightness (Y) channel instead of all three colour channels, keeps the colours from washing out
+adaptive_luma_only = False
+
+# decode the video once into a raw frame file (see frame_cache.py), and read the night check
+# and the brightening (and later runs with other settings) from it instead of decoding the video every time
+use_frame_cache = False
+
 ''' Functions '''
 
+# Opens the video, from the frame cache if it is used
+def open_video(video_path):
+    if use_frame_cache:
+        return open_capture(video_path)
+    return cv2.VideoCapture(video_path)
+
+# Mean brightness (grayscale value) of a frame, measured on a shrunk copy of it
+# the grayscale mean is the weighted mean of the colour channels, so there is no need to convert the frame
+def frame_luma(frame):
+    height, width = frame.shape[:2]
+    if width > luma_sample_width:
+        small_height = max(1, height * luma_sample_width // width)
+        frame = cv2.resize(frame, (luma_sample_width, small_height), interpolation=cv2.INTER_NEAREST)
+    b, g, r, _ = cv2.mean(frame)
+    return 0.114 * b + 0.587 * g + 0.299 * r
+
+# Checks if the brightness samples so far are enough to tell if the video is day or night
+# (the mean is clearly above or below the threshold compared to how much the samples vary)
+def is_confident(samples, daytime_threshold) -> bool:
+    if len(samples) < min_samples:
+        return False
+    mean = np.mean(samples)
+    standard_error = np.std(samples, ddof=1) / np.sqrt(len(samples))
+    return abs(mean - daytime_threshold) > confidence_z * standard_error
+
+# Order to take count samples in, one level of detail at a time (0, then 1/2, then 1/4 and 3/4, then
+# 1/8, 3/8, 5/8 and 7/8, ... of the way through the video), so the samples taken so far are always spread
+# over the whole video and stopping early still looks at all of it
+# Every level goes forward through the video, so only its first sample seeks back and the rest are
+# grabbed to when they are close enough (about one seek per level instead of one per sample)
+def spread_order(count):
+    bits = max(1, (count - 1).bit_length())
+    # level of sample i: how many times the video has to be halved before i is on a boundary
+    def level(i):
+        return 0 if i == 0 else bits - ((i & -i).bit_length() - 1)
+    return sorted(range(count), key=lambda i: (level(i), i))
+
+# Moves the video from frame position to frame target, grabbing the frames in between if they are close
+# enough or seeking if they are not (or if the target is behind). Returns if it worked and the new position
+def skip_to_frame(vid, position, target):
+    if target < position or target - position > max_grab_stride:
+        vid.set(cv2.CAP_PROP_POS_FRAMES, target)
+        return True, target
+    while position < target:
+        if not vid.grab():
+            return False, position
+        position += 1
+    return True, position
+
 # Detect if the video is taken during nighttime
 # Parameters: video_path = filepath to video, 
 # sample_frames = select few amount of frames needed to check if the video is nighttime or not,
@@ -28,50 +121,166 @@ day_threshold = 100
 def is_nighttime(video_path, sample_frames, daytime_threshold) -> bool:
     
     # Opening video file for reading
-    vid = cv2.VideoCapture(video_path)
-    # adding up the sum of mean pixel intensity value in the frame
-    brightness_sum = 0
-    # counts the amount of valid frames after processing it
-    frame_count = 0
-    # the number that determines the next frame to be used as a sample frame
-    # Getting the total frames in the video and floor divide the amount of sample frames needed
-    next_frame_period = int(vid.get(cv2.CAP_PROP_FRAME_COUNT) // sample_frames)
-    
-    #Loop through each sample frame
-    while frame_count < sample_frames:
-        # Skipping to a specific frame to be used as a sample frame
-        vid.set(cv2.CAP_PROP_POS_FRAMES, frame_count * next_frame_period)
-        # Extracting the frame and determining if the frame is valid
+    vid = open_video(video_path)
+    # mean brightness of every sample frame
+    samples = []
+    try:
+        # position of the next frame the video will give
+        position = 0
+        # the number that determines the next frame to be used as a sample frame
+        # Getting the total frames in the video and floor divide the amount of sample frames needed
+        next_frame_period = max(1, int(vid.get(cv2.CAP_PROP_FRAME_COUNT) // sample_frames))
+        
+        #Loop through each sample frame, in spread order so stopping early still covers the whole video
+        for sample in spread_order(sample_frames):
+            # Skipping to a specific frame to be used as a sample frame
+            valid_frame, position = skip_to_frame(vid, position, sample * next_frame_period)
+            if not valid_frame:
+                continue
+            # Extracting the frame and determining if the frame is valid
+            valid_frame, frame = vid.read()
+            if not valid_frame:
+                continue
+            position += 1
+            # Calculate the mean pixel intensity value of the frame
+            samples.append(frame_luma(frame))
+            # stop early if it is already clear whether it is day or night
+            if is_confident(samples, daytime_threshold):
+                break
+    finally:
+        # close the videocapture
+        vid.release()
+    
+    # if there are no samples, then all frames extracted were not valid, therefore the video has an issue
+    # also prevents 0 division when we calculate the average brightness
+    if not samples:
+        raise ValueError("No frames were successfully read. Error can occur due to receiving a corrupt video file, incorrect file path or the video format/codec is unsupported.")
+    
+    # if average brightness is less than the threshold that determines it to be daytime, return true for nighttime
+    # else return false since it is daytime
+    return np.mean(samples) < daytime_threshold
+
+# Detect if the video is taken during nighttime from its first frames, keeping the decoded frames
+# Parameters: vid = opened videocapture at the start of the video, sample_frames = max amount of sample frames,
+# daytime_threshold = variable to constitute what is considered daytime,
+# max_frames = max amount of frames to decode (and keep) before deciding
+# Returns if it is nighttime and the frames decoded so far, in order
+def is_nighttime_from_start(vid, sample_frames, daytime_threshold, max_frames):
+    decoded = []
+    samples = []
+    # sample every few frames so the samples are spread over the frames that will be decoded
+    period = max(1, max_frames // sample_frames)
+    
+    while len(decoded) < max_frames:
         valid_frame, frame = vid.read()
         if not valid_frame:
             break
-        # Change the color frame into grayscale frame
-        grayscale_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        # Calculate the mean amount of pixel intensity value and adding it to the sum of all means
-        brightness_sum += np.mean(grayscale_frame)
-        # increment by 1 to confirm that the current frame has been processed
-        frame_count += 1
-    
-    # close the videocapture
-    vid.release()
+        decoded.append(frame)
+        if (len(decoded) - 1) % period == 0:
+            samples.append(frame_luma(frame))
+            if len(samples) >= sample_frames or is_confident(samples, daytime_threshold):
+                break
     
-    # if frame_count is 0, then all frames extracted were not valid, therefore the video has an issue
-    # also prevents 0 division when we calculate the average brightness
-    if frame_count == 0:
+    if not samples:
         raise ValueError("No frames were successfully read. Error can occur due to receiving a corrupt video file, incorrect file path or the video format/codec is unsupported.")
     
-    # Getting the average brightness by dividing the total sum of average grayscale pixels and the amount of sample frames used
-    avg_brightness = brightness_sum / frame_count
+    return np.mean(samples) < daytime_threshold, decoded
+
+# Gives back the frames that were already decoded first, then continues reading the video
+# (works like a videocapture for the pipeline)
+class ReplayCapture:
+    def __init__(self, decoded, vid):
+        self.decoded = deque(decoded)
+        self.vid = vid
     
-    # if average brightness is less than the threshold that determines it to be daytime, return true for nighttime
-    # else return false since it is daytime
-    return avg_brightness < daytime_threshold
+    def read(self):
+        if self.decoded:
+            return True, self.decoded.popleft()
+        return self.vid.read()
     
 
+# Lookup table that gives the same result as cv2.convertScaleAbs(alpha=contrast, beta=brightness)
+# for every possible pixel value, so brightening a frame is only a table lookup per pixel
+@lru_cache(maxsize=None)
+def brightness_lut(contrast, brightness):
+    values = np.abs(np.arange(256) * contrast + brightness)
+    return np.clip(np.rint(values), 0, 255).astype(np.uint8)
+
 # Adjust the brightness accordingly
 # Parameter: frame = current frame of the video
 def adjust_brightness(frame, contrast, brightness):
-    return cv2.convertScaleAbs(frame, alpha=contrast, beta=brightness)
+    return cv2.LUT(frame, brightness_lut(contrast, brightness))
+
+# Applies a 256 entry lookup table to the frame, in place
+# Parameter: luma_only = only apply it to the brightness (Y) channel
+def apply_lut(frame, lut, luma_only=False):
+    with metrics.time("brighten"):
+        if not luma_only:
+            return cv2.LUT(frame, lut, dst=frame)
+        ycrcb = cv2.cvtColor(frame, cv2.COLOR_BGR2YCrCb)
+        ycrcb[:, :, 0] = cv2.LUT(ycrcb[:, :, 0], lut)
+        return cv2.cvtColor(ycrcb, cv2.COLOR_YCrCb2BGR, dst=frame)
+
+# Keeps track of how bright the current scene is, from the brightness histograms of the last few frames,
+# and makes a new gain/gamma lookup table whenever the scene brightness changes
+# Frames have to be given to update() in order
+class AdaptiveBrightness:
+    def __init__(self, daytime_threshold, window=None, shift=None, target=None, max_gain=None):
+        self.daytime_threshold = daytime_threshold
+        self.window = window or adaptive_window
+        self.shift = adaptive_shift if shift is None else shift
+        self.target = target or adaptive_target
+        self.max_gain = max_gain or adaptive_max_gain
+        
+        # histograms of the recent frames and their running total
+        self.histograms = deque()
+        self.total = np.zeros(256, np.float64)
+        # scene brightness the current lookup table was made for
+        self.lut_brightness = None
+        self.lut = np.arange(256, dtype=np.uint8)
+        # amount of times the lookup table was recalculated
+        self.updates = 0
+    
+    # Brightness histogram of a shrunk grayscale copy of the frame
+    def frame_histogram(self, frame):
+        height, width = frame.shape[:2]
+        if width > luma_sample_width:
+            frame = cv2.resize(frame, (luma_sample_width, max(1, height * luma_sample_width // width)),
+                               interpolation=cv2.INTER_NEAREST)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel().astype(np.float64)
+    
+    # Makes the lookup table for a scene with this histogram
+    # bright scenes are left as they are, dark ones get a gain (so the brightest 1% of pixels reach white,
+    # capped at max_gain) and then a gamma curve that moves the mean brightness towards the target
+    def make_lut(self, histogram, brightness):
+        values = np.arange(256, dtype=np.float64)
+        if brightness >= self.daytime_threshold:
+            return values.astype(np.uint8)
+        
+        cumulative = np.cumsum(histogram) / histogram.sum()
+        top = max(float(np.searchsorted(cumulative, 0.99)), 1.0)
+        gain = min(255.0 / top, self.max_gain)
+        
+        scaled = np.clip(values * gain / 255.0, 0, 1)
+        mean = np.clip(brightness * gain / 255.0, 1e-3, 0.999)
+        gamma = np.clip(np.log(self.target / 255.0) / np.log(mean), 0.3, 1.0)
+        return np.clip(np.rint(255.0 * scaled ** gamma), 0, 255).astype(np.uint8)
+    
+    # Adds the frame to the rolling histogram and returns the lookup table to use for it
+    def update(self, frame):
+        histogram = self.frame_histogram(frame)
+        self.histograms.append(histogram)
+        self.total += histogram
+        if len(self.histograms) > self.window:
+            self.total -= self.histograms.popleft()
+        
+        brightness = float(np.dot(self.total, np.arange(256)) / self.total.sum())
+        if self.lut_brightness is None or abs(brightness - self.lut_brightness) > self.shift:
+            self.lut = self.make_lut(self.total, brightness)
+            self.lut_brightness = brightness
+            self.updates += 1
+        return self.lut
 
 # Determines whether the video was taken during day or night
 # (Brightens the video if it is taken during night and export the updated video)
@@ -80,21 +289,44 @@ def adjust_brightness(frame, contrast, brightness):
 # threshold = determines the threshold for what is considered daytime
 def determine_video(vid_path, export_path, sample_amount, threshold, contrast_val, brightness_val):
     
+    # frames that were already decoded while checking for nighttime
+    decoded = []
+    
     # Determining if the video is considered taken during nighttime
-    is_night : bool = is_nighttime(vid_path, sample_amount, threshold)
+    # (in adaptive mode every video is corrected scene by scene, so there is nothing to decide up front)
+    if adaptive:
+        is_night = True
+        vid = open_video(vid_path)
+    elif single_pass:
+        # Opening the video file once, the frames used for checking are reused for the new video
+        vid = open_video(vid_path)
+        try:
+            is_night, decoded = is_nighttime_from_start(vid, sample_amount, threshold, single_pass_frames)
+        except BaseException:
+            vid.release()
+            raise
+    else:
+        is_night : bool = is_nighttime(vid_path, sample_amount, threshold)
     
     # If the video was not taken during nighttime
     if not is_night:
+        if single_pass:
+            vid.release()
+        metrics.count("videos_skipped")
         print("The video was recorded at daytime.")
         return # return statement to stop the function from continuing
     
     # If the video was taken during nighttime
-    print("The video was recorded at nighttime.\nAdjusting video brightness, please wait a moment...")
+    if adaptive:
+        print("Adjusting video brightness scene by scene, please wait a moment...")
+    else:
+        print("The video was recorded at nighttime.\nAdjusting video brightness, please wait a moment...")
     
     # --- Generating new video and brightening it up ---
     
     # Opening the video file for accessing
-    vid = cv2.VideoCapture(vid_path)
+    if not (adaptive or single_pass):
+        vid = open_video(vid_path)
     # Getting the video's frames per second
     fps = vid.get(cv2.CAP_PROP_FPS)
     # Getting the video's width
@@ -106,16 +338,20 @@ def determine_video(vid_path, export_path, sample_amount, threshold, contrast_va
     # instancing cv2's videowriter used to merge all frames back into a video file
     vw = cv2.VideoWriter(export_path, video_codec, fps, (width,height))
     
-    # Loop to go through the entire video
-    while True:
-        # extracting a frame from the video, as well as determining if the frame is a valid frame
-        valid_frame, frame = vid.read()
-        if not valid_frame:
-            break
-        # if the frame is valid, alter it by adjusting the brightness of that frame
-        alt_frame = adjust_brightness(frame, contrast_val, brightness_val)
-        # giving the frame to the videowriter which will stitch all the frame together to form a video
-        vw.write(alt_frame)
+    # Go through the entire video
+    # frames are extracted on one thread, brightened on a pool of worker threads,
+    # and given back to the videowriter in their original order on another thread
+    # in adaptive mode the scene brightness is tracked in frame order, and the lookup table it gives is
+    # applied on the worker threads
+    if adaptive:
+        corrector = AdaptiveBrightness(threshold)
+        transform = lambda frame, lut: apply_lut(frame, lut, adaptive_luma_only)
+        prepare = corrector.update
+    else:
+        lut = brightness_lut(contrast_val, brightness_val)
+        transform = lambda frame: apply_lut(frame, lut)
+        prepare = None
+    run_pipeline(ReplayCapture(decoded, vid), vw, transform, pipeline_workers, pipeline_queue_depth, prepare=prepare)
     
     # Close the videocapture and videowriter
     vid.release()
@@ -124,4 +360,5 @@ def determine_video(vid_path, export_path, sample_amount, threshold, contrast_va
     print(f"New adjusted video is saved to filepath: {export_path}")
 
 ''' Start Program '''
-determine_video(vid_path, exp_path, vid_sample_frames, day_threshold, contrast, brightness)
\ No newline at end of file
+if __name__ == '__main__':
+    determine_video(vid_path, exp_path, vid_sample_frames, day_threshold, contrast, brightness)
\ No newline at end of file
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Single-pass multi-effect video rendering
+
+Runs face blurring, brightness correction, the talking-head overlay, the watermarks and the
+endscreen as stages of one decode -> process -> encode pass, instead of decoding and
+re-encoding the footage once per script. The stages are listed in a JSON config file
+(see effects_example.json) and run in the order they are listed.
+
+Every stage edits the same decoded frame in place, so no stage copies the frame. Stages
+that need to see the frames in order (face tracking, adaptive brightness, picking the
+overlay frame) do that part in the pipeline's prepare step. A prepare step sees the frame
+as the stages before it left it: the stages listed before the last one that looks at the
+frame in its prepare step run on the decoder thread, in frame order, and the rest run on
+the worker threads. Listing the stages with such a prepare step first keeps the most work
+on the workers.
+
+Usage: python effect_graph.py config.json
+"""
+import argparse
+import json
+import cv2
+import numpy as np
+from frame_pipeline import run_pipeline
+from frame_cache import open_capture
+from face_tracking import FaceTracker
+from watermark_compositor import build_layer, blend_layer
+from endscreen_cache import load_endscreen
+from script_loader import load_script
+
+
+# Basic information about the video being rendered
+class VideoInfo:
+    def __init__(self, path, width, height, fps, frame_count):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frame_count = frame_count
+
+    @property
+    def size(self):
+        return (self.width, self.height)
+
+
+# A stage of the graph
+# prepare(frame) runs on every frame in order (optional), apply(frame, prepared) edits the frame in place
+# on a worker thread, and tail() gives extra frames to write after the video (eg. the endscreen)
+# skip(count) is called when rendering starts count frames into the video (see segment_render.py)
+# prepare_reads_frame = False for a prepare step that doesn't look at the frame (it then doesn't
+# need the stages before it to have run)
+class Stage:
+    prepare = None
+    prepare_reads_frame = True
+
+    def __init__(self, config, info):
+        self.config = config
+        self.info = info
+
+    def skip(self, count):
+        pass
+
+    def apply(self, frame, prepared):
+        return frame
+
+    def tail(self):
+        return []
+
+
+# Face blurring from "DIP Assignment Blur Faces.py"
+# options: mode ("box", "mosaic", "pyramid"), padding, detect_scale, temporal, interval, motion_threshold, cascade
+class BlurStage(Stage):
+    def __init__(self, config, info):
+        super().__init__(config, info)
+        self.blur = load_script("blur")
+        # settings of this stage only, the script's own settings are left alone
+        self.mode = config.get("mode", self.blur.BLUR_MODE)
+        self.padding = config.get("padding", self.blur.BLUR_PADDING)
+        self.scale = config.get("detect_scale", self.blur.DETECT_SCALE)
+        self.cascade = config.get("cascade", self.blur.cascadePATH)
+
+        self.tracker = None
+        if config.get("temporal", self.blur.TEMPORAL_MODE):
+            self.tracker = FaceTracker(self.detect_faces,
+                                       interval=config.get("interval", self.blur.DETECT_INTERVAL),
+                                       motion_threshold=config.get("motion_threshold", self.blur.MOTION_THRESHOLD))
+            self.prepare = self.tracker.update
+
+    def detect_faces(self, frame):
+        return self.blur.detect_faces(frame, self.scale, self.cascade)
+
+    def apply(self, frame, prepared):
+        return self.blur.blur_face(frame, prepared, self.mode, self.padding, self.scale, self.cascade)
+
+
+# Brightness correction from brightness_manipulation.py
+# options: adaptive, luma_only, contrast, brightness, threshold,
+# night_only (only brighten if the whole video is judged to be at night, like determine_video)
+class BrightnessStage(Stage):
+    def __init__(self, config, info):
+        super().__init__(config, info)
+        self.brightness = load_script("brightness")
+        b = self.brightness
+        threshold = config.get("threshold", b.day_threshold)
+        self.luma_only = config.get("luma_only", b.adaptive_luma_only)
+
+        # is_night = the answer worked out beforehand (eg. once for all the segments, see segment_render.py)
+        self.enabled = True
+        if config.get("night_only", False):
+            self.enabled = config.get("is_night")
+            if self.enabled is None:
+                self.enabled = b.is_nighttime(info.path, config.get("sample_frames", b.vid_sample_frames), threshold)
+
+        self.lut = None
+        if config.get("adaptive", b.adaptive):
+            self.corrector = b.AdaptiveBrightness(threshold)
+            self.prepare = self.corrector.update
+        else:
+            self.lut = b.brightness_lut(config.get("contrast", b.contrast), config.get("brightness", b.brightness))
+
+    def apply(self, frame, prepared):
+        if not self.enabled:
+            return frame
+        lut = self.lut if self.lut is not None else prepared
+        return self.brightness.apply_lut(frame, lut, self.luma_only)
+
+
+# Talking-head and other overlays from overlay_talkingvid.py
+# options: overlay (path), x, y, width, height for one overlay,
+# or layers (list of overlays like overlay_talkingvid.overlays: source, x, y, width, height, opacity, radius, z)
+class PipStage(Stage):
+    # the prepare step only moves the overlay clips on
+    prepare_reads_frame = False
+
+    def __init__(self, config, info):
+        super().__init__(config, info)
+        overlay = load_script("overlay")
+        layers = config.get("layers")
+        if layers is None:
+            layers = [{key: config[key] for key in ("x", "y", "width", "height") if key in config}]
+            layers[0]["source"] = config["overlay"]
+        self.compositor = overlay.build_compositor(layers, info.size)
+        self.prepare = self.compositor.prepare
+
+    def skip(self, count):
+        self.compositor.skip(count)
+
+    def apply(self, frame, prepared):
+        return self.compositor.composite(frame, prepared)
+
+
+# Watermarks from "Watermark and Endscreen", merged into one layer
+# options: images (list of paths, drawn in order)
+class WatermarkStage(Stage):
+    def __init__(self, config, info):
+        super().__init__(config, info)
+        watermark = load_script("watermark")
+        images = config.get("images", [watermark.WATERMARK1_PATH, watermark.WATERMARK2_PATH])
+        self.layer = build_layer([watermark.remove_black_background(path, info.size) for path in images])
+
+    def apply(self, frame, prepared):
+        return blend_layer(frame, self.layer)
+
+
+# Endscreen appended after the video, resized to it
+# options: path
+class EndscreenStage(Stage):
+    def tail(self):
+        path = self.config.get("path") or load_script("watermark").ENDSCREEN_PATH
+        return load_endscreen(path, self.info.size, self.info.fps)
+
+
+STAGES = {
+    "blur": BlurStage,
+    "brightness": BrightnessStage,
+    "pip": PipStage,
+    "watermark": WatermarkStage,
+    "endscreen": EndscreenStage,
+}
+
+
+# Makes the stage objects from the config's list of stages
+def build_stages(stage_configs, info):
+    stages = []
+    for config in stage_configs:
+        kind = config.get("type")
+        if kind not in STAGES:
+            raise ValueError(f"Unknown stage type: {kind!r} (expected one of {', '.join(STAGES)})")
+        stages.append(STAGES[kind](config, info))
+    return stages
+
+
+# Splits the stages into the ones run in order on the decoder thread and the ones run on the workers:
+# every stage before the last one whose prepare step looks at the frame has to run before that step
+def _split(stages):
+    last = max((i for i, stage in enumerate(stages) if stage.prepare is not None and stage.prepare_reads_frame),
+               default=0)
+    return stages[:last], stages[last:]
+
+
+# Runs the stages that have to run in order, then the prepare step of every other stage that has one
+# Returns the frame so far and the prepared states, given to the function from _apply_all
+def _prepare_all(stages):
+    ordered, parallel = _split(stages)
+
+    def prepare(frame):
+        for stage in ordered:
+            frame = stage.apply(frame, stage.prepare(frame) if stage.prepare is not None else None)
+        return frame, [stage.prepare(frame) if stage.prepare is not None else None for stage in parallel]
+    return prepare
+
+
+# Runs the rest of the stages on the frame from _prepare_all, all editing the same frame in place
+def _apply_all(stages):
+    parallel = _split(stages)[1]
+
+    def apply(frame, prepared):
+        frame, states = prepared
+        for stage, state in zip(parallel, states):
+            frame = stage.apply(frame, state)
+        return frame
+    return apply
+
+
+# Renders input_path to output_path through the stages, in a single decode/encode pass
+# frame_cache = read the input from the frame cache (see frame_cache.py), so rendering the same input
+# again (eg. with other stage settings) doesn't decode it again
+# Returns the amount of frames written
+def render(input_path, output_path, stage_configs, workers=None, queue_depth=None, codec="mp4v", frame_cache=False):
+    cap = open_capture(input_path) if frame_cache else cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Could not open video: {input_path}")
+
+    info = VideoInfo(input_path,
+                     int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                     int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                     cap.get(cv2.CAP_PROP_FPS),
+                     int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    stages = build_stages(stage_configs, info)
+
+    out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*codec), info.fps, info.size)
+    try:
+        count = run_pipeline(cap, out, _apply_all(stages), workers, queue_depth, prepare=_prepare_all(stages))
+        for stage in stages:
+            for frame in stage.tail():
+                out.write(np.asarray(frame))
+                count += 1
+    finally:
+        cap.release()
+        out.release()
+    return count
+
+
+# Loads a config file and renders it
+def render_config(config_path):
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    return render(config["input"], config["output"], config.get("stages", []),
+                  config.get("workers"), config.get("queue_depth"), config.get("codec", "mp4v"),
+                  config.get("frame_cache", False))
+
+
+if __name__ == '__main__':
+    from instrumentation import metrics
+
+    parser = argparse.ArgumentParser(description="Render a video through a list of effect stages in one pass")
+    parser.add_argument("config", help="JSON config file with input, output and stages")
+    parser.add_argument("--metrics", help="write per-stage timings and counters to this file")
+    parser.add_argument("--metrics-format", choices=["json", "prometheus"], default="json")
+    parser.add_argument("--metrics-interval", type=float, help="also rewrite the metrics file every this many seconds")
+    args = parser.parse_args()
+
+    stop_dumping = None
+    if args.metrics and args.metrics_interval:
+        stop_dumping = metrics.dump_every(args.metrics, args.metrics_interval, args.metrics_format)
+    count = render_config(args.config)
+    if stop_dumping:
+        stop_dumping()
+    elif args.metrics:
+        metrics.dump(args.metrics, args.metrics_format)
+    print(f"Done: {count} frames written")
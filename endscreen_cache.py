@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Decode-once cache for the endscreen clip
+
+The endscreen is decoded once per target (width, height, fps), resized to the main video's
+size and resampled to its frame rate. The frames are kept in memory, or in a raw uint8 file
+on disk that is memory-mapped, so a batch of videos (even across the batch worker processes)
+only decodes the endscreen once. Clips bigger than the size cap are streamed instead.
+
+The files on disk are kept under a total size cap: when a new one doesn't fit, the ones used
+least recently are deleted. Every file is written under a temporary name and renamed into
+place when it is complete, so worker processes decoding the same endscreen at the same time
+never see a half written file (the last one to finish simply replaces the other's copy).
+"""
+import hashlib
+import os
+import tempfile
+import cv2
+import numpy as np
+
+# Where the endscreen frames are kept: "disk" (memory-mapped file, shared by all processes) or "memory"
+ENDSCREEN_STORAGE = "disk"
+ENDSCREEN_CACHE_DIR = os.path.join(tempfile.gettempdir(), "endscreen_cache")
+# Endscreens bigger than this (decoded, in bytes) are not cached but decoded again every time
+ENDSCREEN_MAX_BYTES = 1024 * 1024 * 1024
+# Total size of the endscreen files on disk, the least recently used ones are deleted to stay under it
+ENDSCREEN_CACHE_MAX_BYTES = 4 * 1024 * 1024 * 1024
+
+# Endscreens already loaded by this process
+_loaded = {}
+
+
+# Yields the endscreen frames resized to size = (width, height) and resampled to fps
+def iter_endscreen_frames(endscreen_path, size, fps):
+    cap = cv2.VideoCapture(endscreen_path)
+    if not cap.isOpened():
+        return
+    src_fps = cap.get(cv2.CAP_PROP_FPS) or fps
+    # every source frame is written as many times as needed to keep the endscreen's duration
+    step = src_fps / fps if fps else 1.0
+    src_index, next_index = 0, 0.0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if (frame.shape[1], frame.shape[0]) != tuple(size):
+                frame = cv2.resize(frame, tuple(size), interpolation=cv2.INTER_AREA)
+            while next_index < src_index + 1:
+                yield frame
+                next_index += step
+            src_index += 1
+    finally:
+        cap.release()
+
+
+# Name of the cache entry: changes when the endscreen file or the target format changes
+def _cache_key(endscreen_path, size, fps):
+    stat = os.stat(endscreen_path)
+    text = f"{os.path.abspath(endscreen_path)}|{stat.st_size}|{stat.st_mtime_ns}|{size[0]}x{size[1]}|{fps:.3f}"
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+# Rough decoded size of the endscreen, to check it against the cap before decoding
+def _estimated_bytes(endscreen_path, size, fps):
+    cap = cv2.VideoCapture(endscreen_path)
+    count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    src_fps = cap.get(cv2.CAP_PROP_FPS) or fps
+    cap.release()
+    frames = count * fps / src_fps if src_fps else count
+    return int(frames * size[0] * size[1] * 3)
+
+
+# Deletes the least recently used endscreen files until needed more bytes fit under max_bytes
+# (the last used time is the modification time, touched on every use)
+def _make_room(cache_dir, needed, max_bytes):
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".raw"):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+        except OSError:
+            continue
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total + needed <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            # still mapped by another process on a system that can't delete open files
+            continue
+        total -= size
+
+
+# Decodes the endscreen into a raw file and renames it into place when it is complete
+# (the rename is atomic, so another process never maps a half written file)
+def _write_raw(endscreen_path, size, fps, raw_path):
+    os.makedirs(os.path.dirname(raw_path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(raw_path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for frame in iter_endscreen_frames(endscreen_path, size, fps):
+                f.write(np.ascontiguousarray(frame).data)
+        os.replace(tmp_path, raw_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+# Returns the endscreen frames for a video of size = (width, height) and fps
+# Either as a (N, height, width, 3) uint8 array (in memory or memory-mapped), or as a generator
+# that decodes the clip again when it is too big to cache. Empty if the endscreen can't be opened
+# cache_dir, cache_max_bytes = where the disk files go and their total size cap (None = the settings above)
+def load_endscreen(endscreen_path, size, fps, storage=None, max_bytes=None, cache_dir=None, cache_max_bytes=None):
+    storage = storage or ENDSCREEN_STORAGE
+    max_bytes = ENDSCREEN_MAX_BYTES if max_bytes is None else max_bytes
+    cache_dir = cache_dir or ENDSCREEN_CACHE_DIR
+    cache_max_bytes = ENDSCREEN_CACHE_MAX_BYTES if cache_max_bytes is None else cache_max_bytes
+    if not os.path.exists(endscreen_path):
+        return []
+
+    key = _cache_key(endscreen_path, size, fps)
+    if key in _loaded:
+        return _loaded[key]
+
+    width, height = size
+    if storage == "disk":
+        raw_path = os.path.join(cache_dir, key + ".raw")
+        if os.path.exists(raw_path):
+            # mark as recently used
+            os.utime(raw_path)
+        else:
+            estimated = _estimated_bytes(endscreen_path, size, fps)
+            if estimated > min(max_bytes, cache_max_bytes):
+                return iter_endscreen_frames(endscreen_path, size, fps)
+            os.makedirs(cache_dir, exist_ok=True)
+            _make_room(cache_dir, estimated, cache_max_bytes)
+            _write_raw(endscreen_path, size, fps, raw_path)
+        if os.path.getsize(raw_path) == 0:
+            frames = np.zeros((0, height, width, 3), np.uint8)
+        else:
+            frames = np.memmap(raw_path, dtype=np.uint8, mode="r").reshape(-1, height, width, 3)
+    else:
+        if _estimated_bytes(endscreen_path, size, fps) > max_bytes:
+            return iter_endscreen_frames(endscreen_path, size, fps)
+        decoded = list(iter_endscreen_frames(endscreen_path, size, fps))
+        frames = np.stack(decoded) if decoded else np.zeros((0, height, width, 3), np.uint8)
+
+    _loaded[key] = frames
+    return frames
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Temporal face tracking so the Haar cascade does not have to run on every frame
+
+The detector only runs on keyframes (every DETECT_INTERVAL frames) or when the frame
+changes a lot compared to the last keyframe. In between, every face box is carried
+forward with template matching on a small grayscale copy of the frame, and the boxes
+are padded a bit more the longer it has been since the last detection, so a face that
+moves never comes out of its blur.
+"""
+import cv2
+from geometry import box_iou
+from instrumentation import metrics
+
+# Run the detector at least once every this many frames
+DETECT_INTERVAL = 10
+# Mean absolute grayscale difference (0-255) to the last keyframe that forces a new detection
+MOTION_THRESHOLD = 12.0
+# Extra padding around every box, as a fraction of its size, added per DETECT_INTERVAL frames since the detection
+TRACK_PADDING = 0.15
+# Scale of the grayscale copy used for motion checking and tracking
+TRACK_SCALE = 0.25
+# Template match score below which a box is not moved (it only keeps growing its padding)
+MIN_MATCH_SCORE = 0.4
+# Amount of keyframes a face can go undetected before its box is dropped (covers detector flicker)
+MAX_MISSES = 1
+
+
+class FaceTracker:
+
+    # detect = function that takes a full size BGR frame and returns (x, y, w, h) face boxes
+    def __init__(self, detect, interval=DETECT_INTERVAL, motion_threshold=MOTION_THRESHOLD,
+                 padding=TRACK_PADDING, scale=TRACK_SCALE):
+        self.detect = detect
+        self.interval = interval
+        self.motion_threshold = motion_threshold
+        self.padding = padding
+        self.scale = scale
+
+        # counters for reporting
+        self.frames = 0
+        self.detections = 0
+
+        # tracked faces: [x, y, w, h] in full size coordinates, plus their misses at keyframes
+        self._boxes = []
+        self._misses = []
+        self._last_key = None
+        self._prev_small = None
+        self._since_key = 0
+
+    # Amount of detector calls skipped thanks to tracking
+    @property
+    def detections_saved(self):
+        return self.frames - self.detections
+
+    # Small grayscale copy of the frame used for motion checking and tracking
+    def _small_gray(self, frame):
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small
+
+    def _is_keyframe(self, small):
+        # (the keyframe itself is frame 0, so the next one is frame interval)
+        if self._last_key is None or self._since_key + 1 >= self.interval:
+            return True
+        if self.motion_threshold is None:
+            return False
+        return cv2.absdiff(small, self._last_key).mean() > self.motion_threshold
+
+    # Runs the detector and matches the result against the faces already being tracked
+    def _redetect(self, frame):
+        found = [list(map(int, box)) for box in self.detect(frame)]
+        boxes, misses = list(found), [0] * len(found)
+        # keep faces the detector missed this time, for up to MAX_MISSES keyframes
+        for box, miss in zip(self._boxes, self._misses):
+            if miss < MAX_MISSES and all(box_iou(box, f) < 0.3 for f in found):
+                boxes.append(box)
+                misses.append(miss + 1)
+        self._boxes, self._misses = boxes, misses
+        self.detections += 1
+
+    # Moves every box to where its contents went in the new frame, using template matching
+    # in a search window around the old position
+    def _track(self, small):
+        s = self.scale
+        sh, sw = small.shape[:2]
+        for box in self._boxes:
+            x, y, w, h = (int(round(v * s)) for v in box)
+            if w < 4 or h < 4:
+                continue
+            x0, y0 = max(x, 0), max(y, 0)
+            x1, y1 = min(x + w, sw), min(y + h, sh)
+            if x1 - x0 < 4 or y1 - y0 < 4:
+                continue
+            template = self._prev_small[y0:y1, x0:x1]
+            # search window: the box grown by half its size on every side
+            wx0, wy0 = max(x0 - w // 2, 0), max(y0 - h // 2, 0)
+            wx1, wy1 = min(x1 + w // 2, sw), min(y1 + h // 2, sh)
+            window = small[wy0:wy1, wx0:wx1]
+            result = cv2.matchTemplate(window, template, cv2.TM_CCOEFF_NORMED)
+            _, score, _, (mx, my) = cv2.minMaxLoc(result)
+            if score < MIN_MATCH_SCORE:
+                continue
+            box[0] += (wx0 + mx - x0) / s
+            box[1] += (wy0 + my - y0) / s
+
+    # Grows every box by the padding, more the longer it has been since the last detection,
+    # and clips it to the frame
+    def _padded(self, frame_shape):
+        fh, fw = frame_shape[:2]
+        grow = self.padding * (1 + self._since_key / float(self.interval))
+        boxes = []
+        for x, y, w, h in self._boxes:
+            px, py = w * grow / 2, h * grow / 2
+            x0, y0 = max(int(x - px), 0), max(int(y - py), 0)
+            x1, y1 = min(int(x + w + px + 0.5), fw), min(int(y + h + py + 0.5), fh)
+            if x1 > x0 and y1 > y0:
+                boxes.append((x0, y0, x1 - x0, y1 - y0))
+        return boxes
+
+    # Returns the face boxes (x, y, w, h) for the next frame of the video
+    # Frames have to be given in order, since the boxes are carried over from the previous ones
+    def update(self, frame):
+        small = self._small_gray(frame)
+        if self._is_keyframe(small):
+            self._redetect(frame)
+            self._last_key = small
+            self._since_key = 0
+        else:
+            with metrics.time("track"):
+                self._track(small)
+            self._since_key += 1
+            metrics.count("detections_skipped")
+        self._prev_small = small
+        self.frames += 1
+        return self._padded(frame.shape)
+
+    # Short summary of how much detection work was skipped
+    def report(self):
+        saved = self.detections_saved
+        percent = 100.0 * saved / self.frames if self.frames else 0.0
+        return (f"{self.frames} frames, {self.detections} detections, "
+                f"{saved} detections saved ({percent:.1f}%)")
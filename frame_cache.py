@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Decode-once cache of raw video frames on local disk
+
+A clip is decoded once (and resized, if asked) into a raw uint8 (N, height, width, 3) file,
+and every later pass reads that file instead of decoding the clip again. CachedCapture reads
+it like a cv2.VideoCapture (read, grab, seeking with CAP_PROP_POS_FRAMES), one frame at a time
+into a new array, so the stages that edit frames in place never change the file, and only
+the frames in flight stay in memory. load_frames maps the whole file read-only instead, for
+readers that loop over the frames without editing them (eg. overlay_talkingvid.OverlayLoop).
+
+The cache is kept under a size cap: when a new clip doesn't fit, the entries that were used
+least recently are deleted. Clips bigger than the cap are not cached at all. An entry belongs
+to the clip's path, size and modification time and the size its frames were resized to, so an
+edited clip is decoded again.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import cv2
+import numpy as np
+from instrumentation import metrics
+
+FRAME_CACHE_DIR = os.path.join(tempfile.gettempdir(), "frame_cache")
+# Total size of the cached frames (in bytes), the least recently used clips are deleted to stay under it
+FRAME_CACHE_MAX_BYTES = 8 * 1024 * 1024 * 1024
+
+
+# Name of the cache entry: changes when the clip file or the size of the frames changes
+def _cache_key(path, size):
+    stat = os.stat(path)
+    text = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{size}"
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+# Cached clips as (last used time, bytes, key), the last used time is the modification time of the header
+def _entries(cache_dir):
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".json"):
+            continue
+        key = name[:-5]
+        try:
+            used = os.path.getmtime(os.path.join(cache_dir, name))
+            size = os.path.getsize(os.path.join(cache_dir, key + ".raw"))
+        except OSError:
+            continue
+        entries.append((used, size, key))
+    return entries
+
+
+# Deletes the least recently used clips until needed more bytes fit under max_bytes
+def _make_room(cache_dir, needed, max_bytes):
+    entries = sorted(_entries(cache_dir))
+    total = sum(size for _, size, _ in entries)
+    for _, size, key in entries:
+        if total + needed <= max_bytes:
+            break
+        try:
+            # header first, so the entry is gone before its frames are
+            os.remove(os.path.join(cache_dir, key + ".json"))
+            os.remove(os.path.join(cache_dir, key + ".raw"))
+        except OSError:
+            # still mapped by another process on a system that can't delete open files
+            continue
+        total -= size
+        metrics.count("frame_cache_evicted")
+
+
+# Raised while decoding a clip that turns out to be bigger than the cap
+class _TooBig(Exception):
+    pass
+
+
+# Writes data to path through a temporary file and a rename, so no one ever reads it half written
+def _write_atomic(path, write):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+# Decodes the clip into the cache, returns its header or None if it can't be opened or is bigger than max_bytes
+def _decode(path, size, key, cache_dir, max_bytes):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        return None
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        width, height = size or (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        frame_bytes = width * height * 3
+        # the frame count is only an estimate, so the size is checked again while decoding
+        if cap.get(cv2.CAP_PROP_FRAME_COUNT) * frame_bytes > max_bytes:
+            return None
+        _make_room(cache_dir, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) * frame_bytes, max_bytes)
+
+        count = [0]
+        def write(f):
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                if size is not None:
+                    frame = cv2.resize(frame, size)
+                if (count[0] + 1) * frame_bytes > max_bytes:
+                    raise _TooBig
+                f.write(np.ascontiguousarray(frame).data)
+                count[0] += 1
+
+        with metrics.time("frame_cache_decode"):
+            try:
+                _write_atomic(os.path.join(cache_dir, key + ".raw"), write)
+            except _TooBig:
+                return None
+    finally:
+        cap.release()
+
+    # the header is written last, an entry only counts once its header is there
+    header = {"frames": count[0], "width": width, "height": height, "fps": fps, "source": os.path.abspath(path)}
+    _write_atomic(os.path.join(cache_dir, key + ".json"), lambda f: f.write(json.dumps(header).encode("utf-8")))
+    return header
+
+
+# Raw file of the clip's frames in the cache, its shape (N, height, width, 3) and its fps
+# Decodes the clip into the cache the first time, returns None if it can't be opened or is too big to cache
+def _load(path, size, cache_dir, max_bytes):
+    cache_dir = cache_dir or FRAME_CACHE_DIR
+    max_bytes = FRAME_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    size = tuple(size) if size is not None else None
+    if not os.path.exists(path):
+        return None
+    os.makedirs(cache_dir, exist_ok=True)
+
+    key = _cache_key(path, size)
+    header_path = os.path.join(cache_dir, key + ".json")
+    try:
+        with open(header_path, "r", encoding="utf-8") as f:
+            header = json.load(f)
+        # mark as recently used
+        os.utime(header_path)
+        metrics.count("frame_cache_hits")
+    except (OSError, ValueError):
+        header = _decode(path, size, key, cache_dir, max_bytes)
+        if header is None:
+            return None
+        metrics.count("frame_cache_misses")
+
+    shape = (header["frames"], header["height"], header["width"], 3)
+    return os.path.join(cache_dir, key + ".raw"), shape, header["fps"]
+
+
+# Frames of the clip as a read-only memory-mapped (N, height, width, 3) uint8 array, and its fps
+# size = (width, height) to resize the frames to (None = as they are)
+# Every page of the file that is read stays mapped, so this is meant for small clips that are read over and over
+def load_frames(path, size=None, cache_dir=None, max_bytes=None):
+    loaded = _load(path, size, cache_dir, max_bytes)
+    if loaded is None:
+        return None
+    raw_path, shape, fps = loaded
+    if shape[0] == 0:
+        return np.zeros(shape, np.uint8), fps
+    return np.memmap(raw_path, dtype=np.uint8, mode="r", shape=shape), fps
+
+
+# Reads cached frames like a cv2.VideoCapture, every frame is read from the file into a new array
+class CachedCapture:
+    def __init__(self, raw_path, shape, fps):
+        self.file = open(raw_path, "rb") if shape[0] else None
+        self.shape = shape
+        self.fps = fps
+        self.position = 0
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        if self.file is None or self.position >= self.shape[0]:
+            return False, None
+        frame = np.empty(self.shape[1:], np.uint8)
+        self.file.seek(self.position * frame.nbytes)
+        self.file.readinto(frame.data)
+        self.position += 1
+        return True, frame
+
+    def grab(self):
+        if self.file is None or self.position >= self.shape[0]:
+            return False
+        self.position += 1
+        return True
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.position = max(0, int(value))
+            return True
+        return False
+
+    def get(self, prop):
+        values = {
+            cv2.CAP_PROP_POS_FRAMES: self.position,
+            cv2.CAP_PROP_FRAME_COUNT: self.shape[0],
+            cv2.CAP_PROP_FPS: self.fps,
+            cv2.CAP_PROP_FRAME_HEIGHT: self.shape[1],
+            cv2.CAP_PROP_FRAME_WIDTH: self.shape[2],
+        }
+        return float(values.get(prop, 0.0))
+
+    def release(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+# The clip as a CachedCapture, or as a normal cv2.VideoCapture if it can't be cached
+def open_capture(path, cache_dir=None, max_bytes=None):
+    loaded = _load(path, None, cache_dir, max_bytes)
+    if loaded is None:
+        return cv2.VideoCapture(path)
+    return CachedCapture(*loaded)
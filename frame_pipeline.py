@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Shared decode -> process -> encode pipeline for the per-frame video scripts
+
+A decoder thread reads frames from a cv2.VideoCapture and hands them to a pool of worker
+threads running the per-frame transform, while an ordered writer puts the results back
+in their original order. OpenCV releases the GIL inside its C++ calls, so threads are
+enough to keep every core busy.
+"""
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from instrumentation import metrics
+
+# Default amount of worker threads running the transform
+PIPELINE_WORKERS = os.cpu_count() or 4
+# Default amount of frames that can be decoded / processed but not yet written
+PIPELINE_QUEUE_DEPTH = 16
+# Frames before the wanted one that seek_to_frame() seeks to, then decodes forward from (doubled when
+# the seek lands after the wanted frame)
+SEEK_BACK_FRAMES = 50
+
+# Marks the end of the decoded frames in the queue
+_END = object()
+
+
+# Put an item into the queue, but give up if the pipeline was stopped
+# (stops the decoder from blocking forever on a full queue when the consumer quits early)
+def _put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+# Decoder thread: reads every frame and submits it to the worker pool
+# The queue holds the pending results in frame order, so the writer only has to read it front to back
+# prepare (if given) runs here in frame order, for stateful steps like tracking, and its result
+# is passed to the transform on the worker thread
+def _decode(cap, transform, prepare, pool, pending, stop):
+    try:
+        while not stop.is_set():
+            with metrics.time("decode"):
+                ret, frame = cap.read()
+            if not ret:
+                break
+            metrics.count("frames_decoded")
+            if prepare is None:
+                job = pool.submit(transform, frame)
+            else:
+                job = pool.submit(transform, frame, prepare(frame))
+            if not _put(pending, job, stop):
+                break
+    except BaseException as e:
+        _put(pending, e, stop)
+    finally:
+        _put(pending, _END, stop)
+
+
+# Yields the processed frames of the video in their original order
+# Parameters: cap = opened cv2.VideoCapture (or anything with a cv2 style read()),
+# transform = function that takes a frame and returns the processed frame,
+# workers = amount of worker threads, queue_depth = max frames in flight at once,
+# prepare = optional function run on every frame in order before the transform,
+# its result is given to the transform as a second argument (transform(frame, prepared))
+def process_frames(cap, transform, workers=None, queue_depth=None, prepare=None):
+    workers = workers or PIPELINE_WORKERS
+    queue_depth = queue_depth or PIPELINE_QUEUE_DEPTH
+
+    pending = queue.Queue(maxsize=queue_depth)
+    stop = threading.Event()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        decoder = threading.Thread(target=_decode, args=(cap, transform, prepare, pool, pending, stop), daemon=True)
+        decoder.start()
+        try:
+            while True:
+                item = pending.get()
+                if item is _END:
+                    break
+                # Errors while decoding are passed through the queue and raised here
+                if isinstance(item, BaseException):
+                    raise item
+                yield item.result()
+        finally:
+            # Stop the decoder and throw away anything still waiting (eg. when the user quits early)
+            stop.set()
+            while True:
+                try:
+                    item = pending.get_nowait()
+                except queue.Empty:
+                    break
+                if hasattr(item, "cancel"):
+                    item.cancel()
+            decoder.join()
+
+
+# Runs the whole pipeline and writes every processed frame to the VideoWriter
+# The writing happens on the calling thread, while the decoder and the workers keep going on theirs
+# Parameters: out = opened cv2.VideoWriter (or anything with a write(frame)),
+# on_frame = optional function called with the amount of frames written so far (eg. for progress)
+# Returns the amount of frames written
+def run_pipeline(cap, out, transform, workers=None, queue_depth=None, on_frame=None, prepare=None):
+    count = 0
+    for frame in process_frames(cap, transform, workers, queue_depth, prepare):
+        with metrics.time("encode"):
+            out.write(frame)
+        metrics.count("frames_written")
+        count += 1
+        if on_frame is not None:
+            on_frame(count)
+    return count
+
+
+# Moves the capture so that its next read() gives frame target: seeks back a bit before it, then
+# decodes forward, telling the frame numbers from the timestamps of the decoded frames
+# Returns False if the video ends before the target
+def seek_to_frame(cap, target, fps, back=SEEK_BACK_FRAMES):
+    if target <= 0:
+        return True
+    start = max(0, target - back)
+    while True:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        if cap.grab():
+            index = 0 if start == 0 else int(round(cap.get(cv2.CAP_PROP_POS_MSEC) * fps / 1000.0))
+            if index < target:
+                break
+        elif start == 0:
+            return False
+        # the seek went past the target (or past the end), go further back
+        back *= 2
+        start = max(0, target - back)
+    while index < target - 1:
+        if not cap.grab():
+            return False
+        index += 1
+    return True
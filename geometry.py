@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+"""
+Box helpers shared by the face tracker and the segmentation harness
+
+Boxes are (x, y, w, h) tuples, the same as OpenCV's detectors return them.
+"""
+
+
+# Overlap between two (x, y, w, h) boxes, as intersection over union
+def box_iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = min(ax + aw, bx + bw) - max(ax, bx)
+    ih = min(ay + ah, by + bh) - max(ay, by)
+    if iw <= 0 or ih <= 0:
+        return 0.0
+    inter = iw * ih
+    return inter / float(aw * ah + bw * bh - inter)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Lightweight per-stage timing and counters
+
+Stages record how long they took into latency histograms (decode, detect, blur, blend,
+encode, and threshold / segment / crop / write for documents) and bump counters (faces
+detected, detections skipped, paragraphs kept, ...). Everything goes into the shared
+`metrics` registry, which can be written out as JSON or Prometheus text at the end of a
+run or every few seconds. The registry belongs to one process, so every batch worker
+process keeps its own numbers.
+
+ProgressReporter replaces printing the progress on every frame with at most one line
+every interval seconds.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+           0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += seconds
+
+    # Estimated q quantile (0-1): the upper bound of the bucket it falls in
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return BUCKETS[-1]
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    # Records one duration of a stage, in seconds
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    # Adds amount to a counter
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    # Times the code inside the with block as one run of the stage
+    @contextmanager
+    def time(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    # Everything recorded so far as plain dicts
+    def snapshot(self):
+        with self._lock:
+            stages = {}
+            for stage, h in self.histograms.items():
+                stages[stage] = {
+                    "count": h.count,
+                    "total_ms": h.total * 1000,
+                    "mean_ms": h.total * 1000 / h.count if h.count else 0.0,
+                    "p50_ms": h.quantile(0.5) * 1000,
+                    "p95_ms": h.quantile(0.95) * 1000,
+                    "buckets": {("+Inf" if b == float("inf") else repr(b)): c for b, c in zip(BUCKETS, h.counts)},
+                }
+            return {"timestamp": time.time(), "stages": stages, "counters": dict(self.counters)}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    # Prometheus text exposition format
+    def to_prometheus(self, prefix="dip"):
+        snap = self.snapshot()
+        lines = [f"# HELP {prefix}_stage_seconds Time spent per stage call",
+                 f"# TYPE {prefix}_stage_seconds histogram"]
+        for stage, values in sorted(snap["stages"].items()):
+            cumulative = 0
+            for bound, count in values["buckets"].items():
+                cumulative += count
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {values["total_ms"] / 1000:.9f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {values["count"]}')
+        for name, value in sorted(snap["counters"].items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    # Writes the metrics to path, as "json" or "prometheus"
+    def dump(self, path, fmt="json"):
+        text = self.to_prometheus() if fmt == "prometheus" else self.to_json()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    # Writes the metrics to path every interval seconds on a background thread (and once more when stopped)
+    # Returns a function that stops it
+    def dump_every(self, path, interval, fmt="json"):
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                self.dump(path, fmt)
+            self.dump(path, fmt)
+
+        thread = threading.Thread(target=loop, daemon=True)
+        thread.start()
+
+        def stop_dumping():
+            stop.set()
+            thread.join()
+        return stop_dumping
+
+
+# The shared registry used by all the stages
+metrics = Metrics()
+
+
+# Prints progress at most once every interval seconds (and always at the end)
+class ProgressReporter:
+    def __init__(self, total, label="Progress", interval=1.0):
+        self.total = total
+        self.label = label
+        self.interval = interval
+        self._last = 0.0
+        self._start = time.perf_counter()
+
+    def update(self, current):
+        now = time.perf_counter()
+        done = self.total and current >= self.total
+        if not done and now - self._last < self.interval:
+            return
+        self._last = now
+        percent = int(current * 100 / self.total) if self.total else 0
+        elapsed = now - self._start
+        fps = current / elapsed if elapsed > 0 else 0.0
+        print(f"\r{self.label}: {percent}% ({current}/{self.total} frames, {fps:.1f} fps)", end="", flush=True)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent layout index for the paragraph extractor
+
+For every page the index keeps the column bounds, the paragraph boxes, the settings they
+were found with and the crop files written for them. An entry is only used when the hash of
+the page's image bytes and of the settings is the same as when it was written, so an edited
+page or any changed setting is analysed again, while an unchanged page is skipped (or, if
+some of its crops were deleted or were never written, cut again from the cached boxes without
+any analysis).
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+LAYOUT_INDEX_VERSION = 2
+
+
+# Key of a page: hash of its image file contents plus the settings it is analysed with
+def content_key(data, params):
+    digest = hashlib.sha256(data)
+    digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+# Same key as content_key(file contents, params), read from the file in chunks (for pages too big to read at once)
+def file_content_key(path, params, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class LayoutIndex:
+
+    # path = JSON file the index is kept in (a missing or unreadable file starts an empty index)
+    def __init__(self, path):
+        self.path = path
+        self.pages = {}
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == LAYOUT_INDEX_VERSION:
+                    self.pages = data.get("pages", {})
+            except (OSError, ValueError):
+                self.pages = {}
+
+    @staticmethod
+    def _name(page):
+        return os.path.normpath(page)
+
+    # The entry of a page, if it was stored with the same key, else None
+    def lookup(self, page, key):
+        entry = self.pages.get(self._name(page))
+        if entry is None or entry.get("key") != key:
+            return None
+        return entry
+
+    # The entry of a page whatever its key (for the crops it had written), else None
+    def previous(self, page):
+        return self.pages.get(self._name(page))
+
+    # columns = [(start, end)], boxes = [(x, y, w, h)], crops = crop file paths,
+    # crops_saved = False if the crops were not written (the entry then only holds the layout)
+    def store(self, page, key, params, columns, boxes, crops, crops_saved=True):
+        entry = {
+            "key": key,
+            "params": params,
+            "columns": [[int(v) for v in col] for col in columns],
+            "boxes": [[int(v) for v in box] for box in boxes],
+            "crops": list(crops),
+            "crops_saved": bool(crops_saved),
+        }
+        self.pages[self._name(page)] = entry
+        return entry
+
+    # Writes the index next to its final place and renames it over it, so it is never left half written
+    def save(self):
+        folder = os.path.dirname(self.path) or "."
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": LAYOUT_INDEX_VERSION, "pages": self.pages}, f, indent=1)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
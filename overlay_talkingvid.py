@@ -7,54 +7,176 @@ Created on Fri July 29 13:52:00 2025
 """
 
 import cv2
+import numpy as np
+from frame_pipeline import process_frames, run_pipeline, seek_to_frame
+from pip_compositor import PipLayer, PipCompositor, rounded_mask
+from frame_cache import load_frames
+from instrumentation import metrics
 
 
 main_video_path    = "/Users/kaijing/Downloads/digital_pics/street.mp4"
 overlay_video_path = "/Users/kaijing/Downloads/digital_pics/talking.mp4"
 
-
-main_vid    = cv2.VideoCapture(main_video_path)
-overlay_vid = cv2.VideoCapture(overlay_video_path)
-
-
-overlay_width  = 320   
-overlay_height = 240   
-
-
-
-
-while main_vid.isOpened():
-    ret_main,  frame_main   = main_vid.read()
-    ret_ovl,   frame_overlay = overlay_vid.read()
-
-   
-    if not ret_main:
-        break
-
-    # if talking.mp4 vid finishes before main the reloop it
-    if not ret_ovl:
-        overlay_vid.set(cv2.CAP_PROP_POS_FRAMES, 0)
-        ret_ovl, frame_overlay = overlay_vid.read()
-        if not ret_ovl:
-            break
-
-    # resizing
-    small_overlay = cv2.resize(frame_overlay, (overlay_width, overlay_height))
-
-    # place overlay vid position
-    x_offset, y_offset = 10, 10
-    x1, y1 = x_offset, y_offset
-    x2, y2 = x1 + overlay_width, y1 + overlay_height
-
-    #paste overlay vid onto main frame
-    frame_main[y1:y2, x1:x2] = small_overlay
-
-    
-    cv2.imshow("Main with Overlay", frame_main)
-    if cv2.waitKey(30) & 0xFF == ord('q'):
-        break
-
-main_vid.release()
-overlay_vid.release()
-cv2.destroyAllWindows()
-
+# headless mode writes the result to output_video_path at full speed instead of showing it in a window
+headless          = False
+output_video_path = "/Users/kaijing/Downloads/digital_pics/street_overlay.mp4"
+
+
+overlay_width  = 320
+overlay_height = 240
+
+# place overlay vid position
+x_offset, y_offset = 10, 10
+
+# max memory for the resized talking vid frames (if the vid is bigger, only its first frames are kept and the
+# rest of it gets decoded again on every loop)
+overlay_max_bytes = 512 * 1024 * 1024
+
+# keep the resized talking vid frames in the frame cache on disk (see frame_cache.py) instead of in memory,
+# so vids bigger than overlay_max_bytes are not decoded again on every loop, and later runs don't decode them at all
+overlay_frame_cache = False
+
+# all the overlays drawn on the main vid, the ones with a higher z on top
+# source = vid (looped) or image path (png alpha is kept), x/y/width/height = where it goes on the main vid,
+# opacity = 0-1, radius = rounded corners (0 = square), z = drawing order
+# eg. add {"source": ".../logo.png", "x": 1180, "y": 20, "width": 80, "height": 80, "opacity": 0.8, "z": 1}
+overlays = [
+    {"source": overlay_video_path, "x": x_offset, "y": y_offset, "width": overlay_width, "height": overlay_height},
+]
+
+image_extensions = (".png", ".jpg", ".jpeg", ".bmp", ".webp")
+
+
+# talking vid frames, decoded and resized once, then looped forever
+class OverlayLoop:
+    def __init__(self, path, size, max_bytes=overlay_max_bytes):
+        self.path = path
+        self.size = size
+        self.index = 0
+
+        # memory-mapped frames from the frame cache (None if the vid can't be cached, then it's decoded as usual)
+        cached = load_frames(path, size) if overlay_frame_cache else None
+        if cached is not None and len(cached[0]):
+            self.cap = None
+            self.frames = cached[0]
+            return
+
+        self.cap = cv2.VideoCapture(path)
+
+        # decode + resize the whole vid into the ring buffer, as long as it fits
+        frame_bytes = size[0] * size[1] * 3
+        frames = []
+        while len(frames) * frame_bytes < max_bytes:
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            frames.append(cv2.resize(frame, size))
+        else:
+            # too big: keep the frames that fit, and decode only the rest of the vid again on every loop
+            print(f"Overlay video {path} does not fit in {max_bytes // (1024 * 1024)} MB, keeping its first "
+                  f"{len(frames)} frames in memory and decoding the rest again on every loop")
+            metrics.count("overlay_streamed")
+            self.frames = None
+            self.head = frames
+            self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+            return
+
+        self.cap.release()
+        self.cap = None
+        if not frames:
+            raise ValueError(f"Could not read overlay video: {path}")
+        self.frames = np.stack(frames)
+
+    # next resized talking vid frame, starts again from the first frame when it finishes
+    def next(self):
+        if self.frames is not None:
+            frame = self.frames[self.index]
+            self.index = (self.index + 1) % len(self.frames)
+            return frame
+
+        # vids that don't fit in memory: the kept frames first, then the rest decoded as it goes
+        if self.index < len(self.head):
+            frame = self.head[self.index]
+            self.index += 1
+            return frame
+        ret, frame = self.cap.read()
+        # if talking.mp4 vid finishes before main the reloop it, the decoding starts again after the kept frames
+        if not ret:
+            self.index = 0
+            if not seek_to_frame(self.cap, len(self.head), self.fps):
+                # the kept frames were the whole vid after all
+                self.cap.release()
+                self.cap = None
+                self.frames = np.stack(self.head)
+            return self.next()
+        return cv2.resize(frame, self.size)
+
+    # jump count frames ahead (eg. when the main vid is rendered from the middle)
+    def skip(self, count):
+        if self.frames is not None:
+            self.index = (self.index + count) % len(self.frames)
+            return
+        for _ in range(count):
+            self.next()
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+
+#paste overlay vid onto main frame (in place), cut off at the edges of the main frame
+def paste_overlay(frame_main, small_overlay, x1=x_offset, y1=y_offset):
+    h = min(small_overlay.shape[0], frame_main.shape[0] - y1)
+    w = min(small_overlay.shape[1], frame_main.shape[1] - x1)
+    if h > 0 and w > 0:
+        frame_main[y1:y1+h, x1:x1+w] = small_overlay[:h, :w]
+    return frame_main
+
+
+# makes the compositor for a list of overlays (like the overlays setting) on frames of frame_size (width, height)
+# the vids are decoded and resized once into their own OverlayLoop
+def build_compositor(overlay_list, frame_size):
+    layers = []
+    for spec in overlay_list:
+        size = (spec.get("width", overlay_width), spec.get("height", overlay_height))
+        path = spec["source"]
+        if path.lower().endswith(image_extensions):
+            source = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+            if source is None:
+                raise ValueError(f"Could not read overlay image: {path}")
+        else:
+            source = OverlayLoop(path, size)
+        mask = rounded_mask(size, spec["radius"]) if spec.get("radius") else None
+        rect = (spec.get("x", x_offset), spec.get("y", y_offset), size[0], size[1])
+        layers.append(PipLayer(source, rect, spec.get("opacity", 1.0), mask, spec.get("z", 0)))
+    return PipCompositor(layers, frame_size)
+
+
+# puts the overlays (talking vid etc.) on top of the main vid
+# output_path = None shows it in a window, otherwise it's written to that file as fast as possible
+def render(main_path, overlay_list=None, output_path=None):
+    main_vid = cv2.VideoCapture(main_path)
+    width  = int(main_vid.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(main_vid.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    compositor = build_compositor(overlays if overlay_list is None else overlay_list, (width, height))
+
+    # the overlay vid frames are picked in order (decoder thread), the compositing runs on the workers
+    if output_path:
+        fps = main_vid.get(cv2.CAP_PROP_FPS)
+        out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+        count = run_pipeline(main_vid, out, compositor.composite, prepare=compositor.prepare)
+        out.release()
+        print(f"Saved {count} frames to {output_path}")
+    else:
+        for frame_main in process_frames(main_vid, compositor.composite, prepare=compositor.prepare):
+            cv2.imshow("Main with Overlay", frame_main)
+            if cv2.waitKey(30) & 0xFF == ord('q'):
+                break
+        cv2.destroyAllWindows()
+
+    main_vid.release()
+    compositor.release()
+
+
+if __name__ == '__main__':
+    render(main_video_path, overlays, output_video_path if headless else None)
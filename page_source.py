@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Page sources for the paragraph extractors
+
+Inputs can be single page images, multi-page TIFFs, grayscale pages saved with np.save
+(.npy, memory-mapped so only the rows that are used are read), directories holding any of
+them, or glob patterns. Every page is named by a (path, index) reference, and only decoded when it is
+asked for: a TIFF page is read on its own with cv2.imreadmulti(start=index, count=1), so a
+500 page document never has to be split into files or loaded whole, and separate worker
+processes can each read their own pages out of the same file.
+"""
+import glob
+import hashlib
+import os
+from collections import Counter
+import cv2
+import numpy as np
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+MULTIPAGE_EXTENSIONS = (".tif", ".tiff")
+# Grayscale pages saved with np.save
+ARRAY_EXTENSIONS = (".npy",)
+PAGE_EXTENSIONS = IMAGE_EXTENSIONS + ARRAY_EXTENSIONS
+
+
+# Page files of every input: a directory (all the pages directly in it), a glob pattern or a file name
+# Sorted, without duplicates. Directories and patterns only give the files with a page extension, a plain
+# file name is always kept (even if it doesn't exist or isn't a page), so reading it reports the error
+def find_pages(inputs):
+    pages = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            found = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        elif not any(c in pattern for c in "*?["):
+            pages.append(pattern)
+            continue
+        else:
+            found = glob.glob(pattern)
+        pages.extend(sorted(path for path in found if path.lower().endswith(PAGE_EXTENSIONS)))
+    return list(dict.fromkeys(pages))
+
+
+# Amount of pages in an image file (only the headers of a TIFF are read)
+def page_count(path):
+    if path.lower().endswith(MULTIPAGE_EXTENSIONS):
+        return cv2.imcount(path)
+    return 1
+
+
+# (path, index) of every page of the inputs, index = None for single page images
+def list_pages(inputs):
+    refs = []
+    for path in find_pages(inputs):
+        count = page_count(path)
+        if count == 0 or (count == 1 and not path.lower().endswith(MULTIPAGE_EXTENSIONS)):
+            # (an unreadable file is kept as one page, so reading it reports the error)
+            refs.append((path, None))
+        else:
+            refs.extend((path, index) for index in range(count))
+    return refs
+
+
+# Display name of a page: the path, plus the page number for pages of a multi-page file
+def page_name(ref):
+    path, index = ref
+    return path if index is None else f"{path}#{index + 1}"
+
+
+# File name stem for the outputs of a page ("001", or "scan_p007" for page 7 of scan.tif)
+def page_stem(ref):
+    path, index = ref
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return stem if index is None else f"{stem}_p{index + 1:03d}"
+
+
+# Output name of every page, unique across all the inputs: the page stem under its folder relative
+# to the folder all the pages share ("a/001" and "b/001" for a/001.png and b/001.png)
+# Pages that would still get the same name (eg. scan.png and scan.jpg) get a short hash of their path added
+# Returns {ref: name}
+def output_names(refs):
+    paths = [os.path.abspath(path) for path, _ in refs]
+    try:
+        root = os.path.commonpath([os.path.dirname(path) for path in paths]) if paths else ""
+    except ValueError:
+        # on different drives, nothing is shared
+        root = None
+    names = {}
+    for ref, path in zip(refs, paths):
+        folder = os.path.dirname(os.path.relpath(path, root)) if root is not None else ""
+        names[ref] = os.path.join(folder, page_stem(ref))
+    counts = Counter(names.values())
+    for ref, path in zip(refs, paths):
+        if counts[names[ref]] > 1:
+            digest = hashlib.sha1(path.encode("utf-8")).hexdigest()[:8]
+            names[ref] = f"{names[ref]}_{digest}"
+    return names
+
+
+# Decodes one page as a grayscale image (a .npy page is memory-mapped, not read)
+def read_page(ref):
+    path, index = ref
+    if index is None and path.lower().endswith(ARRAY_EXTENSIONS):
+        if not os.path.exists(path):
+            raise FileNotFoundError(page_name(ref))
+        return np.load(path, mmap_mode="r")
+    if index is None:
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    else:
+        ok, pages = cv2.imreadmulti(path, start=index, count=1, flags=cv2.IMREAD_GRAYSCALE)
+        gray = pages[0] if ok and pages else None
+    if gray is None:
+        raise FileNotFoundError(page_name(ref))
+    return gray
+
+
+# Yields (ref, grayscale page) for every page of the inputs, decoding one page at a time
+def iter_pages(inputs):
+    for ref in list_pages(inputs):
+        yield ref, read_page(ref)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Single-file archive for extracted paragraphs
+
+Instead of one PNG per paragraph, a whole batch goes into one zip file (the same layout as
+numpy's .npz): every crop is a raw .npy member, deflated with a tunable level (0 = stored,
+which is the fastest), and an index.json member lists every page with its source path,
+column count, paragraph boxes and crop members. With store_crops=False only the boxes are
+kept, and the reader cuts the crops out of the source page when they are asked for.
+
+The archive is written as <path>.partial and renamed when it is closed, so a crashed run
+never leaves a file that looks complete. Reading one crop only decompresses that member.
+"""
+import json
+import os
+import zipfile
+import numpy as np
+from page_source import page_name, read_page
+
+ARCHIVE_VERSION = 1
+ARCHIVE_COMPRESSION = 1
+INDEX_MEMBER = "index.json"
+
+
+class ParagraphArchiveWriter:
+
+    # compression = deflate level 0-9 (0 = no compression), store_crops = False keeps only the boxes
+    def __init__(self, path, compression=ARCHIVE_COMPRESSION, store_crops=True):
+        self.path = path
+        self.store_crops = store_crops
+        self._partial = path + ".partial"
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        if compression:
+            self._zip = zipfile.ZipFile(self._partial, "w", zipfile.ZIP_DEFLATED, compresslevel=compression)
+        else:
+            self._zip = zipfile.ZipFile(self._partial, "w", zipfile.ZIP_STORED)
+        self._pages = []
+
+    # Adds one page: source = its path or (path, page index) reference (see page_source.py),
+    # boxes = [(x, y, w, h)] (None if the extractor has no boxes), crops = the paragraph images
+    # (a page without paragraphs is kept too, with no boxes / crops)
+    def add_page(self, source, boxes=None, crops=None, columns=None):
+        ref = source if isinstance(source, tuple) else (source, None)
+        number = len(self._pages)
+        members = None
+        if self.store_crops and crops is not None:
+            members = []
+            for i, crop in enumerate(crops):
+                name = f"crops/{number:06d}/{i:03d}.npy"
+                with self._zip.open(name, "w", force_zip64=True) as f:
+                    np.lib.format.write_array(f, np.ascontiguousarray(crop), allow_pickle=False)
+                members.append(name)
+        if boxes is None and members is None:
+            raise ValueError(f"{page_name(ref)}: a page needs its boxes or its crops")
+        self._pages.append({
+            "page": os.path.normpath(page_name(ref)),
+            "source": [ref[0], ref[1]],
+            "columns": columns,
+            "boxes": None if boxes is None else [[int(v) for v in box] for box in boxes],
+            "crops": members,
+        })
+
+    # Writes the index and puts the archive in place
+    def close(self):
+        if self._zip is None:
+            return
+        index = {"version": ARCHIVE_VERSION, "pages": self._pages}
+        self._zip.writestr(INDEX_MEMBER, json.dumps(index, indent=1))
+        self._zip.close()
+        self._zip = None
+        os.replace(self._partial, self.path)
+
+    # Drops the unfinished archive
+    def abort(self):
+        if self._zip is None:
+            return
+        self._zip.close()
+        self._zip = None
+        os.remove(self._partial)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ParagraphArchive:
+
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path, "r")
+        index = json.loads(self._zip.read(INDEX_MEMBER))
+        if index.get("version") != ARCHIVE_VERSION:
+            raise ValueError(f"{path}: unsupported archive version {index.get('version')}")
+        self._pages = {entry["page"]: entry for entry in index["pages"]}
+        # last source page read for crops that are only stored as boxes
+        self._source = (None, None)
+
+    # Page names (normalised source paths, "scan.tif#3" for pages of multi-page files), in the order they were written
+    @property
+    def pages(self):
+        return list(self._pages)
+
+    def _entry(self, page):
+        return self._pages[os.path.normpath(page)]
+
+    def boxes(self, page):
+        boxes = self._entry(page)["boxes"]
+        return None if boxes is None else [tuple(box) for box in boxes]
+
+    def columns(self, page):
+        return self._entry(page)["columns"]
+
+    # Amount of paragraphs of a page
+    def count(self, page):
+        entry = self._entry(page)
+        return len(entry["crops"] if entry["crops"] is not None else entry["boxes"])
+
+    # The index-th paragraph of a page, read from its member or cut from the source page
+    def crop(self, page, index):
+        entry = self._entry(page)
+        if entry["crops"] is not None:
+            with self._zip.open(entry["crops"][index]) as f:
+                return np.lib.format.read_array(f, allow_pickle=False)
+        x, y, w, h = entry["boxes"][index]
+        return self._source_page(tuple(entry["source"]))[y:y+h, x:x+w]
+
+    # All the paragraphs of a page, one at a time
+    def crops(self, page):
+        for i in range(self.count(page)):
+            yield self.crop(page, i)
+
+    def _source_page(self, ref):
+        if self._source[0] != ref:
+            self._source = (ref, read_page(ref))
+        return self._source[1]
+
+    def close(self):
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
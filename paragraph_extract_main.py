@@ -1,7 +1,8 @@
 import cv2
 import numpy as np
-import matplotlib.pyplot as plt
 import os
+from instrumentation import metrics
+from run_length import find_runs
 
 image_folder = [
     'Converted Paper (8)/001.png',
@@ -16,56 +17,52 @@ image_folder = [
 
 save_images = True
 
+# Show the paragraphs of every page in a matplotlib window (blocks until it is closed)
+show_images = True
+
 # Name of folder to save paragraph images
 output_main = 'Extracted Paragraphs'
 
 
 # Load grayscale image and convert to binary (black and white) according to threshold (brightness 200 or less = 0, more than 200 = 255)
+# image_path can also be a grayscale image that is already loaded (eg: a page of a multi-page TIFF)
 def to_binary(image_path):
     
     # Read image in grayscale (0)
-    img = cv2.imread(image_path, 0)
+    img = cv2.imread(image_path, 0) if isinstance(image_path, str) else image_path
     # cv2.threshold returns two outputs, [0] is the threshold and [1] is the thresholded image, so used [1]
-    binary = cv2.threshold(img, 200, 255, cv2.THRESH_BINARY)[1]
+    with metrics.time("threshold"):
+        binary = cv2.threshold(img, 200, 255, cv2.THRESH_BINARY)[1]
     
     return binary
 
 # Vertical histogram (sum of black pixels in column) for column segmentation
+# The binary image is only 0 and 255, so the black pixels are the ones the sum of the column is missing
+# (summed with cv2.reduce, so no temporary image the size of the page is made)
 def vertical_histogram(binary):
-    return np.sum(binary == 0, axis=0)
+    return binary.shape[0] - cv2.reduce(binary, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S)[0] // 255
 
 # Horizontal histogram (sum of black pixels in row) for line segmentation
 def horizontal_histogram(binary):
-    return np.sum(binary == 0, axis=1)
+    return binary.shape[1] - cv2.reduce(binary, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S)[:, 0] // 255
 
 # Function to find regions (columns or paragraphs)
 def find_regions(hist, min_width=1):
     
-    regions = []
+    starts, ends = find_runs(hist > 0)
     
-    # in_region to check if currently in a region
-    in_region = False
+    # A region still open at the end of the histogram has no end, so it is not counted
+    # Only regions wider than min_width are kept
+    keep = (ends < len(hist)) & (ends - starts > min_width)
     
-    for i in range(len(hist)):
-        # If wasnt in region and then now in region, means reached start of a region
-        if hist[i] > 0 and not in_region:
-            start = i
-            in_region = True
-            
-        # If was in region and then now not in region, means reached end of a region
-        elif hist[i] == 0 and in_region:
-            end = i
-            in_region = False
-            
-            # If width of region is more than min_width, add to list of regions
-            if end - start > min_width:
-                regions.append((start, end))
-            
-    return regions
+    return list(zip(starts[keep].tolist(), ends[keep].tolist()))
 
 # Show histograms for debug
 def show_histogram(image, hist, orientation='horizontal', title='Histogram'):
     
+    # Imported here so the extraction itself does not need matplotlib
+    import matplotlib.pyplot as plt
+    
     plt.figure(figsize=(10, 4))
     
     # Show original image
@@ -109,8 +106,8 @@ def segment_columns(binary):
         
     return columns
 
-# Detect and extract paragraphs inside a column image, based on horizontal histogram
-def segment_paragraphs(column_img, x_start, line_spacing_threshold=40):
+# Find the start and end rows of the paragraphs inside a column image, based on horizontal histogram
+def paragraph_bounds(column_img, line_spacing_threshold=40):
     
     # Horizontal histogram to detect lines
     h_hist = horizontal_histogram(column_img)
@@ -121,7 +118,11 @@ def segment_paragraphs(column_img, x_start, line_spacing_threshold=40):
     # Get line boundaries based on horizontal histogram
     line_bounds = find_regions(h_hist, min_width=5)
 
-    paragraphs = []
+    bounds = []
+
+    # Column with no lines left (eg: only a table was in it)
+    if not line_bounds:
+        return bounds
 
     # Start 1st paragraph with the 1st line start and end
     current_para_start = line_bounds[0][0]
@@ -140,83 +141,223 @@ def segment_paragraphs(column_img, x_start, line_spacing_threshold=40):
         # If current line is far from the previous line (exceeds line_spacing_threshold), end paragraph
         else:
             # Save current paragraph
-            para_img = column_img[current_para_start:current_para_end, :]
-            paragraphs.append(para_img)
+            bounds.append((current_para_start, current_para_end))
             
             # Start new paragraph
             current_para_start = curr_start
             current_para_end = curr_end
 
     # Append last paragraph
-    para_img = column_img[current_para_start:current_para_end, :]
-    paragraphs.append(para_img)
+    bounds.append((current_para_start, current_para_end))
+
+    return bounds
+
+# Detect and extract paragraphs inside a column image, based on horizontal histogram
+def segment_paragraphs(column_img, x_start, line_spacing_threshold=40):
+    
+    paragraphs = []
+    
+    for para_start, para_end in paragraph_bounds(column_img, line_spacing_threshold):
+        para_img = column_img[para_start:para_end, :]
+        paragraphs.append(para_img)
 
     return paragraphs
 
 
-# Extract all paragraphs from image
-def extract_paragraphs(image_path):
-    
-    # Get binary image
-    binary = to_binary(image_path)
+# Join runs (starts, ends) that are less than max_gap apart, returns the joined (start, end) pairs
+def join_runs(starts, ends, max_gap):
     
-    # Segment into column images
-    columns = segment_columns(binary)
+    if len(starts) == 0:
+        return []
     
-    all_paragraphs = []
+    # Each run that is max_gap or more after the previous one starts a new group
+    new_group = np.flatnonzero(starts[1:] - ends[:-1] >= max_gap) + 1
+    first = np.concatenate(([0], new_group))
+    last = np.concatenate((new_group - 1, [len(starts) - 1]))
     
-    # For each column image, extract paragraphs
-    for x_start, x_end, column_img in columns:
-        paragraphs = segment_paragraphs(column_img, x_start)
-        all_paragraphs.extend(paragraphs)
+    return list(zip(starts[first].tolist(), ends[last].tolist()))
 
-    return all_paragraphs
+# Erode with a line of length pixels (axis 0 = horizontal, 1 = vertical), anchored at its first pixel
+# Done as a few erosions by 2 pixel kernels with doubling gaps, which is much faster than one long kernel
+def erode_line(img, length, axis=0):
+    
+    reach = 1
+    while reach < length:
+        step = min(reach, length - reach)
+        kernel = np.zeros((1, step + 1), np.uint8)
+        kernel[0, [0, step]] = 1
+        img = cv2.erode(img, kernel if axis == 0 else kernel.T, anchor=(0, 0),
+                        borderType=cv2.BORDER_CONSTANT, borderValue=0)
+        reach += step
+    
+    return img
 
-# If using normal extract_paragraphs(), it will extract table as 1 paragraph and all other paragraphs as 1 paragraph
-# So need to use this adjusted function
-def extract_paragraphs_004(image_path):
+# Find tables and figures: ruled lines and solid areas, ink runs that are far longer than any letter
+# Lines closer than line_gap rows are joined, so a table without vertical rules is still one region
+# Returns their boxes (x, y, w, h), a single horizontal rule (lower than min_height) is not a region
+def find_table_regions(binary, min_line_frac=0.1, line_gap=60, min_height=30):
+    
+    h, w = binary.shape
+    
+    with metrics.time("table_detect"):
+        # Lines are looked for on a page half the size, the min of every 2x2 block (so 1 pixel lines stay)
+        # Then ink as white for the morphology
+        even = binary[:h // 2 * 2, :w // 2 * 2]
+        rows = cv2.min(even[0::2], even[1::2])
+        small = cv2.bitwise_not(np.minimum(rows[:, 0::2], rows[:, 1::2]))
+        
+        # Only the start of every run of ink longer than the kernel is left after the erosion (text is too short for it)
+        # The lines are not dilated back, grow_region() fits the boxes to their ink on the full page
+        lines = cv2.bitwise_or(erode_line(small, max(1, int(w * min_line_frac) // 2), axis=0),
+                               erode_line(small, max(1, int(h * min_line_frac / 4) // 2), axis=1))
+        
+        # Bands of rows with lines, then the groups of line columns inside each band (in full page pixels)
+        regions = []
+        starts, ends = find_runs(cv2.reduce(lines, 1, cv2.REDUCE_MAX).ravel() > 0)
+        for band_start, band_end in join_runs(starts, ends, line_gap // 2):
+            band = lines[band_start:band_end]
+            starts, ends = find_runs(cv2.reduce(band, 0, cv2.REDUCE_MAX).ravel() > 0)
+            for x_start, x_end in join_runs(starts, ends, line_gap // 2):
+                regions.append(grow_region(binary, 2 * x_start, 2 * band_start, 2 * (x_end - x_start),
+                                           2 * (band_end - band_start), line_gap))
+    
+    # Markers of the same table (eg: the starts of its rows and of its columns) grow into the same box
+    # A lone rule is fitted to its own few rows
+    regions = [box for box in dict.fromkeys(regions) if box[3] >= min_height and box[2] >= w * min_line_frac]
+    
+    metrics.count("tables_found", len(regions))
+    return regions
+
+# Widen a table box over the ink in its rows that is less than max_gap away (eg: parts of a figure without lines),
+# and fit its top and bottom to the rows with ink, like the paragraph bounds
+def grow_region(binary, x, y, w, h, max_gap=60):
     
-    # Get binary image
-    binary = to_binary(image_path)
+    # Runs of ink columns less than max_gap apart form one group, keep the groups that overlap the box
+    starts, ends = find_runs(vertical_histogram(binary[y:y+h]) > 0)
+    groups = [(start, end) for start, end in join_runs(starts, ends, max_gap) if start < x + w and end > x]
+    x_start, x_end = groups[0][0], groups[-1][1]
     
-    # Extract table as paragraph first
+    # Rows of ink in those columns that run into the box (eg: descenders below the last line)
+    starts, ends = find_runs(horizontal_histogram(binary[:, x_start:x_end]) > 0)
+    touching = (starts < y + h) & (ends > y)
+    y_start, y_end = int(starts[touching][0]), int(ends[touching][-1])
     
-    # Table location
-    table_y_start = 200
-    table_y_end = 400
+    return (x_start, y_start, x_end - x_start, y_end - y_start)
+
+# Keep only the regions that the histograms alone get wrong: ones across more than one column (they merge the columns),
+# or whose paragraph runs into the text above or below them. A figure the histograms already find as its own paragraph
+# is left to them, so pages without such tables come out exactly as without table detection
+# The page is not changed or copied: the columns with the regions made white come from the page's vertical histogram
+# with the black pixels of the regions taken off, which only needs the rows of the regions
+def merging_regions(binary, regions):
     
-    # Get table image
-    table_img = binary[table_y_start:table_y_end]
+    if not regions:
+        return regions
     
-    all_paragraphs = []
+    v_hist = vertical_histogram(binary)
+    masked_hist = v_hist.copy()
+    
+    # Bands of rows between the region edges, in each band the columns covered by any region (regions may overlap)
+    edges = sorted({y for _, y, _, h in regions} | {y + h for _, y, _, h in regions})
+    for band_start, band_end in zip(edges[:-1], edges[1:]):
+        covered = np.zeros(len(v_hist), bool)
+        for x, y, w, h in regions:
+            if y < band_end and y + h > band_start:
+                covered[x:x+w] = True
+        if covered.any():
+            masked_hist[covered] -= vertical_histogram(binary[band_start:band_end])[covered]
+    
+    masked_columns = find_regions(masked_hist, min_width=10)
+    columns = find_regions(v_hist, min_width=10)
+    
+    # Paragraphs of the columns (of the page as it is), only found for the columns that have a region
+    bounds = {}
+    def column_paragraphs(x_start, x_end):
+        if x_start not in bounds:
+            bounds[x_start] = paragraph_bounds(binary[:, x_start:x_end])
+        return bounds[x_start]
+    
+    merging = []
+    for x, y, w, h in regions:
+        spans = sum(1 for x_start, x_end in masked_columns if x_start < x + w and x < x_end)
+        merged = any(para_start < y or para_end > y + h
+                     for x_start, x_end in columns if x_start < x + w and x < x_end
+                     for para_start, para_end in column_paragraphs(x_start, x_end) if para_start < y + h and para_end > y)
+        if spans > 1 or merged:
+            merging.append((x, y, w, h))
+    
+    return merging
+
+# Paragraph and table boxes (x, y, w, h) of a binary image, in reading order (column by column, top to bottom)
+# Returns (box, is_table) pairs. The tables are made white in binary (in place) before the columns are found, so they do not merge
+# the columns or paragraphs around them, and each table is given the full width of the columns it is in
+# regions = the tables to cut out, as kept by merging_regions() (the others are left as paragraphs)
+def page_boxes(binary, regions):
     
-    # Add table image to list of paragraphs
-    all_paragraphs.append(table_img)
+    for x, y, w, h in regions:
+        binary[y:y+h, x:x+w] = 255
     
-    # Debug
-    #plt.imshow(binary, cmap='gray') 
-    #plt.title("binary image") 
-    #plt.show()
+    columns = segment_columns(binary)
+    
+    items = []
     
-    # Make copy of binary image and replace table section with white
-    # 'binary2 = binary' doesnt make copy, just reference, so need to use copy()
-    binary2 = binary.copy()
+    for i, (x_start, x_end, column_img) in enumerate(columns):
+        for para_start, para_end in paragraph_bounds(column_img):
+            items.append((i, para_start, (x_start, para_start, x_end - x_start, para_end - para_start), False))
     
-    # Replace table with white (make it empty)
-    binary2[table_y_start:table_y_end, :] = 255
+    for x, y, w, h in regions:
+        inside = [i for i, (x_start, x_end, _) in enumerate(columns) if x_start < x + w and x < x_end]
+        
+        if inside:
+            x0 = min(columns[inside[0]][0], x)
+            x1 = max(columns[inside[-1]][1], x + w)
+            items.append((inside[0], y, (x0, y, x1 - x0, h), True))
+        
+        # Table outside of every column, placed after the columns on its left
+        else:
+            items.append((sum(1 for x_start, _, _ in columns if x_start < x), y, (x, y, w, h), True))
+    
+    items.sort(key=lambda item: (item[0], item[1]))
+    
+    return [(box, is_table) for _, _, box, is_table in items]
+
+
+# Extract all paragraphs from image (tables and figures are extracted as 1 paragraph each)
+def extract_paragraphs(image_path):
     
-    # Continue column and paragraph extraction
-    columns = segment_columns(binary2)
+    # Get binary image
+    binary = to_binary(image_path)
     
-    for x_start, x_end, column_img in columns:
-        paragraphs = segment_paragraphs(column_img, x_start)
-        all_paragraphs.extend(paragraphs)
+    with metrics.time("segment"):
+        regions = merging_regions(binary, find_table_regions(binary))
+        
+        # Copy only the rows of the tables that are cut out, as they are made white in binary
+        table_rows = {(y, h): binary[y:y+h].copy() for x, y, w, h in regions}
         
+        all_paragraphs = []
+        
+        for (x, y, w, h), is_table in page_boxes(binary, regions):
+            if is_table:
+                all_paragraphs.append(table_rows[(y, h)][:, x:x+w])
+            else:
+                all_paragraphs.append(binary[y:y+h, x:x+w])
+
+    metrics.count("paragraphs_kept", len(all_paragraphs))
     return all_paragraphs
 
+# Boxes (x, y, w, h) of all paragraphs in image, same as the paragraphs of extract_paragraphs()
+def extract_paragraph_boxes(image_path):
+    
+    # Get binary image
+    binary = to_binary(image_path)
+    
+    return [box for box, is_table in page_boxes(binary, merging_regions(binary, find_table_regions(binary)))]
+
 
 # Display paragraphs
 def show_paragraphs(paragraphs, image_title=""):
+    
+    import matplotlib.pyplot as plt
 
     plt.figure(figsize=(16, 8))
     
@@ -241,17 +382,14 @@ def main():
         
         base = os.path.splitext(os.path.basename(image_name))[0]
         
-        # Use extract_paragraphs_004(path) for image 004, else use normal extract_paragraphs(path)
-        if '004.png' in path:
-            paragraphs = extract_paragraphs_004(path)
-            
-        else:
-            paragraphs = extract_paragraphs(path)
+        # Tables and figures are found on every page, so all pages use extract_paragraphs(path)
+        paragraphs = extract_paragraphs(path)
             
         print(f"\n{image_name} \n{len(paragraphs)} paragraphs")
         
         # Show paragraphs for debug
-        show_paragraphs(paragraphs, image_title=image_name) 
+        if show_images:
+            show_paragraphs(paragraphs, image_title=image_name) 
     
         # Save paragraphs as images
         if save_images:
@@ -262,8 +400,9 @@ def main():
             output_sub = os.path.join(output_main, base)
             os.makedirs(output_sub, exist_ok=True)
             
-            for i, para in enumerate(paragraphs):
-                cv2.imwrite(os.path.join(output_sub, f"{base}_paragraph_{i+1}.png"), para)
+            with metrics.time("write"):
+                for i, para in enumerate(paragraphs):
+                    cv2.imwrite(os.path.join(output_sub, f"{base}_paragraph_{i+1}.png"), para)
         
         # No. of paragraphs should be 6 8 7 8 5 8 8 8 (including tables/images, counted manually)
             
@@ -1,9 +1,15 @@
 import cv2
 import numpy as np
 import os
+from instrumentation import metrics
+from run_length import find_runs, count_runs
+from layout_cache import LayoutIndex, content_key, file_content_key
+from paragraph_archive import ParagraphArchiveWriter
+from page_source import ARRAY_EXTENSIONS, iter_pages, list_pages, page_name, page_stem, read_page
 
 # ---------------------- CONFIG ---------------------- #
-# list of image files to process
+# list of pages to process: image files, multi-page TIFFs (every page is extracted), .npy pages
+# (memory-mapped, for the strip mode), folders or glob patterns (see page_source.py)
 image_folder = [
     'Converted Paper (8)/001.png', 
     'Converted Paper (8)/002.png', 
@@ -17,6 +23,20 @@ image_folder = [
 save_paragraphs = True
 output_dir = 'output'
 
+# keep the layout of every page in an index, so pages that did not change (same image, same
+# settings) are skipped on the next run
+use_layout_cache = True
+layout_index_path = os.path.join(output_dir, 'layout_index.json')
+
+# 'png' = one image per paragraph, 'archive' = all the pages in one archive file (see paragraph_archive.py),
+# written again on every run without the layout index
+output_format = 'png'
+archive_path = os.path.join(output_dir, 'paragraphs.zip')
+# deflate level of the archive, 0-9 (0 = no compression, the fastest)
+archive_compression = 1
+# False = keep only the boxes in the archive, the crops are cut from the source pages when they are read
+archive_store_crops = True
+
 # threshold values for paragraph detection
 LINE_HEIGHT_PIX   = 40
 MIN_PARA_AREA     = 3000
@@ -26,6 +46,21 @@ MIN_TEXT_LINES    = 2
 ROW_TEXT_THRESH   = 0.05
 MAX_ASPECT_RATIO  = 6.0
 MAX_HLINES        = 2
+HLINE_LEN_RATIO   = 0.80
+
+# find the columns and paragraph blobs on a page shrunk by this factor (1 = full resolution, 2 or 4
+# for high dpi scans), every blob is then split and boxed again at full resolution, so the boxes are
+# the same as with 1, only found faster
+LAYOUT_SCALE      = 1
+
+# analyse the page in horizontal strips of this many rows (0 = the whole page at once), so the
+# binarized and dilated copies never get bigger than a strip, for very tall or huge scans
+# (.npy pages are memory-mapped instead of loaded, so only the strips are ever read)
+STRIP_HEIGHT      = 0
+
+# version of the layout code, part of the layout cache key: bump it whenever a change to the code
+# changes the boxes found, so the pages cached with the old code are analysed again
+LAYOUT_VERSION    = 3
 
 # create output folder if saving is enabled
 if save_paragraphs:
@@ -37,22 +72,14 @@ def get_sum_of_black_pixels_in_column(binary_image):
     return np.sum(binary_image == 0, axis=0)
 
 # find column start/end positions based on pixel density
+# a column still open at the right edge ends at the last pixel and is kept whatever its width
 def find_column_regions(hist, threshold=1, min_width=30):
-    is_text = hist > threshold
-    in_col = False
-    column_regions = []
-
-    for i in range(len(is_text)):
-        if is_text[i] and not in_col:
-            start = i
-            in_col = True
-        elif not is_text[i] and in_col:
-            end = i
-            in_col = False
-            if (end - start) >= min_width:
-                column_regions.append((start, end))
-    if in_col:
-        column_regions.append((start, len(hist)-1))
+    starts, ends = find_runs(hist > threshold)
+    closed = ends < len(hist)
+    keep = closed & (ends - starts >= min_width)
+    column_regions = list(zip(starts[keep].tolist(), ends[keep].tolist()))
+    if len(starts) and not closed[-1]:
+        column_regions.append((int(starts[-1]), len(hist)-1))
     return column_regions if column_regions else [(0, len(hist)-1)]
 
 # full column detection based on projection
@@ -61,38 +88,38 @@ def detect_columns(binary_image):
     return find_column_regions(hist)
 
 
-# count how many horizontal text rows in a paragraph area
-def count_text_rows(roi_inv):
-    row_sum = np.sum(roi_inv == 255, axis=1)
-    active = row_sum > ROW_TEXT_THRESH * roi_inv.shape[1]
-    runs, in_run = 0, False
-    for flag in active:
-        if flag and not in_run:
-            runs += 1
-            in_run = True
-        elif not flag and in_run:
-            in_run = False
-    return runs
-
-# detect how many solid horizontal lines (like table lines)
-def count_horizontal_lines(mask, min_len_ratio=0.8):
-    h, w = mask.shape
-    lines = 0
-    for row in mask:
-        if np.sum(row == 255) > min_len_ratio * w:
-            lines += 1
-    return lines
+# count text (white) pixels in every row of a binary area
+def text_pixels_per_row(roi_inv):
+    return cv2.reduce(roi_inv, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S)[:, 0] // 255
 
 
-# extract paragraph regions from image and return them
-def extract_paragraphs(img_path):
-    # load grayscale image
-    gray = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
-    if gray is None:
-        raise FileNotFoundError(img_path)
+# summed area table of the text pixels of a column: table[r, c] = text pixels above row r and left of column c
+# built once per column, so every blob in it can be scored without scanning its pixels again
+def text_integral(col_inv):
+    return cv2.integral(cv2.threshold(col_inv, 0, 1, cv2.THRESH_BINARY)[1], sdepth=cv2.CV_32S)
 
-    # binarize (text becomes white)
-    _, bin_inv = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+# text pixels per row of the box (x, y, w, h), looked up in the summed area table
+def box_row_sums(table, x, y, w, h):
+    strip = table[y:y+h+1, x+w] - table[y:y+h+1, x]
+    return np.diff(strip)
+
+
+# check if a blob looks like a paragraph, from its size and its text pixels per row
+def paragraph_checks(row_sum, w, h):
+    fill = int(row_sum.sum()) / (w * h)
+    tl = count_runs(row_sum > ROW_TEXT_THRESH * w)
+    ar = w / h
+    hlines = int(np.count_nonzero(row_sum > HLINE_LEN_RATIO * w))
+    return (
+        fill <= MAX_FILL_RATIO and
+        tl >= MIN_TEXT_LINES and
+        ar <= MAX_ASPECT_RATIO and
+        hlines <= MAX_HLINES
+    )
+
+
+# find the columns and paragraph boxes (x, y, w, h) of a binarized page (text white) at full resolution
+def find_paragraph_boxes(bin_inv):
     col_bounds = detect_columns(255 - bin_inv)
 
     paragraph_boxes = []
@@ -108,42 +135,403 @@ def extract_paragraphs(img_path):
 
         # connected component analysis to find blobs
         n_lbl, _, stats, _ = cv2.connectedComponentsWithStats(merged, 8)
+        table = None
         for i in range(1, n_lbl):
             x, y, w, h, area = stats[i]
             if area < MIN_PARA_AREA or w < MIN_WIDTH_FRAC * col_w:
                 continue  # skip small or narrow blobs
 
-            roi = col_inv[y:y+h, x:x+w]
-            fill = cv2.countNonZero(roi) / (w * h)
-            tl = count_text_rows(roi)
-            ar = w / h
-            hlines = count_horizontal_lines(roi)
-
             # final filter to check if it's a valid paragraph
-            keep = (
-                fill <= MAX_FILL_RATIO and
-                tl >= MIN_TEXT_LINES and
-                ar <= MAX_ASPECT_RATIO and
-                hlines <= MAX_HLINES
-            )
-
-            if keep:
+            if table is None:
+                table = text_integral(col_inv)
+            if paragraph_checks(box_row_sums(table, x, y, w, h), w, h):
                 abs_box = (c_start + x, y, w, h)
                 paragraph_boxes.append(abs_box)
+            else:
+                metrics.count("blobs_rejected")
+    return col_bounds, paragraph_boxes
+
+
+# shrink a binary image by an integer factor, a pixel of the result is set if any pixel of its block is
+def downscale_binary(bin_inv, scale):
+    h, w = bin_inv.shape
+    pad_h, pad_w = -h % scale, -w % scale
+    if pad_h or pad_w:
+        bin_inv = cv2.copyMakeBorder(bin_inv, 0, pad_h, 0, pad_w, cv2.BORDER_CONSTANT, value=0)
+    # with an integer factor INTER_AREA averages exact blocks, so any text pixel leaves a non zero mean
+    small = cv2.resize(bin_inv, (bin_inv.shape[1] // scale, bin_inv.shape[0] // scale), interpolation=cv2.INTER_AREA)
+    return cv2.threshold(small, 0, 255, cv2.THRESH_BINARY)[1]
+
+
+# how far a dilation with a kernel of this size grows a pixel, (before, after)
+def dilation_reach(size):
+    anchor = size // 2
+    return size - 1 - anchor, anchor
+
+
+# same as find_paragraph_boxes, but the blobs are first found on the columns shrunk by scale, with the
+# dilation scaled so it closes every gap the full resolution one closes: a small blob then holds whole
+# full resolution blobs. Each one is split into them again with the full resolution dilation, run on its
+# own text pixels in a window around it only, so the boxes are the same as at full resolution while the
+# empty parts of the page (margins, gaps, specks) are never dilated at full resolution
+# The columns still come from the full resolution projection: it is a single pass over the page,
+# and the small page can close the narrow gaps that end a column
+def find_paragraph_boxes_scaled(bin_inv, scale):
+    height = bin_inv.shape[0]
+    col_bounds = find_column_regions(cv2.reduce(bin_inv, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S)[0] // 255)
+
+    # a gap the full resolution kernel closes is at most ceil(gap / scale) blocks wide on the small page
+    kernel_w, kernel_h = (-(-(size - 1) // scale) + 1 for size in (5, LINE_HEIGHT_PIX))
+    small_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_w, kernel_h))
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, LINE_HEIGHT_PIX))
+    left, right = dilation_reach(5)
+    up, down = dilation_reach(LINE_HEIGHT_PIX)
+
+    paragraph_boxes = []
+    for (c_start, c_end) in col_bounds:
+        col_w = c_end - c_start
+        col_inv = bin_inv[:, c_start:c_end]
+        small_col = downscale_binary(col_inv, scale)
+        n_lbl, labels, stats, _ = cv2.connectedComponentsWithStats(cv2.dilate(small_col, small_kernel), 8)
+
+        # (first pixel of the blob, box) for every blob, sorted like the labels of the full resolution blobs
+        found = []
+        table = None
+        for i in range(1, n_lbl):
+            x, y, w, h, _ = stats[i]
+            # the full resolution blobs lie within one block around the small blob
+            if (w + 2) * (h + 2) * scale * scale < MIN_PARA_AREA or (w + 2) * scale < MIN_WIDTH_FRAC * col_w:
+                continue
+
+            # text pixels of the blob in a window around it, dilated at full resolution
+            wx0, wy0 = max(x * scale - left, 0), max(y * scale - up, 0)
+            wx1, wy1 = min((x + w) * scale + right, col_w), min((y + h) * scale + down, height)
+            bx0, by0 = wx0 // scale, wy0 // scale
+            blob = (labels[by0:-(-wy1 // scale), bx0:-(-wx1 // scale)] == i).astype(np.uint8)
+            blob = cv2.resize(blob, (blob.shape[1] * scale, blob.shape[0] * scale), interpolation=cv2.INTER_NEAREST)
+            blob = blob[wy0 - by0 * scale:wy1 - by0 * scale, wx0 - bx0 * scale:wx1 - bx0 * scale]
+            ink = cv2.bitwise_and(col_inv[wy0:wy1, wx0:wx1], col_inv[wy0:wy1, wx0:wx1], mask=blob)
+            merged = cv2.dilate(ink, kernel)
+
+            # almost always one full resolution blob, its box is then that of the whole window (no stats needed)
+            n_sub, sub_labels = cv2.connectedComponents(merged, connectivity=8)
+            if n_sub == 2:
+                sub_stats = [None, (*cv2.boundingRect(merged), cv2.countNonZero(merged))]
+            else:
+                sub_stats = cv2.connectedComponentsWithStats(merged, 8)[2]
+
+            for j in range(1, n_sub):
+                sx, sy, sw, sh, area = sub_stats[j]
+                if area < MIN_PARA_AREA or sw < MIN_WIDTH_FRAC * col_w:
+                    continue
+                fx, fy = wx0 + int(sx), wy0 + int(sy)
+                if table is None:
+                    table = text_integral(col_inv)
+                if paragraph_checks(box_row_sums(table, fx, fy, sw, sh), sw, sh):
+                    first = wx0 + int(np.flatnonzero(sub_labels[sy] == j)[0])
+                    found.append(((fy, first), (c_start + fx, fy, int(sw), int(sh))))
+                else:
+                    metrics.count("blobs_rejected")
+        paragraph_boxes.extend(box for _, box in sorted(found))
+    return col_bounds, paragraph_boxes
+
+
+# Otsu threshold of a 256 bin grayscale histogram, computed the same way as cv2.THRESH_OTSU
+# (so a histogram added up strip by strip gives the same threshold as the whole page)
+def otsu_threshold(hist):
+    scale = 1.0 / hist.sum()
+    mu = float(np.dot(np.arange(256), hist)) * scale
+    eps = float(np.finfo(np.float32).eps)
+    mu1 = q1 = 0.0
+    max_sigma, max_val = 0.0, 0
+    for i in range(256):
+        p_i = hist[i] * scale
+        mu1 *= q1
+        q1 += p_i
+        q2 = 1.0 - q1
+        if min(q1, q2) < eps or max(q1, q2) > 1.0 - eps:
+            continue
+        mu1 = (mu1 + i * p_i) / q1
+        mu2 = (mu - q1 * mu1) / q2
+        sigma = q1 * q2 * (mu1 - mu2) * (mu1 - mu2)
+        if sigma > max_sigma:
+            max_sigma, max_val = sigma, i
+    return max_val
+
+
+# (start, end) rows of every strip, plus the rows around it with margin extra rows on each side
+def iter_strips(height, strip_height, margin=0):
+    for start in range(0, height, strip_height):
+        end = min(start + strip_height, height)
+        yield start, end, max(start - margin, 0), min(end + margin, height)
+
+
+def binarize_strip(gray_strip, thresh):
+    return cv2.threshold(np.ascontiguousarray(gray_strip), thresh, 255, cv2.THRESH_BINARY_INV)[1]
+
+
+def _find_root(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+# same result as find_paragraph_boxes, from a grayscale page read strip_height rows at a time
+# pass 1 adds up the grayscale histogram for the Otsu threshold, pass 2 the column histogram,
+# pass 3 dilates every column strip (read with LINE_HEIGHT_PIX rows of context so the dilation is
+# exact) and labels it, joining the blobs that touch across strip borders with union-find,
+# pass 4 adds up the text pixels per row of the candidate boxes for the paragraph checks
+def find_paragraph_boxes_strips(gray, strip_height):
+    height, width = gray.shape[:2]
 
-    # crop the paragraphs from original grayscale image
-    para_imgs = [gray[y:y+h, x:x+w] for (x,y,w,h) in paragraph_boxes]
-    return len(col_bounds), para_imgs
+    with metrics.time("threshold"):
+        hist = np.zeros(256, np.int64)
+        for start, end, _, _ in iter_strips(height, strip_height):
+            hist += np.bincount(np.asarray(gray[start:end]).ravel(), minlength=256)
+        thresh = otsu_threshold(hist)
+
+    col_hist = np.zeros(width, np.int64)
+    for start, end, _, _ in iter_strips(height, strip_height):
+        col_hist += cv2.reduce(binarize_strip(gray[start:end], thresh), 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S)[0] // 255
+    col_bounds = find_column_regions(col_hist)
+
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, LINE_HEIGHT_PIX))
+    # blobs of all strips: [x0, y0, x1, y1, area, first pixel (y, x)], merged through parent
+    blobs, parent, blob_col = [], [], []
+    last_rows = [None] * len(col_bounds)
+    for start, end, ctx_start, ctx_end in iter_strips(height, strip_height, LINE_HEIGHT_PIX):
+        bin_ctx = binarize_strip(gray[ctx_start:ctx_end], thresh)
+        for ci, (c_start, c_end) in enumerate(col_bounds):
+            merged = cv2.dilate(bin_ctx[:, c_start:c_end], kernel, iterations=1)[start - ctx_start:end - ctx_start]
+            n_lbl, labels, stats, _ = cv2.connectedComponentsWithStats(merged, 8)
+            # label i of this strip is blob base + i - 1, the border rows below keep base + i (0 = no blob)
+            base = len(blobs)
+            for i in range(1, n_lbl):
+                x, y, w, h, area = (int(v) for v in stats[i])
+                first_x = int(np.flatnonzero(labels[y] == i)[0])
+                blobs.append([x, start + y, x + w, start + y + h, area, (start + y, first_x)])
+                parent.append(len(parent))
+                blob_col.append(ci)
+
+            # join with the blobs of the strip above that touch this one (8-connected)
+            current = np.where(labels[0] > 0, labels[0] + base, 0)
+            previous = last_rows[ci]
+            if previous is not None:
+                for p, c in ((previous, current), (previous[1:], current[:-1]), (previous[:-1], current[1:])):
+                    touch = (p > 0) & (c > 0)
+                    for a, b in set(zip(p[touch].tolist(), c[touch].tolist())):
+                        ra, rb = _find_root(parent, a - 1), _find_root(parent, b - 1)
+                        if ra != rb:
+                            parent[rb] = ra
+            last_rows[ci] = np.where(labels[-1] > 0, labels[-1] + base, 0)
+
+    # merge the stats of the joined blobs
+    roots = {}
+    for i, blob in enumerate(blobs):
+        r = _find_root(parent, i)
+        if r not in roots:
+            roots[r] = list(blob)
+            continue
+        m = roots[r]
+        m[0], m[1] = min(m[0], blob[0]), min(m[1], blob[1])
+        m[2], m[3] = max(m[2], blob[2]), max(m[3], blob[3])
+        m[4] += blob[4]
+        m[5] = min(m[5], blob[5])
+
+    # candidates per column, in the order the whole page labelling would number them
+    candidates = []
+    for r, (x0, y0, x1, y1, area, first) in roots.items():
+        ci = blob_col[r]
+        c_start, c_end = col_bounds[ci]
+        if area < MIN_PARA_AREA or x1 - x0 < MIN_WIDTH_FRAC * (c_end - c_start):
+            continue
+        candidates.append((ci, first, (c_start + x0, y0, x1 - x0, y1 - y0)))
+    candidates.sort(key=lambda c: (c[0], c[1]))
+    boxes = [box for _, _, box in candidates]
+
+    row_sums = [np.zeros(h, np.int64) for _, _, _, h in boxes]
+    for start, end, _, _ in iter_strips(height, strip_height):
+        bin_strip = binarize_strip(gray[start:end], thresh)
+        for (x, y, w, h), row_sum in zip(boxes, row_sums):
+            top, bottom = max(y, start), min(y + h, end)
+            if top < bottom:
+                row_sum[top - y:bottom - y] = text_pixels_per_row(bin_strip[top - start:bottom - start, x:x + w])
+
+    paragraph_boxes = []
+    for (x, y, w, h), row_sum in zip(boxes, row_sums):
+        if paragraph_checks(row_sum, w, h):
+            paragraph_boxes.append((x, y, w, h))
+        else:
+            metrics.count("blobs_rejected")
+    return col_bounds, paragraph_boxes
+
+
+# grayscale page: .npy files are memory-mapped (for the strip mode), anything else is read with OpenCV
+# (an image that is already loaded is used as it is)
+def load_page(img_path):
+    if isinstance(img_path, np.ndarray):
+        return img_path
+    return read_page((img_path, None))
+
+
+# settings that change the layout found, for the layout cache
+def layout_params(scale=None, strip_height=None):
+    return {
+        "LAYOUT_VERSION": LAYOUT_VERSION,
+        "LINE_HEIGHT_PIX": LINE_HEIGHT_PIX,
+        "MIN_PARA_AREA": MIN_PARA_AREA,
+        "MIN_WIDTH_FRAC": MIN_WIDTH_FRAC,
+        "MAX_FILL_RATIO": MAX_FILL_RATIO,
+        "MIN_TEXT_LINES": MIN_TEXT_LINES,
+        "ROW_TEXT_THRESH": ROW_TEXT_THRESH,
+        "MAX_ASPECT_RATIO": MAX_ASPECT_RATIO,
+        "MAX_HLINES": MAX_HLINES,
+        "HLINE_LEN_RATIO": HLINE_LEN_RATIO,
+        "LAYOUT_SCALE": LAYOUT_SCALE if scale is None else scale,
+        "STRIP_HEIGHT": STRIP_HEIGHT if strip_height is None else strip_height,
+    }
+
+
+# find the column bounds and paragraph boxes (x, y, w, h) of a grayscale page
+# strip_height = analyse it in strips of this many rows (None = STRIP_HEIGHT, 0 = whole page), scale is not used then
+def find_page_layout(gray, scale=None, strip_height=None):
+    strip_height = STRIP_HEIGHT if strip_height is None else strip_height
+    if strip_height:
+        with metrics.time("segment"):
+            col_bounds, paragraph_boxes = find_paragraph_boxes_strips(gray, strip_height)
+        metrics.count("paragraphs_kept", len(paragraph_boxes))
+        return col_bounds, paragraph_boxes
+
+    # binarize (text becomes white)
+    with metrics.time("threshold"):
+        _, bin_inv = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+
+    scale = LAYOUT_SCALE if scale is None else scale
+    with metrics.time("segment"):
+        if scale > 1:
+            col_bounds, paragraph_boxes = find_paragraph_boxes_scaled(bin_inv, scale)
+        else:
+            col_bounds, paragraph_boxes = find_paragraph_boxes(bin_inv)
+    metrics.count("paragraphs_kept", len(paragraph_boxes))
+    return col_bounds, paragraph_boxes
+
+
+# crop the paragraphs from original grayscale image
+def crop_paragraphs(gray, paragraph_boxes):
+    with metrics.time("crop"):
+        return [gray[y:y+h, x:x+w] for (x,y,w,h) in paragraph_boxes]
+
+
+# extract paragraph regions from image and return them
+# scale = find the layout on a page shrunk by this factor (None = LAYOUT_SCALE)
+def extract_paragraphs(img_path, scale=None):
+    # load grayscale image
+    gray = load_page(img_path)
+
+    col_bounds, paragraph_boxes = find_page_layout(gray, scale)
+    return len(col_bounds), crop_paragraphs(gray, paragraph_boxes)
+
+
+# file names of the paragraph crops of a page (an image path or a (path, page index) reference)
+def crop_paths(page, count):
+    base = page_stem(page if isinstance(page, tuple) else (page, None))
+    return [os.path.join(output_dir, f"{base}_para_{i:02d}.png") for i in range(count)]
+
+
+def save_crops(paths, paras):
+    with metrics.time("write"):
+        for path, p in zip(paths, paras):
+            cv2.imwrite(path, p)
+
+
+# True if every crop of an index entry was written and is still there
+def crops_present(entry):
+    return (entry.get("crops_saved", False) and len(entry["crops"]) == len(entry["boxes"])
+            and all(os.path.exists(p) for p in entry["crops"]))
+
+
+# extract a page through the layout index: an unchanged page whose crops are all there is skipped,
+# one with missing crops (or stored while saving was off) gets them cut again from the cached boxes,
+# anything else is analysed
+# page = image path or (path, page index) reference (see page_source.py)
+# returns (column count, paragraph count, what was done)
+def extract_page_cached(page, index, params):
+    ref = page if isinstance(page, tuple) else (page, None)
+    img_path = page_name(ref)
+    gray = data = None
+    if ref[1] is None and ref[0].lower().endswith(ARRAY_EXTENSIONS):
+        # a .npy page is hashed in chunks and memory-mapped, it is never read whole
+        key = file_content_key(ref[0], params)
+        gray = read_page(ref)
+    elif ref[1] is None:
+        with open(ref[0], "rb") as f:
+            data = f.read()
+        key = content_key(data, params)
+    else:
+        # a page of a multi-page file is keyed by its own pixels, the file holds all the other pages too
+        gray = read_page(ref)
+        key = content_key(f"{gray.shape}".encode("utf-8") + np.ascontiguousarray(gray).tobytes(), params)
+    entry = index.lookup(img_path, key)
+    if entry is not None and (not save_paragraphs or crops_present(entry)):
+        metrics.count("pages_unchanged")
+        return len(entry["columns"]), len(entry["boxes"]), "unchanged"
+
+    if gray is None:
+        gray = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        raise FileNotFoundError(img_path)
+    if entry is not None:
+        col_bounds, paragraph_boxes = entry["columns"], entry["boxes"]
+        status = "recropped"
+    else:
+        col_bounds, paragraph_boxes = find_page_layout(gray, params["LAYOUT_SCALE"], params["STRIP_HEIGHT"])
+        status = "analysed"
+
+    paths = crop_paths(ref, len(paragraph_boxes))
+    if save_paragraphs:
+        save_crops(paths, crop_paragraphs(gray, paragraph_boxes))
+        # crops of the earlier layout that the new one does not have any more
+        previous = index.previous(img_path)
+        for old in (previous["crops"] if previous else []):
+            if old not in paths and os.path.exists(old):
+                os.remove(old)
+    index.store(img_path, key, params, col_bounds, paragraph_boxes, paths if save_paragraphs else [], save_paragraphs)
+    return len(col_bounds), len(paragraph_boxes), status
+
+
+# extract every page into one paragraph archive
+def save_archive():
+    with ParagraphArchiveWriter(archive_path, archive_compression, archive_store_crops) as archive:
+        for ref, gray in iter_pages(image_folder):
+            col_bounds, paragraph_boxes = find_page_layout(gray)
+            paras = crop_paragraphs(gray, paragraph_boxes) if archive_store_crops else None
+            with metrics.time("write"):
+                archive.add_page(ref, paragraph_boxes, paras, columns=len(col_bounds))
+            print(f"{os.path.basename(page_name(ref))} → {len(col_bounds)} col, {len(paragraph_boxes)} para")
 
 
 def main():
-    for img in image_folder:
-        cols, paras = extract_paragraphs(img)
-        print(f"{os.path.basename(img)} → {cols} col, {len(paras)} para")
+    if save_paragraphs and output_format == 'archive':
+        save_archive()
+        return
+
+    if use_layout_cache:
+        index = LayoutIndex(layout_index_path)
+        params = layout_params()
+        try:
+            for ref in list_pages(image_folder):
+                cols, count, status = extract_page_cached(ref, index, params)
+                print(f"{os.path.basename(page_name(ref))} → {cols} col, {count} para ({status})")
+        finally:
+            index.save()
+        return
+
+    for ref, gray in iter_pages(image_folder):
+        cols, paras = extract_paragraphs(gray)
+        print(f"{os.path.basename(page_name(ref))} → {cols} col, {len(paras)} para")
         if save_paragraphs:
-            base = os.path.splitext(os.path.basename(img))[0]
-            for i, p in enumerate(paras):
-                cv2.imwrite(os.path.join(output_dir, f"{base}_para_{i:02d}.png"), p)
+            save_crops(crop_paths(ref, len(paras)), paras)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-layer picture in picture compositing
+
+Several overlays (eg. a sign language interpreter, a logo and a ticker) are drawn onto every
+frame, each in its own rectangle, with an opacity and an optional mask (eg. rounded corners),
+in z order. Everything that doesn't change between frames is worked out once: every layer is
+clipped to the frame and cropped to where its mask is visible, and its rows are split into
+bands that are fully opaque (copied straight into the frame) and bands that are blended with
+the integer blend of watermark_compositor.py. Still images are premultiplied once as well.
+Every frame is edited in place, so its cost grows with the area of the overlays, not with
+their number.
+"""
+import cv2
+import numpy as np
+from instrumentation import metrics
+from watermark_compositor import blend_premultiplied, blend_colour
+
+
+class PipLayer:
+
+    # source = image (BGR, or BGRA whose alpha is multiplied into the mask), or a clip whose next()
+    # gives the frames to show, already resized to the rect (eg. overlay_talkingvid.OverlayLoop)
+    # rect = (x, y, w, h) in the frame (it may stick out of the frame), opacity = 0-1,
+    # mask = 8 bit image of size (h, w), 255 = opaque (None = the whole rect),
+    # z = layers with a higher z are drawn over the ones with a lower z
+    def __init__(self, source, rect, opacity=1.0, mask=None, z=0):
+        self.source = source
+        self.rect = tuple(int(v) for v in rect)
+        self.opacity = opacity
+        self.mask = mask
+        self.z = z
+
+    @property
+    def is_clip(self):
+        return not isinstance(self.source, np.ndarray)
+
+    # Alpha of every pixel of the rect (0-255) as uint16 (h, w, 1), and the still image resized to the rect (or None)
+    def alpha_and_image(self):
+        w, h = self.rect[2:]
+        image = None
+        alpha = np.full((h, w), 255, np.float32) if self.mask is None else _resized(self.mask, w, h).astype(np.float32)
+        if not self.is_clip:
+            image = _resized(self.source, w, h)
+            if image.ndim == 3 and image.shape[2] == 4:
+                alpha *= image[:, :, 3] / 255.0
+                image = image[:, :, :3]
+            image = np.ascontiguousarray(image)
+        alpha = np.rint(alpha * min(max(self.opacity, 0.0), 1.0)).astype(np.uint16)
+        return alpha[:, :, np.newaxis], image
+
+    def release(self):
+        if self.is_clip and hasattr(self.source, "release"):
+            self.source.release()
+
+
+def _resized(image, w, h):
+    if image.shape[:2] == (h, w):
+        return image
+    return cv2.resize(image, (w, h), interpolation=cv2.INTER_AREA)
+
+
+# 8 bit mask of size (w, h) with its corners rounded to radius, anti-aliased
+def rounded_mask(size, radius):
+    w, h = size
+    mask = np.zeros((h, w), np.uint8)
+    radius = max(0, min(int(radius), w // 2, h // 2))
+    if radius == 0:
+        mask[:] = 255
+        return mask
+    cv2.rectangle(mask, (radius, 0), (w - 1 - radius, h - 1), 255, -1)
+    cv2.rectangle(mask, (0, radius), (w - 1, h - 1 - radius), 255, -1)
+    for cx, cy in ((radius, radius), (w - 1 - radius, radius), (radius, h - 1 - radius), (w - 1 - radius, h - 1 - radius)):
+        cv2.circle(mask, (cx, cy), radius, 255, -1, cv2.LINE_AA)
+    return mask
+
+
+# Rows of a layer that are drawn the same way: frame = the frame area, source = the same area of the
+# layer's image / clip frame, opaque = copied, otherwise blended with alpha (premul for still images)
+class _Band:
+    def __init__(self, frame, source, opaque, alpha=None, inv_alpha=None, premul=None):
+        self.frame = frame
+        self.source = source
+        self.opaque = opaque
+        self.alpha = alpha
+        self.inv_alpha = inv_alpha
+        self.premul = premul
+
+
+# Clips a layer to the frame, crops it to its visible pixels and splits it into _Bands
+# Returns the bands and the layer's still image at the size of its rect (None for clips)
+def _bands(layer, frame_size):
+    x, y, w, h = layer.rect
+    alpha, image = layer.alpha_and_image()
+
+    # Part of the rect inside the frame, in layer coordinates
+    x0, y0 = max(0, -x), max(0, -y)
+    x1, y1 = min(w, frame_size[0] - x), min(h, frame_size[1] - y)
+    if x1 <= x0 or y1 <= y0:
+        return [], image
+
+    # Crop to the columns where the layer is visible
+    cols = np.flatnonzero(alpha[y0:y1, x0:x1, 0].any(axis=0))
+    if len(cols) == 0:
+        return [], image
+    x0, x1 = x0 + int(cols[0]), x0 + int(cols[-1]) + 1
+
+    # 0 = nothing visible in the row, 1 = blended, 2 = opaque all along
+    visible = alpha[y0:y1, x0:x1, 0]
+    kind = np.where((visible == 255).all(axis=1), 2, np.where(visible.any(axis=1), 1, 0))
+    cuts = np.flatnonzero(np.diff(kind)) + 1
+
+    bands = []
+    for start, end in zip([0, *cuts.tolist()], [*cuts.tolist(), len(kind)]):
+        if kind[start] == 0:
+            continue
+        rows = slice(y0 + start, y0 + end)
+        source = (rows, slice(x0, x1))
+        frame = (slice(y + rows.start, y + rows.stop), slice(x + x0, x + x1))
+        if kind[start] == 2:
+            bands.append(_Band(frame, source, True))
+            continue
+        band_alpha = np.ascontiguousarray(alpha[source])
+        inv_alpha = 255 - band_alpha
+        premul = None
+        if image is not None:
+            premul = image[source] * band_alpha
+        bands.append(_Band(frame, source, False, band_alpha, inv_alpha, premul))
+    return bands, image
+
+
+class PipCompositor:
+
+    # layers = PipLayers, frame_size = (width, height) of the frames they are drawn on
+    def __init__(self, layers, frame_size):
+        self.layers = sorted(layers, key=lambda layer: layer.z)
+        self.frame_size = frame_size
+        self._bands = []
+        self._images = []
+        for layer in self.layers:
+            bands, image = _bands(layer, frame_size)
+            self._bands.append(bands)
+            self._images.append(image)
+
+    # The next frame of every clip layer (None for still images), to be called on every frame in order
+    # (the pipeline's prepare step), its result is given to composite()
+    def prepare(self, frame=None):
+        return [layer.source.next() if layer.is_clip else None for layer in self.layers]
+
+    # Jumps the clips count frames ahead (eg. when the main vid is rendered from the middle)
+    def skip(self, count):
+        for layer in self.layers:
+            if layer.is_clip:
+                layer.source.skip(count)
+
+    # Draws every layer onto the frame in place (and returns the same frame)
+    # sources = result of prepare() for this frame
+    def composite(self, frame, sources):
+        with metrics.time("pip_composite"):
+            for bands, image, source in zip(self._bands, self._images, sources):
+                colour = source if image is None else image
+                for band in bands:
+                    roi = frame[band.frame]
+                    if band.opaque:
+                        roi[...] = colour[band.source]
+                    elif band.premul is not None:
+                        blend_premultiplied(roi, band.premul, band.inv_alpha)
+                    else:
+                        blend_colour(roi, colour[band.source], band.alpha, band.inv_alpha)
+        return frame
+
+    def release(self):
+        for layer in self.layers:
+            layer.release()
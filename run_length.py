@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Run-length helpers for the projection histograms of the paragraph extractors
+
+Instead of walking a histogram one element at a time, the runs of True values in a
+boolean array are all found at once from the places where it changes value.
+"""
+import numpy as np
+
+
+# Start and end (exclusive) of every run of True values in a 1D boolean array, as two int arrays
+# A run that reaches the end of the array ends at len(mask)
+def find_runs(mask):
+    mask = np.asarray(mask, dtype=bool)
+    padded = np.zeros(len(mask) + 2, np.int8)
+    padded[1:-1] = mask
+    # +1 where a run starts, -1 one past where it ends
+    edges = np.flatnonzero(np.diff(padded))
+    return edges[0::2], edges[1::2]
+
+
+# Amount of runs of True values in a 1D boolean array
+def count_runs(mask):
+    mask = np.asarray(mask, dtype=bool)
+    if len(mask) == 0:
+        return 0
+    return int(mask[0]) + int(np.count_nonzero(mask[1:] & ~mask[:-1]))
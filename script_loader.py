@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Loads the video scripts as modules, so their functions can be reused by other tools
+
+Some of the scripts have spaces in their names or no .py extension ("Watermark and Endscreen"),
+so they can't be imported with a normal import statement. Their main code only runs
+under __name__ == '__main__', so loading them has no side effects.
+"""
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# The scripts that can be loaded, by short name
+SCRIPTS = {
+    "blur": "DIP Assignment Blur Faces.py",
+    "brightness": "brightness_manipulation.py",
+    "overlay": "overlay_talkingvid.py",
+    "watermark": "Watermark and Endscreen",
+}
+
+
+# Loads one of the SCRIPTS (once, later calls give back the same module)
+def load_script(name):
+    module_name = f"_script_{name}"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+
+    path = os.path.join(ROOT, SCRIPTS[name])
+    loader = importlib.machinery.SourceFileLoader(module_name, path)
+    spec = importlib.util.spec_from_loader(module_name, loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        loader.exec_module(module)
+    except BaseException:
+        del sys.modules[module_name]
+        raise
+    return module
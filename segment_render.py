@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""
+Segment-parallel rendering of one long video
+
+The video is split into time ranges that are rendered by separate processes, each with its
+own cv2.VideoCapture and its own encoder, through the same stages as effect_graph.py.
+The segment files are then joined into the final video with ffmpeg's concat demuxer
+(stream copy, so nothing is re-encoded). Without ffmpeg the segments are joined by
+re-encoding them with OpenCV instead, which is slower and not lossless.
+
+Every segment seeks to a point a little before its first frame (the decoder starts from the
+keyframe before that point) and decodes forward from there, checking where it is from the
+timestamps of the decoded frames, so it starts on the exact frame even with containers whose
+frame seeking is not exact. Stages that carry state from frame to frame (face tracking,
+adaptive brightness) see a few warm-up frames before the segment starts, which are prepared
+but not written. Whole-video decisions (night_only brightness) are made once, before the
+segments are handed out.
+
+Usage: python segment_render.py config.json --segments 8 --warmup 30
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+from frame_pipeline import run_pipeline, seek_to_frame
+from effect_graph import STAGES, Stage, VideoInfo, build_stages, _prepare_all, _apply_all
+from script_loader import load_script
+
+# Default amount of segments (processes) and warm-up frames before each segment
+SEGMENTS = os.cpu_count() or 4
+WARMUP_FRAMES = 30
+
+
+# Splits frame_count frames into segments of (start, end) frames, end = None for the last one
+# (the frame count of a video is only an estimate, so the last segment reads until the video ends)
+def plan_segments(frame_count, segments):
+    segments = max(1, min(segments, frame_count))
+    bounds = [round(i * frame_count / segments) for i in range(segments + 1)]
+    plan = [(bounds[i], bounds[i + 1]) for i in range(segments)]
+    plan[-1] = (plan[-1][0], None)
+    return plan
+
+
+# Gives only the next count frames of a capture (all of them if count is None)
+class _RangeCapture:
+    def __init__(self, cap, count):
+        self.cap = cap
+        self.left = count
+
+    def read(self):
+        if self.left is not None:
+            if self.left <= 0:
+                return False, None
+            self.left -= 1
+        return self.cap.read()
+
+
+def _video_info(cap, path):
+    return VideoInfo(path,
+                     int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                     int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                     cap.get(cv2.CAP_PROP_FPS),
+                     int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+
+
+# Renders frames [start, end) of the video into segment_path (runs in a worker process)
+# Returns the amount of frames written
+def render_segment(input_path, segment_path, stage_configs, start, end, warmup, codec, workers):
+    cap = cv2.VideoCapture(input_path)
+    info = _video_info(cap, input_path)
+    stages = build_stages(stage_configs, info)
+    prepare = _prepare_all(stages)
+
+    # Seek to the warm-up frames and let the stateful stages see them, without writing them
+    warmup_start = max(0, start - warmup)
+    seek_to_frame(cap, warmup_start, info.fps)
+    for stage in stages:
+        stage.skip(warmup_start)
+    for _ in range(start - warmup_start):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        prepare(frame)
+
+    out = cv2.VideoWriter(segment_path, cv2.VideoWriter_fourcc(*codec), info.fps, info.size)
+    try:
+        count = end - start if end is not None else None
+        return run_pipeline(_RangeCapture(cap, count), out, _apply_all(stages), workers, prepare=prepare)
+    finally:
+        cap.release()
+        out.release()
+
+
+# Writes the frames the stages add after the video (eg. the endscreen) as their own segment
+# Only the stages that add frames are built
+def render_tail(input_path, segment_path, stage_configs, codec):
+    cap = cv2.VideoCapture(input_path)
+    info = _video_info(cap, input_path)
+    cap.release()
+    stages = build_stages([config for config in stage_configs if _adds_frames(config)], info)
+
+    count = 0
+    out = cv2.VideoWriter(segment_path, cv2.VideoWriter_fourcc(*codec), info.fps, info.size)
+    try:
+        for stage in stages:
+            for frame in stage.tail():
+                out.write(np.asarray(frame))
+                count += 1
+    finally:
+        out.release()
+    return count
+
+
+# Joins the segment files into output_path
+# With ffmpeg the streams are copied as they are, otherwise they are decoded and encoded again
+def join_segments(segment_paths, output_path, codec="mp4v"):
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg:
+        fd, list_path = tempfile.mkstemp(suffix=".txt")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for path in segment_paths:
+                    escaped = os.path.abspath(path).replace("'", "'\\''")
+                    f.write(f"file '{escaped}'\n")
+            subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                            "-i", list_path, "-c", "copy", output_path], check=True)
+        finally:
+            os.remove(list_path)
+        return
+
+    print("ffmpeg not found, joining the segments by re-encoding them (slower, not lossless)")
+    out = None
+    try:
+        for path in segment_paths:
+            cap = cv2.VideoCapture(path)
+            if out is None:
+                info = _video_info(cap, path)
+                out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*codec), info.fps, info.size)
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                out.write(frame)
+            cap.release()
+    finally:
+        if out is not None:
+            out.release()
+
+
+# True if the stage of this config adds frames after the video (has its own tail())
+def _adds_frames(config):
+    stage_class = STAGES.get(config.get("type"))
+    return stage_class is not None and stage_class.tail is not Stage.tail
+
+
+# Makes the decisions about the whole video once, so the segments don't each make them again
+# (and can't come to different ones): night_only brightness stages get the answer as "is_night"
+def resolve_stage_configs(input_path, stage_configs):
+    resolved = []
+    for config in stage_configs:
+        if config.get("type") == "brightness" and config.get("night_only", False) and "is_night" not in config:
+            b = load_script("brightness")
+            is_night = b.is_nighttime(input_path, config.get("sample_frames", b.vid_sample_frames),
+                                      config.get("threshold", b.day_threshold))
+            config = dict(config, is_night=bool(is_night))
+        resolved.append(config)
+    return resolved
+
+
+# Renders input_path to output_path through the stages, split into segments rendered in parallel
+# Returns the amount of frames written
+def render_segmented(input_path, output_path, stage_configs, segments=SEGMENTS, warmup=WARMUP_FRAMES, codec="mp4v"):
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        raise FileNotFoundError(f"Could not open video: {input_path}")
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+
+    plan = plan_segments(frame_count, segments)
+    stage_configs = resolve_stage_configs(input_path, stage_configs)
+    # Splits the cores between the segments running at the same time
+    workers = max(1, (os.cpu_count() or 1) // len(plan))
+    ext = os.path.splitext(output_path)[1] or ".mp4"
+
+    start_time = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="segments_") as tmp:
+        paths = [os.path.join(tmp, f"segment_{i:04d}{ext}") for i in range(len(plan))]
+        tail_path = os.path.join(tmp, f"tail{ext}")
+
+        with ProcessPoolExecutor(max_workers=len(plan)) as pool:
+            jobs = [pool.submit(render_segment, input_path, path, stage_configs, start, end, warmup, codec, workers)
+                    for path, (start, end) in zip(paths, plan)]
+            tail_job = pool.submit(render_tail, input_path, tail_path, stage_configs, codec)
+            count = sum(job.result() for job in jobs)
+            tail_count = tail_job.result()
+
+        if tail_count:
+            paths.append(tail_path)
+        join_segments(paths, output_path, codec)
+
+    seconds = time.perf_counter() - start_time
+    print(f"Rendered {count + tail_count} frames in {len(plan)} segments, {seconds:.1f}s "
+          f"({count / seconds if seconds > 0 else 0:.1f} fps)")
+    return count + tail_count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render a video in parallel segments through the effect stages")
+    parser.add_argument("config", help="JSON config file with input, output and stages (same as effect_graph.py)")
+    parser.add_argument("--segments", type=int, default=SEGMENTS, help="amount of segments rendered at the same time")
+    parser.add_argument("--warmup", type=int, default=WARMUP_FRAMES, help="warm-up frames before every segment")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    render_segmented(config["input"], config["output"], config.get("stages", []),
+                     args.segments, args.warmup, config.get("codec", "mp4v"))
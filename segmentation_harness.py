@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Accuracy and speed check for the paragraph extractors
+
+Runs extractor variants over the pages of "Converted Paper (8)" and over synthetic pages,
+and reports, side by side: how many pages got the right paragraph count, the mean count
+error, the mean IoU of the found boxes against the true ones, the recall at IoU 0.5, the
+agreement with a reference output, and the time per page.
+
+Accuracy is only measured against known truth: the paragraph counts of the sample pages,
+counted by hand, and the exact boxes of the synthetic pages (the ink of every paragraph, see
+synthetic_data.make_page). The boxes of the sample pages are not annotated by hand. Instead,
+--record saves the boxes one variant finds on them as reference boxes, and every variant is
+reported with its agreement with those (mean IoU against them). That checks an optimization
+keeps the reference variant's output, not that the output is right; the reference variant
+itself always agrees fully.
+
+Usage: python segmentation_harness.py [--variants old_full old_full@2 main] [--synthetic 6]
+       python segmentation_harness.py --record old_full
+"""
+import argparse
+import json
+import os
+import time
+import cv2
+from geometry import box_iou
+from synthetic_data import make_page
+import paragraph_extract_old_full
+import paragraph_extract_main
+
+REFERENCE_PATH = "paragraph_reference.json"
+VARIANTS = ["old_full", "old_full@2", "old_full@4", "main"]
+SYNTHETIC_PAGES = 6
+# IoU a found box needs with a true one to count as finding it
+MATCH_IOU = 0.5
+
+
+# Paragraph boxes (x, y, w, h) of a grayscale page for a variant: "old_full", "old_full@<scale>" or "main"
+def variant_boxes(variant, gray):
+    name, _, scale = variant.partition("@")
+    if name == "old_full":
+        return paragraph_extract_old_full.find_page_layout(gray, int(scale) if scale else 1)[1]
+    if name == "main":
+        return paragraph_extract_main.extract_paragraph_boxes(gray)
+    raise ValueError(f"unknown variant {variant}")
+
+
+# Greedily pairs the found boxes with the true ones, best IoU first
+# Returns the IoU of every true box (0 for the ones nothing was paired with)
+def match_boxes(truth, found):
+    pairs = sorted(((box_iou(t, f), i, j) for i, t in enumerate(truth) for j, f in enumerate(found)), reverse=True)
+    best = [0.0] * len(truth)
+    used_t, used_f = set(), set()
+    for iou, i, j in pairs:
+        if iou <= 0:
+            break
+        if i in used_t or j in used_f:
+            continue
+        used_t.add(i)
+        used_f.add(j)
+        best[i] = iou
+    return best
+
+
+def load_reference(path=REFERENCE_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+# Test pages as (name, grayscale page, true count, true boxes or None, reference boxes or None)
+def test_pages(reference, synthetic=SYNTHETIC_PAGES):
+    pages = []
+    for name, page in reference["pages"].items():
+        gray = cv2.imread(name, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise FileNotFoundError(name)
+        pages.append((name, gray, page["count"], None, page.get("reference_boxes")))
+    for i in range(synthetic):
+        gray, boxes = make_page(columns=1 + i % 3, table=i % 2 == 1, seed=1000 + i)
+        pages.append((f"synthetic/{i:03d}", gray, len(boxes), boxes, None))
+    return pages
+
+
+def _mean(values):
+    return sum(values) / len(values) if values else None
+
+
+# Scores one variant over the pages, returns the summary and the per-page results
+def evaluate(variant, pages):
+    per_page = []
+    for name, gray, count, truth, reference in pages:
+        start = time.perf_counter()
+        found = variant_boxes(variant, gray)
+        seconds = time.perf_counter() - start
+        result = {"page": name, "count": len(found), "true_count": count, "ms": seconds * 1000}
+        if truth:
+            ious = match_boxes(truth, found)
+            result["mean_iou"] = sum(ious) / len(ious)
+            result["recall"] = sum(1 for iou in ious if iou >= MATCH_IOU) / len(ious)
+        if reference:
+            ious = match_boxes(reference, found)
+            result["agreement"] = sum(ious) / len(ious)
+        per_page.append(result)
+
+    summary = {
+        "pages": len(per_page),
+        "count_accuracy": sum(1 for r in per_page if r["count"] == r["true_count"]) / len(per_page),
+        "mean_count_error": sum(abs(r["count"] - r["true_count"]) for r in per_page) / len(per_page),
+        "mean_iou": _mean([r["mean_iou"] for r in per_page if "mean_iou" in r]),
+        "recall": _mean([r["recall"] for r in per_page if "recall" in r]),
+        "agreement": _mean([r["agreement"] for r in per_page if "agreement" in r]),
+        "ms_per_page": sum(r["ms"] for r in per_page) / len(per_page),
+    }
+    return summary, per_page
+
+
+# Saves the boxes a variant finds on the sample pages as their reference boxes
+def record_reference(variant, path=REFERENCE_PATH):
+    reference = load_reference(path)
+    for name, page in reference["pages"].items():
+        gray = cv2.imread(name, cv2.IMREAD_GRAYSCALE)
+        page["reference_boxes"] = [[int(v) for v in box] for box in variant_boxes(variant, gray)]
+    reference["reference_variant"] = variant
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(reference, f, indent=1)
+
+
+def _format(value, spec):
+    return "-" if value is None else format(value, spec)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check the paragraph extractors against true counts and boxes, "
+                                                 "and their agreement with a reference output")
+    parser.add_argument("--variants", nargs="+", default=VARIANTS, help="old_full, old_full@<scale> or main")
+    parser.add_argument("--synthetic", type=int, default=SYNTHETIC_PAGES, help="amount of synthetic pages")
+    parser.add_argument("--reference", default=REFERENCE_PATH, help="hand counts and reference boxes of the sample pages")
+    parser.add_argument("--record", metavar="VARIANT", help="save this variant's boxes as the reference boxes and stop")
+    parser.add_argument("--pages", action="store_true", help="also print every page")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.record:
+        record_reference(args.record, args.reference)
+        print(f"Reference boxes of {args.record} saved to {args.reference}")
+    else:
+        reference = load_reference(args.reference)
+        pages = test_pages(reference, args.synthetic)
+        results = {}
+        print("count ok / err: against the hand counts and the synthetic pages")
+        print("mean IoU / recall: against the true boxes of the synthetic pages")
+        print(f"agreement: mean IoU against the boxes of {reference.get('reference_variant')} on the sample pages (not accuracy)\n")
+        print(f"{'variant':14s} {'count ok':>9s} {'count err':>10s} {'mean IoU':>9s} {'recall':>7s} {'agreement':>10s} {'ms/page':>8s}")
+        for variant in args.variants:
+            summary, per_page = evaluate(variant, pages)
+            results[variant] = {"summary": summary, "pages": per_page}
+            print(f"{variant:14s} {summary['count_accuracy']:9.0%} {summary['mean_count_error']:10.2f} "
+                  f"{_format(summary['mean_iou'], '9.3f')} {_format(summary['recall'], '7.0%')} "
+                  f"{_format(summary['agreement'], '10.3f')} {summary['ms_per_page']:8.1f}")
+            if args.pages:
+                for r in per_page:
+                    print(f"   {os.path.basename(r['page']):10s} {r['count']:3d}/{r['true_count']:<3d} "
+                          f"IoU {_format(r.get('mean_iou'), '.3f')} agreement {_format(r.get('agreement'), '.3f')} "
+                          f"{r['ms']:.1f} ms")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic test data for the benchmarks and the segmentation checks
+
+make_video writes a clip with face-like patches moving over a dark or bright background,
+make_page draws a multi-column page of fake text (and optionally a table) and returns the
+true box of every paragraph. Everything is generated from a seed, so runs are repeatable.
+"""
+import cv2
+import numpy as np
+
+# Page layout, in pixels, roughly matching the 200 dpi scans in "Converted Paper (8)"
+PAGE_SIZE = (1654, 2339)
+PAGE_MARGIN = 140
+COLUMN_GAP = 80
+LINE_PITCH = 40
+TEXT_HEIGHT = 24
+PARAGRAPH_GAP = 90
+
+
+# Draws a simple face (skin coloured ellipse with eyes and a mouth) centred on (cx, cy)
+def draw_face(frame, cx, cy, size):
+    w, h = size // 2, int(size * 0.65)
+    cv2.ellipse(frame, (cx, cy), (w, h), 0, 0, 360, (150, 170, 215), -1)
+    eye_y = cy - h // 4
+    for ex in (cx - w // 2, cx + w // 2):
+        cv2.ellipse(frame, (ex, eye_y), (max(w // 5, 1), max(h // 10, 1)), 0, 0, 360, (40, 40, 40), -1)
+    cv2.ellipse(frame, (cx, cy + h // 2), (max(w // 2, 1), max(h // 8, 1)), 0, 0, 180, (60, 50, 120), -1)
+
+
+# Makes the frames of a synthetic clip: size = (width, height), dark = night time background
+# faces = amount of face patches, each moving along its own straight path (bouncing off the edges)
+def make_frames(size, frames, dark=False, faces=2, seed=0):
+    width, height = size
+    rng = np.random.default_rng(seed)
+    level = 35 if dark else 170
+
+    # background: brightness gradient with some noise, so it is not trivially compressible
+    gradient = np.linspace(level - 20, level + 20, width, dtype=np.float32)
+    background = np.repeat(gradient[None, :], height, axis=0)
+    background = np.clip(background + rng.normal(0, 6, (height, width)), 0, 255).astype(np.uint8)
+    background = cv2.merge([background, background, background])
+
+    face_size = max(height // 6, 16)
+    positions = rng.uniform([face_size, face_size], [width - face_size, height - face_size], (faces, 2))
+    speeds = rng.uniform(-6, 6, (faces, 2)) * width / 640
+
+    for _ in range(frames):
+        frame = background.copy()
+        for i in range(faces):
+            positions[i] += speeds[i]
+            for axis, limit in ((0, width), (1, height)):
+                if not face_size <= positions[i, axis] <= limit - face_size:
+                    speeds[i, axis] *= -1
+                    positions[i, axis] = np.clip(positions[i, axis], face_size, limit - face_size)
+            draw_face(frame, int(positions[i, 0]), int(positions[i, 1]), face_size)
+        yield frame
+
+
+# Writes a synthetic clip to path (see make_frames), returns the path
+def make_video(path, size, frames, fps=25, dark=False, faces=2, seed=0):
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size)
+    for frame in make_frames(size, frames, dark, faces, seed):
+        out.write(frame)
+    out.release()
+    return path
+
+
+# Draws one line of fake words (black blocks) from x0 to x1 with its top at y
+def _draw_text_line(page, x0, x1, y, rng, last=False):
+    if last:
+        x1 = x0 + int((x1 - x0) * rng.uniform(0.3, 0.9))
+    x = x0
+    while x < x1:
+        word = int(rng.integers(25, 110))
+        end = min(x + word, x1)
+        # letters: small blocks with gaps between them, some sticking up like capitals or ascenders
+        lx = x
+        while lx < end:
+            lw = int(rng.integers(6, 12))
+            top = y if rng.random() < 0.25 else y + 6
+            page[top:y + TEXT_HEIGHT, lx:min(lx + lw, end)] = 0
+            lx += lw + int(rng.integers(3, 6))
+        x = end + int(rng.integers(10, 18))
+
+
+# Draws a table of rows x cols cells with its top left corner at (x0, y0), returns its box
+def _draw_table(page, x0, y0, x1, rows, cols, rng):
+    row_h = LINE_PITCH
+    y1 = y0 + rows * row_h
+    for r in range(rows + 1):
+        page[min(y0 + r * row_h, y1):min(y0 + r * row_h, y1) + 2, x0:x1 + 2] = 0
+    edges = np.linspace(x0, x1, cols + 1).astype(int)
+    for x in edges:
+        page[y0:y1 + 2, x:x + 2] = 0
+    for r in range(rows):
+        for c in range(cols):
+            cx0, cx1 = edges[c] + 15, edges[c + 1] - 15
+            if cx1 - cx0 > 30:
+                _draw_text_line(page, cx0, cx0 + int((cx1 - cx0) * rng.uniform(0.4, 0.9)), y0 + r * row_h + 8, rng)
+    return (x0, y0, x1 - x0 + 2, y1 - y0 + 2)
+
+
+# Makes a synthetic page: a grayscale image with `columns` columns of paragraphs
+# table = draw a table across the top of the page first
+# Returns the image and the true (x, y, w, h) box of every paragraph (and the table) in reading order
+def make_page(columns=2, size=PAGE_SIZE, table=False, seed=0):
+    width, height = size
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width), 255, np.uint8)
+    boxes = []
+
+    top = PAGE_MARGIN
+    if table:
+        boxes.append(_draw_table(page, PAGE_MARGIN, top, width - PAGE_MARGIN, int(rng.integers(3, 6)),
+                                 int(rng.integers(3, 7)), rng))
+        top = boxes[-1][1] + boxes[-1][3] + 60
+
+    col_w = (width - 2 * PAGE_MARGIN - (columns - 1) * COLUMN_GAP) // columns
+    for c in range(columns):
+        x0 = PAGE_MARGIN + c * (col_w + COLUMN_GAP)
+        x1 = x0 + col_w
+        y = top
+        while True:
+            lines = int(rng.integers(4, 12))
+            if y + lines * LINE_PITCH > height - PAGE_MARGIN:
+                break
+            for i in range(lines):
+                _draw_text_line(page, x0, x1, y + i * LINE_PITCH, rng, last=(i == lines - 1))
+            # true box: the ink of the paragraph
+            ys, xs = np.nonzero(page[y:y + lines * LINE_PITCH, x0:x1] == 0)
+            boxes.append((x0 + int(xs.min()), y + int(ys.min()), int(xs.max() - xs.min()) + 1, int(ys.max() - ys.min()) + 1))
+            y += lines * LINE_PITCH + PARAGRAPH_GAP
+
+    return page, boxes
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+# Small synthetic clip, written once per test session
+@pytest.fixture(scope="session")
+def small_video(tmp_path_factory):
+    from synthetic_data import make_video
+    path = str(tmp_path_factory.mktemp("video") / "clip.mp4")
+    make_video(path, (160, 120), 20, dark=True, seed=3)
+    return path
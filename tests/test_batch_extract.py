@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+import os
+import cv2
+import numpy as np
+from batch_extract import run_batch
+from page_source import find_pages, output_names, read_page
+from synthetic_data import make_page
+
+
+def test_same_file_name_in_two_folders_keeps_both(tmp_path):
+    pages = []
+    for i, folder in enumerate(["a", "b"]):
+        os.makedirs(tmp_path / folder)
+        path = str(tmp_path / folder / "001.png")
+        cv2.imwrite(path, make_page(columns=1 + i, seed=30 + i)[0])
+        pages.append(path)
+    output = str(tmp_path / "out")
+    results = run_batch(pages, "main", output, workers=1)
+    for folder, result in zip(["a", "b"], results):
+        assert result["error"] is None
+        written = sorted(os.listdir(os.path.join(output, folder, "001")))
+        assert len(written) == result["paragraphs"] > 0
+        assert written[0] == "001_paragraph_1.png"
+
+
+def test_output_names_are_unique(tmp_path):
+    refs = [(str(tmp_path / "a" / "001.png"), None),
+            (str(tmp_path / "b" / "001.png"), None),
+            (str(tmp_path / "a" / "scan.png"), None),
+            (str(tmp_path / "a" / "scan.jpg"), None),
+            (str(tmp_path / "a" / "book.tif"), 0),
+            (str(tmp_path / "a" / "book.tif"), 1)]
+    names = output_names(refs)
+    assert len(set(names.values())) == len(refs)
+    assert names[refs[0]] == os.path.join("a", "001")
+    assert names[refs[1]] == os.path.join("b", "001")
+    assert names[refs[4]] == os.path.join("a", "book_p001")
+    assert names[refs[2]].startswith(os.path.join("a", "scan_"))
+
+
+def test_pages_of_one_folder_keep_their_stem(tmp_path):
+    refs = [(str(tmp_path / "001.png"), None), (str(tmp_path / "002.png"), None)]
+    assert output_names(refs) == {refs[0]: "001", refs[1]: "002"}
+
+
+def test_npy_pages_are_found(tmp_path):
+    np.save(str(tmp_path / "scroll.npy"), np.zeros((4, 4), np.uint8))
+    (tmp_path / "notes.txt").write_text("")
+    assert find_pages([str(tmp_path)]) == [str(tmp_path / "scroll.npy")]
+    assert find_pages([str(tmp_path / "*")]) == [str(tmp_path / "scroll.npy")]
+    assert find_pages([str(tmp_path / "scroll.npy")]) == [str(tmp_path / "scroll.npy")]
+    assert isinstance(read_page((str(tmp_path / "scroll.npy"), None)), np.memmap)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import cv2
+import numpy as np
+import pytest
+from script_loader import load_script
+
+blur = load_script("blur")
+
+
+def _frame(seed=0, size=(320, 240)):
+    return np.random.default_rng(seed).integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+
+
+def _untouched_outside(before, after, x0, y0, x1, y1):
+    outside = np.ones(before.shape[:2], bool)
+    outside[y0:y1, x0:x1] = False
+    return np.array_equal(before[outside], after[outside])
+
+
+# regions in the middle, against every edge and corner, and bigger than the kernel
+@pytest.mark.parametrize("region", [(100, 80, 160, 140), (0, 0, 40, 30), (280, 200, 320, 240),
+                                    (0, 100, 320, 130), (150, 0, 170, 240), (10, 10, 310, 230)])
+def test_box_blur_of_the_region_matches_blurring_the_whole_frame(region):
+    x0, y0, x1, y1 = region
+    frame = _frame()
+    expected = cv2.blur(frame, (blur.BLUR_KERNEL, blur.BLUR_KERNEL))
+    result = frame.copy()
+    blur.blur_region(result, x0, y0, x1, y1, "box")
+    assert np.array_equal(result[y0:y1, x0:x1], expected[y0:y1, x0:x1])
+    assert _untouched_outside(frame, result, x0, y0, x1, y1)
+
+
+def test_mosaic_fills_every_block_with_its_mean():
+    frame = _frame(1)
+    x0, y0 = 37, 21
+    w, h = 4 * blur.MOSAIC_BLOCK, 3 * blur.MOSAIC_BLOCK
+    result = frame.copy()
+    blur.blur_region(result, x0, y0, x0 + w, y0 + h, "mosaic")
+    block = blur.MOSAIC_BLOCK
+    for by in range(0, h, block):
+        for bx in range(0, w, block):
+            cell = result[y0 + by:y0 + by + block, x0 + bx:x0 + bx + block].reshape(-1, 3)
+            mean = frame[y0 + by:y0 + by + block, x0 + bx:x0 + bx + block].reshape(-1, 3).mean(axis=0)
+            assert (cell == cell[0]).all()
+            assert np.abs(cell[0] - mean).max() <= 1
+    assert _untouched_outside(frame, result, x0, y0, x0 + w, y0 + h)
+
+
+def test_pyramid_smooths_the_region_and_keeps_its_brightness():
+    frame = _frame(2)
+    result = frame.copy()
+    blur.blur_region(result, 50, 40, 178, 168, "pyramid")
+    roi, original = result[40:168, 50:178].astype(float), frame[40:168, 50:178].astype(float)
+    assert roi.std() < original.std() / 5
+    assert np.abs(roi.mean(axis=(0, 1)) - original.mean(axis=(0, 1))).max() < 3
+    assert _untouched_outside(frame, result, 50, 40, 178, 168)
+
+
+@pytest.mark.parametrize("mode", ["box", "mosaic", "pyramid"])
+def test_tiny_regions_are_blurred_without_errors(mode):
+    frame = _frame(3)
+    for region in [(10, 10, 11, 11), (10, 10, 60, 11), (10, 10, 11, 60)]:
+        result = frame.copy()
+        blur.blur_region(result, *region, mode)
+        assert _untouched_outside(frame, result, *region)
+
+
+@pytest.mark.parametrize("face", [(0, 0, 60, 60), (280, 200, 60, 60), (-20, 100, 60, 60), (130, 90, 60, 60)])
+def test_padding_is_clamped_to_the_frame(face):
+    frame = _frame(4)
+    x, y, w, h = face
+    padding = 0.5
+    px, py = int(w * padding / 2), int(h * padding / 2)
+    x0, y0 = max(x - px, 0), max(y - py, 0)
+    x1, y1 = min(x + w + px, 320), min(y + h + py, 240)
+    expected = frame.copy()
+    blur.blur_region(expected, x0, y0, x1, y1, "box")
+    result = blur.blur_face(frame.copy(), [face], mode="box", padding=padding)
+    assert np.array_equal(result, expected)
+    assert not np.array_equal(result[y0:y1, x0:x1], frame[y0:y1, x0:x1])
+
+
+def test_face_outside_the_frame_changes_nothing():
+    frame = _frame(5)
+    assert np.array_equal(blur.blur_face(frame.copy(), [(400, 300, 50, 50)], mode="box"), frame)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import cv2
+import numpy as np
+import pytest
+import brightness_manipulation as bm
+
+
+def _write(path, levels, size=(64, 48)):
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 25, size)
+    for level in levels:
+        out.write(np.full((size[1], size[0], 3), level, np.uint8))
+    out.release()
+    return path
+
+
+def test_spread_order_covers_every_sample_once():
+    for count in (1, 2, 5, 30, 64):
+        order = bm.spread_order(count)
+        assert sorted(order) == list(range(count))
+    order = bm.spread_order(30)
+    assert order[:4] == [0, 16, 8, 24]
+    assert order[4:8] == [4, 12, 20, 28]
+
+
+def test_early_exit_looks_at_the_whole_video(tmp_path):
+    # dark start, bright rest: sampling from the start only would stop early and call it night
+    path = _write(str(tmp_path / "clip.avi"), [20] * 20 + [200] * 70)
+    assert not bm.is_nighttime(path, 30, 100)
+    assert bm.is_nighttime(_write(str(tmp_path / "night.avi"), [20] * 70 + [200] * 20), 30, 100)
+
+
+def test_samples_of_a_level_are_grabbed_to(tmp_path, monkeypatch):
+    path = _write(str(tmp_path / "long.avi"), np.random.default_rng(0).integers(60, 140, 900))
+    calls = {"set": 0, "grab": 0}
+
+    class Counting:
+        def __init__(self, path):
+            self.vid = cv2.VideoCapture(path)
+
+        def get(self, prop):
+            return self.vid.get(prop)
+
+        def set(self, prop, value):
+            calls["set"] += 1
+            return self.vid.set(prop, value)
+
+        def grab(self):
+            calls["grab"] += 1
+            return self.vid.grab()
+
+        def read(self):
+            return self.vid.read()
+
+        def release(self):
+            self.vid.release()
+    monkeypatch.setattr(bm, "open_video", Counting)
+    # never stop early, so all 30 samples are taken
+    monkeypatch.setattr(bm, "min_samples", 1000)
+    bm.is_nighttime(path, 30, 100)
+    # 900 frames, a sample every 30: the last two levels (7 and 15 samples, 120 and 60 frames apart)
+    # seek once each and grab the rest, the coarser levels (1 + 2 + 4 samples) are further apart than
+    # max_grab_stride and seek to every sample but the first one at frame 0
+    assert calls["set"] == 9
+    assert calls["grab"] == 6 * 119 + 14 * 59
+
+
+def test_capture_is_released_when_nothing_can_be_read(tmp_path, monkeypatch):
+    released = []
+
+    class Broken:
+        def get(self, prop):
+            return 10.0
+
+        def set(self, prop, value):
+            return True
+
+        def grab(self):
+            return False
+
+        def read(self):
+            return False, None
+
+        def release(self):
+            released.append(True)
+    monkeypatch.setattr(bm, "open_video", lambda path: Broken())
+    with pytest.raises(ValueError):
+        bm.is_nighttime("clip.avi", 5, 100)
+    assert released == [True]
+
+
+def test_replay_capture_gives_the_decoded_frames_first():
+    class Rest:
+        def read(self):
+            return True, "rest"
+    cap = bm.ReplayCapture([1, 2, 3], Rest())
+    assert [cap.read()[1] for _ in range(5)] == [1, 2, 3, "rest", "rest"]
+
+
+@pytest.mark.parametrize("contrast, brightness", [(1.2, 50), (1.0, 0), (0.5, -20), (2.5, 10), (-1.0, 30)])
+def test_lut_matches_convert_scale_abs(contrast, brightness):
+    values = np.arange(256, dtype=np.uint8).reshape(16, 16)
+    expected = cv2.convertScaleAbs(values, alpha=contrast, beta=brightness)
+    assert np.array_equal(bm.brightness_lut(contrast, brightness).reshape(16, 16), expected)
+
+    frame = np.random.default_rng(1).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    expected = cv2.convertScaleAbs(frame, alpha=contrast, beta=brightness)
+    assert np.array_equal(bm.adjust_brightness(frame, contrast, brightness), expected)
+    copy = frame.copy()
+    assert bm.apply_lut(copy, bm.brightness_lut(contrast, brightness)) is copy
+    assert np.array_equal(copy, expected)
+
+
+def _frame(level, size=(320, 240)):
+    return np.full((size[1], size[0], 3), level, np.uint8)
+
+
+def test_adaptive_leaves_day_frames_alone():
+    adaptive = bm.AdaptiveBrightness(100)
+    assert np.array_equal(adaptive.update(_frame(150)), np.arange(256))
+
+
+def test_adaptive_brightens_dark_frames():
+    lut = bm.AdaptiveBrightness(100, max_gain=2.0).update(_frame(50))
+    assert lut[0] == 0 and lut[255] == 255
+    assert np.all(np.diff(lut.astype(int)) >= 0)
+    # gain 2 takes 50 to 100, the gamma curve then moves it towards the target of 110
+    assert 100 < lut[50] <= 110
+
+
+def test_adaptive_smooths_over_the_window():
+    adaptive = bm.AdaptiveBrightness(100, window=4)
+    for _ in range(4):
+        adaptive.update(_frame(40))
+    # one bright frame only moves the window mean to 80, still night
+    assert not np.array_equal(adaptive.update(_frame(200)), np.arange(256))
+    # the second one moves it to 120
+    assert np.array_equal(adaptive.update(_frame(200)), np.arange(256))
+    assert len(adaptive.histograms) == 4
+
+
+def test_adaptive_recalculates_only_after_a_shift():
+    adaptive = bm.AdaptiveBrightness(100, window=1, shift=8)
+    first = adaptive.update(_frame(40))
+    assert adaptive.update(_frame(44)) is first
+    assert adaptive.update(_frame(36)) is first
+    assert adaptive.updates == 1
+    assert adaptive.update(_frame(60)) is not first
+    assert adaptive.updates == 2
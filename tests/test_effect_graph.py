@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import effect_graph
+from effect_graph import Stage, BlurStage, VideoInfo, _prepare_all, _apply_all
+from frame_pipeline import process_frames
+from script_loader import load_script
+
+INFO = VideoInfo("clip.mp4", 32, 24, 25.0, 10)
+
+
+# Adds a value to every pixel
+class AddStage(Stage):
+    def __init__(self, value):
+        super().__init__({}, INFO)
+        self.value = value
+
+    def apply(self, frame, prepared):
+        frame += self.value
+        return frame
+
+
+# Remembers the mean of every frame its prepare step sees, and writes it into the frame
+class MeasureStage(Stage):
+    def __init__(self):
+        super().__init__({}, INFO)
+        self.seen = []
+
+    def prepare(self, frame):
+        self.seen.append(int(frame.mean()))
+        return self.seen[-1]
+
+    def apply(self, frame, prepared):
+        frame[0, 0] = prepared
+        return frame
+
+
+class _Frames:
+    def __init__(self, count):
+        self.frames = [np.full((24, 32, 3), i, np.uint8) for i in range(count)]
+
+    def read(self):
+        if not self.frames:
+            return False, None
+        return True, self.frames.pop(0)
+
+
+def _run(stages, count=8):
+    return list(process_frames(_Frames(count), _apply_all(stages), 4, 4, prepare=_prepare_all(stages)))
+
+
+def test_prepare_sees_the_output_of_earlier_stages():
+    measure = MeasureStage()
+    frames = _run([AddStage(10), measure, AddStage(1)])
+    assert measure.seen == [i + 10 for i in range(8)]
+    for i, frame in enumerate(frames):
+        assert frame[0, 0, 0] == i + 10 + 1
+        assert frame[1, 1, 0] == i + 11
+
+
+def test_stages_after_the_last_prepare_run_on_the_workers():
+    stages = [AddStage(1), MeasureStage(), AddStage(2), AddStage(3)]
+    ordered, parallel = effect_graph._split(stages)
+    assert ordered == stages[:1]
+    assert parallel == stages[1:]
+
+
+def test_prepare_that_ignores_the_frame_does_not_hold_stages_back():
+    class Clip(Stage):
+        prepare_reads_frame = False
+
+        def prepare(self, frame):
+            return None
+    stages = [AddStage(1), Clip({}, INFO)]
+    assert effect_graph._split(stages) == ([], stages)
+    frames = _run(stages, 3)
+    assert [int(frame[0, 0, 0]) for frame in frames] == [1, 2, 3]
+
+
+def test_blur_stages_keep_their_own_settings():
+    blur = load_script("blur")
+    before = (blur.BLUR_MODE, blur.BLUR_PADDING, blur.DETECT_SCALE, blur.cascadePATH)
+    mosaic = BlurStage({"mode": "mosaic", "padding": 0.5, "temporal": False}, INFO)
+    box = BlurStage({"mode": "box", "padding": 0.0, "temporal": False}, INFO)
+    assert (blur.BLUR_MODE, blur.BLUR_PADDING, blur.DETECT_SCALE, blur.cascadePATH) == before
+
+    frame = np.random.default_rng(0).integers(0, 256, (60, 80, 3), np.uint8)
+    faces = [(20, 10, 30, 30)]
+    expected_mosaic = frame.copy()
+    blur.blur_region(expected_mosaic, 13, 3, 57, 47, "mosaic")
+    expected_box = frame.copy()
+    blur.blur_region(expected_box, 20, 10, 50, 40, "box")
+    assert np.array_equal(mosaic.apply(frame.copy(), faces), expected_mosaic)
+    assert np.array_equal(box.apply(frame.copy(), faces), expected_box)
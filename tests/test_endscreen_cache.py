@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import numpy as np
+import pytest
+import endscreen_cache
+from endscreen_cache import iter_endscreen_frames, load_endscreen
+
+
+@pytest.fixture(autouse=True)
+def fresh_process(monkeypatch):
+    # every test starts like a new worker process, with only the disk cache to go on
+    monkeypatch.setattr(endscreen_cache, "_loaded", {})
+
+
+def _raw_files(cache_dir):
+    return sorted(name for name in os.listdir(cache_dir) if name.endswith(".raw"))
+
+
+def test_cached_frames_match_decoded(small_video, tmp_path):
+    frames = load_endscreen(small_video, (80, 60), 25, cache_dir=str(tmp_path))
+    expected = np.stack(list(iter_endscreen_frames(small_video, (80, 60), 25)))
+    assert np.array_equal(np.asarray(frames), expected)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_second_process_maps_the_same_file(small_video, tmp_path, monkeypatch):
+    load_endscreen(small_video, (80, 60), 25, cache_dir=str(tmp_path))
+    monkeypatch.setattr(endscreen_cache, "_loaded", {})
+    monkeypatch.setattr(endscreen_cache, "_write_raw", lambda *args: pytest.fail("decoded again"))
+    frames = load_endscreen(small_video, (80, 60), 25, cache_dir=str(tmp_path))
+    assert len(frames) == 20
+    assert len(_raw_files(tmp_path)) == 1
+
+
+def test_changed_endscreen_is_decoded_again(small_video, tmp_path):
+    load_endscreen(small_video, (80, 60), 25, cache_dir=str(tmp_path))
+    stat = os.stat(small_video)
+    os.utime(small_video, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    try:
+        load_endscreen(small_video, (80, 60), 25, cache_dir=str(tmp_path))
+    finally:
+        os.utime(small_video, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert len(_raw_files(tmp_path)) == 2
+
+
+def test_least_recently_used_file_is_evicted(small_video, tmp_path):
+    one = 20 * 80 * 60 * 3
+    cache = dict(cache_dir=str(tmp_path), cache_max_bytes=2 * one + one // 2)
+    load_endscreen(small_video, (80, 60), 25, **cache)
+    first = _raw_files(tmp_path)
+    time.sleep(0.05)
+    load_endscreen(small_video, (60, 80), 25, **cache)
+    time.sleep(0.05)
+    # using the first one again makes the second the least recently used
+    endscreen_cache._loaded.clear()
+    load_endscreen(small_video, (80, 60), 25, **cache)
+    second = [name for name in _raw_files(tmp_path) if name not in first]
+    time.sleep(0.05)
+    load_endscreen(small_video, (40, 180), 25, **cache)
+    files = _raw_files(tmp_path)
+    assert len(files) == 2
+    assert first[0] in files and second[0] not in files
+    assert sum(os.path.getsize(os.path.join(tmp_path, name)) for name in files) <= cache["cache_max_bytes"]
+
+
+def test_clip_over_the_cache_size_is_streamed(small_video, tmp_path):
+    frames = load_endscreen(small_video, (80, 60), 25, cache_dir=str(tmp_path), cache_max_bytes=1000)
+    assert not isinstance(frames, np.ndarray)
+    assert len(list(frames)) == 20
+    assert _raw_files(tmp_path) == []
+
+
+def test_failed_decode_leaves_no_file(small_video, tmp_path, monkeypatch):
+    def broken(*args):
+        yield np.zeros((60, 80, 3), np.uint8)
+        raise RuntimeError("decoder died")
+    monkeypatch.setattr(endscreen_cache, "iter_endscreen_frames", broken)
+    with pytest.raises(RuntimeError):
+        load_endscreen(small_video, (80, 60), 25, cache_dir=str(tmp_path))
+    assert os.listdir(tmp_path) == []
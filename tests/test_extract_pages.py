@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import os
+import cv2
+import numpy as np
+import pytest
+import paragraph_extract_old_full as old_full
+from synthetic_data import make_page
+
+
+@pytest.fixture
+def book(tmp_path, monkeypatch):
+    pages = [make_page(columns=1 + i % 2, seed=40 + i)[0] for i in range(3)]
+    path = str(tmp_path / "book.tif")
+    assert cv2.imwritemulti(path, pages)
+    output = str(tmp_path / "out")
+    os.makedirs(output)
+    monkeypatch.setattr(old_full, "output_dir", output)
+    monkeypatch.setattr(old_full, "layout_index_path", os.path.join(output, "layout_index.json"))
+    monkeypatch.setattr(old_full, "image_folder", [path])
+    return path, pages
+
+
+def _crops(output, stem):
+    names = sorted(name for name in os.listdir(output) if name.startswith(stem + "_para_"))
+    return [cv2.imread(os.path.join(output, name), cv2.IMREAD_GRAYSCALE) for name in names]
+
+
+@pytest.mark.parametrize("use_cache", [True, False])
+def test_every_page_of_a_tiff_is_extracted(book, monkeypatch, use_cache):
+    monkeypatch.setattr(old_full, "use_layout_cache", use_cache)
+    old_full.main()
+    _, pages = book
+    for i, gray in enumerate(pages):
+        expected = old_full.extract_paragraphs(gray)[1]
+        crops = _crops(old_full.output_dir, f"book_p{i + 1:03d}")
+        assert len(crops) == len(expected) > 0
+        assert all(np.array_equal(crop, para) for crop, para in zip(crops, expected))
+
+
+def test_unchanged_tiff_pages_are_skipped(book, capsys):
+    old_full.main()
+    capsys.readouterr()
+    old_full.main()
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 3 and all(line.endswith("(unchanged)") for line in lines)
+
+
+def test_missing_page_is_reported(tmp_path, monkeypatch):
+    monkeypatch.setattr(old_full, "use_layout_cache", False)
+    monkeypatch.setattr(old_full, "image_folder", [str(tmp_path / "missing.png")])
+    with pytest.raises(FileNotFoundError):
+        old_full.main()
+
+
+@pytest.mark.parametrize("use_cache", [True, False])
+def test_npy_page_is_extracted_in_strips(tmp_path, monkeypatch, use_cache):
+    gray = np.vstack([make_page(columns=2, seed=60)[0], make_page(columns=1, seed=61)[0]])
+    path = str(tmp_path / "scroll.npy")
+    np.save(path, gray)
+    output = str(tmp_path / "out")
+    os.makedirs(output)
+    monkeypatch.setattr(old_full, "output_dir", output)
+    monkeypatch.setattr(old_full, "layout_index_path", os.path.join(output, "layout_index.json"))
+    monkeypatch.setattr(old_full, "image_folder", [path])
+    monkeypatch.setattr(old_full, "use_layout_cache", use_cache)
+    monkeypatch.setattr(old_full, "STRIP_HEIGHT", 256)
+    old_full.main()
+    expected = old_full.extract_paragraphs(gray)[1]
+    crops = _crops(output, "scroll")
+    assert len(crops) == len(expected) > 0
+    assert all(np.array_equal(crop, para) for crop, para in zip(crops, expected))
+
+
+def test_unreadable_entry_is_reported(tmp_path, monkeypatch):
+    path = tmp_path / "notes.txt"
+    path.write_text("not a page")
+    monkeypatch.setattr(old_full, "use_layout_cache", False)
+    monkeypatch.setattr(old_full, "image_folder", [str(path)])
+    with pytest.raises(FileNotFoundError):
+        old_full.main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from face_tracking import FaceTracker
+
+SIZE = (320, 240)
+FACE = 48
+
+
+# A textured face moving speed pixels per frame over a still noisy background
+# Returns the frames and the true face box of every frame
+def _sequence(count, start=(40, 40), speed=(4, 4), seed=0):
+    rng = np.random.default_rng(seed)
+    background = rng.integers(90, 130, (SIZE[1], SIZE[0], 3), dtype=np.uint8)
+    # blocks of 8 pixels, so the texture is still there on the tracker's quarter size copy
+    face = np.kron(rng.integers(0, 256, (FACE // 8, FACE // 8, 3)), np.ones((8, 8, 1))).astype(np.uint8)
+    frames, boxes = [], []
+    for i in range(count):
+        x, y = start[0] + speed[0] * i, start[1] + speed[1] * i
+        frame = background.copy()
+        frame[y:y + FACE, x:x + FACE] = face
+        frames.append(frame)
+        boxes.append((x, y, FACE, FACE))
+    return frames, boxes
+
+
+# Detector that finds the true box of the frame it is given, and remembers when it was called
+class _Oracle:
+    def __init__(self, frames, boxes):
+        self.truth = {id(frame): box for frame, box in zip(frames, boxes)}
+        self.calls = []
+        self.missing = set()
+
+    def __call__(self, frame):
+        index = list(self.truth).index(id(frame))
+        self.calls.append(index)
+        return [] if index in self.missing else [self.truth[id(frame)]]
+
+
+def _iou(a, b):
+    iw = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    ih = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    inter = max(iw, 0) * max(ih, 0)
+    return inter / float(a[2] * a[3] + b[2] * b[3] - inter)
+
+
+def _contains(outer, inner):
+    return (outer[0] <= inner[0] and outer[1] <= inner[1] and
+            outer[0] + outer[2] >= inner[0] + inner[2] and outer[1] + outer[3] >= inner[1] + inner[3])
+
+
+def test_detector_runs_on_keyframes_only():
+    frames, boxes = _sequence(23)
+    oracle = _Oracle(frames, boxes)
+    tracker = FaceTracker(oracle, interval=5, motion_threshold=None)
+    for frame in frames:
+        tracker.update(frame)
+    assert oracle.calls == [0, 5, 10, 15, 20]
+    assert (tracker.frames, tracker.detections, tracker.detections_saved) == (23, 5, 18)
+    assert tracker.report() == "23 frames, 5 detections, 18 detections saved (78.3%)"
+
+
+def test_tracked_boxes_follow_the_face_like_detection_every_frame():
+    frames, boxes = _sequence(22)
+    oracle = _Oracle(frames, boxes)
+    # no padding and no keyframes after the first one, so the boxes come from the template matching alone
+    tracker = FaceTracker(oracle, interval=1000, motion_threshold=None, padding=0.0)
+    for frame, truth in zip(frames, boxes):
+        tracked = tracker.update(frame)
+        assert len(tracked) == 1
+        assert _iou(tracked[0], truth) > 0.85
+    assert oracle.calls == [0]
+    # the face moved 84 pixels, the box of the first frame no longer covers it
+    assert _iou(boxes[0], boxes[-1]) == 0
+
+
+def test_padded_boxes_cover_the_face_between_keyframes():
+    frames, boxes = _sequence(22)
+    tracker = FaceTracker(_Oracle(frames, boxes), interval=10)
+    for frame, truth in zip(frames, boxes):
+        assert _contains(tracker.update(frame)[0], truth)
+
+
+def test_padding_grows_with_the_time_since_the_detection():
+    frames, boxes = _sequence(10, speed=(0, 0))
+    tracker = FaceTracker(_Oracle(frames, boxes), interval=10, motion_threshold=None, padding=0.2)
+    widths = [tracker.update(frame)[0][2] for frame in frames]
+    assert widths == sorted(widths) and widths[-1] > widths[0]
+    # grow = padding * (1 + frames since the detection / interval)
+    assert abs(widths[0] - FACE * 1.2) <= 1
+    assert abs(widths[9] - FACE * (1 + 0.2 * 1.9)) <= 1
+
+
+def test_large_change_forces_a_detection():
+    frames, boxes = _sequence(12, speed=(0, 0))
+    # a scene cut at frame 7: everything gets much brighter
+    for i in range(7, 12):
+        frames[i] = np.clip(frames[i].astype(int) + 80, 0, 255).astype(np.uint8)
+    oracle = _Oracle(frames, boxes)
+    tracker = FaceTracker(oracle, interval=100, motion_threshold=12.0)
+    for frame in frames:
+        tracker.update(frame)
+    assert oracle.calls == [0, 7]
+
+
+def test_missed_face_is_kept_for_one_keyframe():
+    frames, boxes = _sequence(16, speed=(0, 0))
+    oracle = _Oracle(frames, boxes)
+    oracle.missing = {5, 10}
+    tracker = FaceTracker(oracle, interval=5, motion_threshold=None)
+    results = [tracker.update(frame) for frame in frames]
+    # missed at frame 5: still blurred, missed again at 10: dropped, found again at 15
+    assert len(results[5]) == 1 and len(results[9]) == 1
+    assert results[10] == [] and len(results[15]) == 1
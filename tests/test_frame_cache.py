@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+import textwrap
+import cv2
+import numpy as np
+import frame_cache
+from instrumentation import metrics
+
+
+def _decoded(path):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return np.stack(frames)
+
+
+def _counter(name):
+    return metrics.snapshot()["counters"].get(name, 0)
+
+
+def test_cached_frames_match_decoded(small_video, tmp_path):
+    frames, fps = frame_cache.load_frames(small_video, cache_dir=str(tmp_path))
+    assert np.array_equal(np.asarray(frames), _decoded(small_video))
+    assert fps > 0
+
+
+def test_second_load_is_a_hit(small_video, tmp_path):
+    misses, hits = _counter("frame_cache_misses"), _counter("frame_cache_hits")
+    frame_cache.load_frames(small_video, cache_dir=str(tmp_path))
+    frame_cache.load_frames(small_video, cache_dir=str(tmp_path))
+    assert _counter("frame_cache_misses") == misses + 1
+    assert _counter("frame_cache_hits") == hits + 1
+
+
+def test_edited_clip_is_decoded_again(small_video, tmp_path):
+    clip = tmp_path / "clip.mp4"
+    clip.write_bytes(open(small_video, "rb").read())
+    cache_dir = str(tmp_path / "cache")
+    frame_cache.load_frames(str(clip), cache_dir=cache_dir)
+    stat = os.stat(clip)
+    os.utime(clip, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    misses = _counter("frame_cache_misses")
+    frame_cache.load_frames(str(clip), cache_dir=cache_dir)
+    assert _counter("frame_cache_misses") == misses + 1
+
+
+def test_resized_frames_are_cached_apart(small_video, tmp_path):
+    full, _ = frame_cache.load_frames(small_video, cache_dir=str(tmp_path))
+    small, _ = frame_cache.load_frames(small_video, (80, 60), cache_dir=str(tmp_path))
+    assert full.shape[1:3] == (120, 160)
+    assert small.shape[1:3] == (60, 80)
+
+
+def test_least_recently_used_clip_is_evicted(small_video, tmp_path):
+    cache_dir = str(tmp_path)
+    frame_bytes = 160 * 120 * 3
+    max_bytes = frame_bytes * 50
+    frame_cache.load_frames(small_video, (160, 120), cache_dir, max_bytes)
+    frame_cache.load_frames(small_video, (159, 120), cache_dir, max_bytes)
+    # the first entry was used last, so the second one makes room for the third
+    first = os.path.join(cache_dir, frame_cache._cache_key(small_video, (160, 120)) + ".json")
+    os.utime(first, (os.path.getmtime(first) + 10, os.path.getmtime(first) + 10))
+    frame_cache.load_frames(small_video, (158, 120), cache_dir, max_bytes)
+    keys = {key for _, _, key in frame_cache._entries(cache_dir)}
+    assert frame_cache._cache_key(small_video, (160, 120)) in keys
+    assert frame_cache._cache_key(small_video, (159, 120)) not in keys
+    assert frame_cache._cache_key(small_video, (158, 120)) in keys
+
+
+def test_clip_bigger_than_the_cap_is_not_cached(small_video, tmp_path):
+    assert frame_cache.load_frames(small_video, cache_dir=str(tmp_path), max_bytes=160 * 120 * 3 * 5) is None
+    assert not [name for name in os.listdir(tmp_path) if name.endswith((".raw", ".json"))]
+    cap = frame_cache.open_capture(small_video, str(tmp_path), 160 * 120 * 3 * 5)
+    assert isinstance(cap, cv2.VideoCapture)
+    cap.release()
+
+
+def test_capture_reads_copies_and_seeks(small_video, tmp_path):
+    decoded = _decoded(small_video)
+    cap = frame_cache.open_capture(small_video, str(tmp_path))
+    assert isinstance(cap, frame_cache.CachedCapture)
+    assert cap.get(cv2.CAP_PROP_FRAME_COUNT) == len(decoded)
+    ret, frame = cap.read()
+    assert ret and np.array_equal(frame, decoded[0])
+    frame[:] = 0
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    assert np.array_equal(cap.read()[1], decoded[0])
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 7)
+    assert np.array_equal(cap.read()[1], decoded[7])
+    cap.release()
+    assert cap.read() == (False, None)
+
+
+def test_reading_a_cached_clip_keeps_memory_bounded(tmp_path):
+    from synthetic_data import make_video
+    clip = str(tmp_path / "big.mp4")
+    # 120 frames of 1280x720 = 330 MB of raw frames
+    make_video(clip, (1280, 720), 120, seed=5)
+    script = textwrap.dedent(f"""
+        import resource, sys
+        sys.path.insert(0, {os.path.dirname(os.path.dirname(os.path.abspath(__file__)))!r})
+        import frame_cache
+        frame_cache.open_capture({clip!r}, {str(tmp_path / "cache")!r}).release()
+        cap = frame_cache.open_capture({clip!r}, {str(tmp_path / "cache")!r})
+        assert isinstance(cap, frame_cache.CachedCapture)
+        start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame += 1
+        print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start)
+    """)
+    grown_kb = int(subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True).stdout)
+    assert grown_kb < 64 * 1024
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+import random
+import threading
+import time
+import numpy as np
+import pytest
+from frame_pipeline import process_frames, run_pipeline
+
+
+# Capture giving count small frames whose every pixel is the frame number
+class _Capture:
+    def __init__(self, count, fail_at=None):
+        self.count = count
+        self.fail_at = fail_at
+        self.reads = 0
+
+    def read(self):
+        if self.reads == self.fail_at:
+            raise RuntimeError("decoder died")
+        if self.reads >= self.count:
+            return False, None
+        frame = np.full((4, 4), self.reads % 256, np.uint8)
+        self.reads += 1
+        return True, frame
+
+
+class _Writer:
+    def __init__(self):
+        self.frames = []
+        self.threads = set()
+
+    def write(self, frame):
+        self.threads.add(threading.current_thread())
+        self.frames.append(int(frame[0, 0]))
+
+
+# Transform that takes a random time, so the workers finish out of order
+def _slow_copy(frame):
+    time.sleep(random.uniform(0, 0.003))
+    return frame.copy()
+
+
+def test_frames_come_out_in_order():
+    random.seed(0)
+    frames = [int(frame[0, 0]) for frame in process_frames(_Capture(200), _slow_copy, workers=4, queue_depth=8)]
+    assert frames == [i % 256 for i in range(200)]
+
+
+def test_prepare_runs_in_order_and_reaches_the_transform():
+    seen = []
+
+    def prepare(frame):
+        seen.append(int(frame[0, 0]))
+        return len(seen)
+
+    def transform(frame, prepared):
+        time.sleep(random.uniform(0, 0.002))
+        return prepared
+
+    results = list(process_frames(_Capture(100), transform, workers=4, prepare=prepare))
+    assert seen == list(range(100))
+    assert results == list(range(1, 101))
+
+
+def test_closing_early_stops_the_decoder():
+    cap = _Capture(100000)
+    frames = process_frames(cap, _slow_copy, workers=2, queue_depth=4)
+    assert [int(next(frames)[0, 0]) for _ in range(3)] == [0, 1, 2]
+    before = threading.active_count()
+    frames.close()
+    reads = cap.reads
+    time.sleep(0.2)
+    assert cap.reads == reads < 100
+    assert threading.active_count() < before
+
+
+def test_transform_error_is_raised():
+    def transform(frame):
+        if frame[0, 0] == 5:
+            raise ValueError("bad frame")
+        return frame
+    with pytest.raises(ValueError, match="bad frame"):
+        list(process_frames(_Capture(50), transform, workers=3))
+
+
+def test_prepare_error_is_raised():
+    def prepare(frame):
+        if frame[0, 0] == 7:
+            raise KeyError("tracker")
+        return None
+    with pytest.raises(KeyError):
+        list(process_frames(_Capture(50), lambda frame, prepared: frame, workers=3, prepare=prepare))
+
+
+def test_capture_error_is_raised():
+    with pytest.raises(RuntimeError, match="decoder died"):
+        list(process_frames(_Capture(50, fail_at=10), _slow_copy, workers=2))
+
+
+def test_run_pipeline_writes_everything_in_order_on_the_calling_thread():
+    random.seed(1)
+    out = _Writer()
+    progress = []
+    count = run_pipeline(_Capture(60), out, _slow_copy, workers=4, queue_depth=6, on_frame=progress.append)
+    assert count == 60
+    assert out.frames == list(range(60))
+    assert progress == list(range(1, 61))
+    assert out.threads == {threading.current_thread()}
+
+
+def test_run_pipeline_raises_transform_errors():
+    def transform(frame):
+        raise ValueError("bad frame")
+    with pytest.raises(ValueError):
+        run_pipeline(_Capture(10), _Writer(), transform, workers=2)
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+import types
+import pytest
+import instrumentation
+from instrumentation import BUCKETS, Histogram, Metrics, ProgressReporter
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram()
+    assert histogram.quantile(0.5) == 0.0
+    for seconds in (0.0002, 0.0002, 0.003, 0.03, 20.0):
+        histogram.observe(seconds)
+    assert histogram.count == 5
+    assert histogram.total == pytest.approx(20.0334)
+    assert histogram.counts[BUCKETS.index(0.00025)] == 2
+    assert histogram.counts[-1] == 1
+    assert histogram.quantile(0.4) == 0.00025
+    assert histogram.quantile(0.5) == 0.005
+    assert histogram.quantile(1.0) == float("inf")
+
+
+def test_time_count_and_snapshot():
+    metrics = Metrics()
+    with metrics.time("decode"):
+        time.sleep(0.01)
+    with pytest.raises(ValueError):
+        with metrics.time("decode"):
+            raise ValueError
+    metrics.observe("blur", 0.002)
+    metrics.count("faces_detected")
+    metrics.count("faces_detected", 3)
+
+    snap = metrics.snapshot()
+    assert snap["counters"] == {"faces_detected": 4}
+    decode = snap["stages"]["decode"]
+    assert decode["count"] == 2
+    assert decode["total_ms"] >= 10
+    assert decode["mean_ms"] == pytest.approx(decode["total_ms"] / 2)
+    assert sum(decode["buckets"].values()) == 2
+    assert snap["stages"]["blur"]["p50_ms"] == 2.5
+    assert list(snap["stages"]["blur"]["buckets"])[-1] == "+Inf"
+
+
+def test_reset_clears_everything():
+    metrics = Metrics()
+    metrics.observe("encode", 0.1)
+    metrics.count("frames_written")
+    metrics.reset()
+    snap = metrics.snapshot()
+    assert snap["stages"] == {} and snap["counters"] == {}
+
+
+def _filled():
+    metrics = Metrics()
+    metrics.observe("detect", 0.0003)
+    metrics.observe("detect", 0.02)
+    metrics.count("detections_skipped", 7)
+    return metrics
+
+
+def test_json_dump(tmp_path):
+    path = tmp_path / "metrics.json"
+    _filled().dump(str(path))
+    data = json.loads(path.read_text(encoding="utf-8"))
+    assert data["counters"] == {"detections_skipped": 7}
+    assert data["stages"]["detect"]["count"] == 2
+
+
+def test_prometheus_dump(tmp_path):
+    path = tmp_path / "metrics.prom"
+    _filled().dump(str(path), "prometheus")
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert "# TYPE dip_stage_seconds histogram" in lines
+    assert 'dip_stage_seconds_bucket{stage="detect",le="0.0001"} 0' in lines
+    assert 'dip_stage_seconds_bucket{stage="detect",le="0.0005"} 1' in lines
+    # buckets are cumulative
+    assert 'dip_stage_seconds_bucket{stage="detect",le="+Inf"} 2' in lines
+    assert 'dip_stage_seconds_sum{stage="detect"} 0.020300000' in lines
+    assert 'dip_stage_seconds_count{stage="detect"} 2' in lines
+    assert "dip_detections_skipped_total 7" in lines
+
+
+def test_dump_every_rewrites_the_file(tmp_path):
+    metrics = Metrics()
+    path = tmp_path / "metrics.json"
+    stop = metrics.dump_every(str(path), 0.01)
+    metrics.count("frames_decoded")
+    deadline = time.perf_counter() + 5
+    while not path.exists() and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    # written while still running
+    assert path.exists()
+    metrics.count("frames_decoded")
+    stop()
+    # the last write happens when stopped
+    assert json.loads(path.read_text(encoding="utf-8"))["counters"] == {"frames_decoded": 2}
+
+
+def test_progress_is_printed_at_most_once_per_interval(monkeypatch, capsys):
+    now = [100.0]
+    monkeypatch.setattr(instrumentation, "time", types.SimpleNamespace(perf_counter=lambda: now[0]))
+    reporter = ProgressReporter(10, "Frames", interval=1.0)
+    for frame in range(1, 11):
+        now[0] += 0.3
+        reporter.update(frame)
+    lines = capsys.readouterr().out.split("\r")[1:]
+    # the first update, one after every full second, and the end
+    assert [line.split(":")[1].split("%")[0].strip() for line in lines] == ["10", "50", "90", "100"]
+    assert lines[-1] == "Frames: 100% (10/10 frames, 3.3 fps)"
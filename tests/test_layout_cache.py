@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import os
+import cv2
+import pytest
+import paragraph_extract_old_full as old_full
+from layout_cache import LayoutIndex, content_key, file_content_key
+from synthetic_data import make_page
+
+
+@pytest.fixture
+def page(tmp_path, monkeypatch):
+    monkeypatch.setattr(old_full, "output_dir", str(tmp_path / "out"))
+    os.makedirs(old_full.output_dir)
+    path = str(tmp_path / "page.png")
+    cv2.imwrite(path, make_page(columns=2, seed=7)[0])
+    return path
+
+
+def _extract(page, index, **params):
+    return old_full.extract_page_cached(page, index, old_full.layout_params(**params))[2]
+
+
+def test_unchanged_page_is_skipped(page, tmp_path):
+    index = LayoutIndex(str(tmp_path / "index.json"))
+    assert _extract(page, index) == "analysed"
+    index.save()
+    index = LayoutIndex(str(tmp_path / "index.json"))
+    assert _extract(page, index) == "unchanged"
+
+
+def test_deleted_crop_is_cut_again(page, tmp_path):
+    index = LayoutIndex(str(tmp_path / "index.json"))
+    _extract(page, index)
+    crops = index.previous(page)["crops"]
+    os.remove(crops[0])
+    assert _extract(page, index) == "recropped"
+    assert all(os.path.exists(p) for p in crops)
+
+
+def test_edited_page_is_analysed_again(page, tmp_path):
+    index = LayoutIndex(str(tmp_path / "index.json"))
+    _extract(page, index)
+    cv2.imwrite(page, make_page(columns=1, seed=8)[0])
+    assert _extract(page, index) == "analysed"
+
+
+@pytest.mark.parametrize("params", [{"strip_height": 512}, {"scale": 2}])
+def test_changed_setting_is_analysed_again(page, tmp_path, params):
+    index = LayoutIndex(str(tmp_path / "index.json"))
+    _extract(page, index)
+    assert _extract(page, index, **params) == "analysed"
+
+
+def test_new_layout_version_is_analysed_again(page, tmp_path, monkeypatch):
+    index = LayoutIndex(str(tmp_path / "index.json"))
+    _extract(page, index)
+    monkeypatch.setattr(old_full, "LAYOUT_VERSION", old_full.LAYOUT_VERSION + 1)
+    assert _extract(page, index) == "analysed"
+
+
+def test_entry_stored_without_saving_is_cut_when_saving(page, tmp_path, monkeypatch):
+    index = LayoutIndex(str(tmp_path / "index.json"))
+    monkeypatch.setattr(old_full, "save_paragraphs", False)
+    assert _extract(page, index) == "analysed"
+    assert _extract(page, index) == "unchanged"
+    assert not os.listdir(old_full.output_dir)
+
+    monkeypatch.setattr(old_full, "save_paragraphs", True)
+    assert _extract(page, index) == "recropped"
+    entry = index.previous(page)
+    assert entry["crops_saved"] and len(entry["crops"]) == len(entry["boxes"]) > 0
+    assert all(os.path.exists(p) for p in entry["crops"])
+    assert _extract(page, index) == "unchanged"
+
+
+def test_index_of_another_version_starts_empty(tmp_path):
+    path = str(tmp_path / "index.json")
+    index = LayoutIndex(path)
+    index.store("page.png", content_key(b"data", {}), {}, [], [], [])
+    index.save()
+    assert LayoutIndex(path).lookup("page.png", content_key(b"data", {})) is not None
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text.replace('"version": 2', '"version": 1'))
+    assert LayoutIndex(path).pages == {}
+
+
+def test_file_key_is_the_content_key(page):
+    with open(page, "rb") as f:
+        data = f.read()
+    params = old_full.layout_params()
+    assert file_content_key(page, params, chunk_size=1000) == content_key(data, params)
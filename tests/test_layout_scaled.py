@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+import os
+import cv2
+import pytest
+import paragraph_extract_old_full as old_full
+from synthetic_data import make_page
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = [os.path.join(ROOT, "Converted Paper (8)", f"{i:03d}.png") for i in range(1, 9)]
+
+
+def _binary(gray):
+    return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[1]
+
+
+@pytest.mark.parametrize("scale", [2, 3, 4])
+@pytest.mark.parametrize("path", PAGES)
+def test_scaled_layout_matches_full_resolution(path, scale):
+    bin_inv = _binary(cv2.imread(path, cv2.IMREAD_GRAYSCALE))
+    assert old_full.find_paragraph_boxes_scaled(bin_inv, scale) == old_full.find_paragraph_boxes(bin_inv)
+
+
+@pytest.mark.parametrize("scale", [2, 3, 4])
+@pytest.mark.parametrize("seed", range(8))
+def test_scaled_layout_matches_on_synthetic_pages(seed, scale):
+    gray, _ = make_page(columns=1 + seed % 3, table=seed % 2 == 1, seed=1000 + seed)
+    bin_inv = _binary(gray)
+    assert old_full.find_paragraph_boxes_scaled(bin_inv, scale) == old_full.find_paragraph_boxes(bin_inv)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import os
+import cv2
+import numpy as np
+import pytest
+import paragraph_extract_old_full as old_full
+from synthetic_data import make_page
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = [os.path.join(ROOT, "Converted Paper (8)", f"{i:03d}.png") for i in range(1, 9)]
+STRIP_HEIGHTS = [37, 256, 1000]
+
+
+def _synthetic(seed):
+    return make_page(columns=1 + seed % 3, table=seed % 2 == 1, seed=1000 + seed)[0]
+
+
+def _check_threshold(gray):
+    hist = np.bincount(gray.ravel(), minlength=256)
+    assert old_full.otsu_threshold(hist) == cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)[0]
+
+
+@pytest.mark.parametrize("path", PAGES)
+def test_otsu_threshold_matches_opencv(path):
+    _check_threshold(cv2.imread(path, cv2.IMREAD_GRAYSCALE))
+
+
+@pytest.mark.parametrize("seed", range(8))
+def test_otsu_threshold_matches_opencv_on_synthetic_pages(seed):
+    _check_threshold(_synthetic(seed))
+
+
+@pytest.mark.parametrize("strip_height", STRIP_HEIGHTS)
+@pytest.mark.parametrize("path", PAGES)
+def test_strip_layout_matches_whole_page(path, strip_height):
+    gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    whole = old_full.find_page_layout(gray, scale=1, strip_height=0)
+    assert old_full.find_page_layout(gray, strip_height=strip_height) == whole
+
+
+@pytest.mark.parametrize("strip_height", STRIP_HEIGHTS)
+@pytest.mark.parametrize("seed", range(8))
+def test_strip_layout_matches_on_synthetic_pages(seed, strip_height):
+    gray = _synthetic(seed)
+    whole = old_full.find_page_layout(gray, scale=1, strip_height=0)
+    assert old_full.find_page_layout(gray, strip_height=strip_height) == whole
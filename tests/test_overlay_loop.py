@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import cv2
+import numpy as np
+import pytest
+from instrumentation import metrics
+from script_loader import load_script
+
+SIZE = (32, 24)
+
+
+@pytest.fixture(scope="module")
+def clip(small_video):
+    cap = cv2.VideoCapture(small_video)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.resize(frame, SIZE))
+    cap.release()
+    return small_video, frames
+
+
+@pytest.mark.parametrize("kept", [1, 7, 19, 20, 100])
+def test_loop_over_the_memory_cap_gives_the_same_frames(clip, kept):
+    path, frames = clip
+    overlay = load_script("overlay")
+    loop = overlay.OverlayLoop(path, SIZE, max_bytes=kept * SIZE[0] * SIZE[1] * 3)
+    for i in range(3 * len(frames) + 5):
+        assert np.array_equal(loop.next(), frames[i % len(frames)])
+    loop.release()
+
+
+def test_fallback_is_reported(clip, capsys):
+    path, frames = clip
+    overlay = load_script("overlay")
+    before = metrics.snapshot()["counters"].get("overlay_streamed", 0)
+    loop = overlay.OverlayLoop(path, SIZE, max_bytes=5 * SIZE[0] * SIZE[1] * 3)
+    assert "does not fit" in capsys.readouterr().out
+    assert metrics.snapshot()["counters"]["overlay_streamed"] == before + 1
+    assert len(loop.head) == 5
+    loop.skip(len(frames) + 3)
+    assert np.array_equal(loop.next(), frames[3])
+    loop.release()
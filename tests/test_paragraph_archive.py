@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import os
+import cv2
+import numpy as np
+import pytest
+from batch_extract import run_batch
+from paragraph_archive import ParagraphArchive, ParagraphArchiveWriter
+from synthetic_data import make_page
+
+
+@pytest.fixture
+def pages(tmp_path):
+    paths = []
+    for i in range(2):
+        path = str(tmp_path / f"page{i}.png")
+        cv2.imwrite(path, make_page(columns=1 + i, seed=20 + i)[0])
+        paths.append(path)
+    blank = str(tmp_path / "blank.png")
+    cv2.imwrite(blank, np.full((400, 300), 255, np.uint8))
+    return paths + [blank]
+
+
+def _boxes_and_crops(path, seed):
+    gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    boxes = [(10, 20, 30, 40), (50, 60, 70, 80 + seed)]
+    return boxes, [gray[y:y+h, x:x+w] for x, y, w, h in boxes]
+
+
+@pytest.mark.parametrize("store_crops", [True, False])
+@pytest.mark.parametrize("compression", [0, 6])
+def test_round_trip(pages, tmp_path, store_crops, compression):
+    path = str(tmp_path / "paragraphs.zip")
+    written = {}
+    with ParagraphArchiveWriter(path, compression, store_crops) as archive:
+        for seed, page in enumerate(pages[:2]):
+            boxes, crops = _boxes_and_crops(page, seed)
+            archive.add_page(page, boxes, crops, columns=seed + 1)
+            written[page] = (boxes, crops)
+    assert not os.path.exists(path + ".partial")
+
+    with ParagraphArchive(path) as archive:
+        assert archive.pages == [os.path.normpath(page) for page in pages[:2]]
+        for seed, (page, (boxes, crops)) in enumerate(written.items()):
+            assert archive.boxes(page) == boxes
+            assert archive.columns(page) == seed + 1
+            assert archive.count(page) == len(crops)
+            for expected, crop in zip(crops, archive.crops(page)):
+                assert np.array_equal(crop, expected)
+
+
+def test_blank_page_is_kept_empty(pages, tmp_path):
+    path = str(tmp_path / "paragraphs.zip")
+    with ParagraphArchiveWriter(path) as archive:
+        archive.add_page(pages[2], None, [])
+        archive.add_page(pages[0], [], [], columns=0)
+    with ParagraphArchive(path) as archive:
+        assert archive.count(pages[2]) == 0
+        assert archive.boxes(pages[2]) is None
+        assert list(archive.crops(pages[2])) == []
+        assert archive.count(pages[0]) == 0
+        assert archive.boxes(pages[0]) == []
+
+
+def test_page_without_boxes_or_crops_is_refused(pages, tmp_path):
+    with ParagraphArchiveWriter(str(tmp_path / "paragraphs.zip"), store_crops=False) as archive:
+        with pytest.raises(ValueError):
+            archive.add_page(pages[0], None, [])
+
+
+def test_failed_archive_leaves_nothing(pages, tmp_path):
+    path = str(tmp_path / "paragraphs.zip")
+    with pytest.raises(RuntimeError):
+        with ParagraphArchiveWriter(path) as archive:
+            archive.add_page(pages[0], *_boxes_and_crops(pages[0], 0))
+            raise RuntimeError
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + ".partial")
+
+
+@pytest.mark.parametrize("extractor", ["old_full", "main"])
+def test_batch_archive_with_a_blank_page(pages, tmp_path, extractor):
+    path = str(tmp_path / "paragraphs.zip")
+    results = run_batch(pages, extractor, None, workers=2, archive_path=path)
+    assert [result["error"] for result in results] == [None] * len(pages)
+    with ParagraphArchive(path) as archive:
+        assert sorted(archive.pages) == sorted(os.path.normpath(page) for page in pages)
+        assert archive.count(pages[2]) == 0
+        for result in results:
+            assert archive.count(result["page"]) == result["paragraphs"]
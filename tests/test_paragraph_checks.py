@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+import cv2
+import numpy as np
+import paragraph_extract_old_full as old_full
+from synthetic_data import make_page
+
+
+# The per-blob checks as they were before the summed area table, scanning the blob's pixels
+def _count_text_rows(roi_inv):
+    row_sum = np.sum(roi_inv == 255, axis=1)
+    active = row_sum > old_full.ROW_TEXT_THRESH * roi_inv.shape[1]
+    runs, in_run = 0, False
+    for flag in active:
+        if flag and not in_run:
+            runs += 1
+            in_run = True
+        elif not flag and in_run:
+            in_run = False
+    return runs
+
+
+def _count_horizontal_lines(mask, min_len_ratio=0.8):
+    h, w = mask.shape
+    lines = 0
+    for row in mask:
+        if np.sum(row == 255) > min_len_ratio * w:
+            lines += 1
+    return lines
+
+
+def _old_is_paragraph(roi):
+    h, w = roi.shape
+    return (
+        cv2.countNonZero(roi) / (w * h) <= old_full.MAX_FILL_RATIO and
+        _count_text_rows(roi) >= old_full.MIN_TEXT_LINES and
+        w / h <= old_full.MAX_ASPECT_RATIO and
+        _count_horizontal_lines(roi) <= old_full.MAX_HLINES
+    )
+
+
+def test_table_lookups_match_scanning_the_blob():
+    gray = make_page(columns=2, table=True, seed=4)[0]
+    _, bin_inv = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    table = old_full.text_integral(bin_inv)
+    rng = np.random.default_rng(0)
+    height, width = bin_inv.shape
+    outcomes = set()
+    for _ in range(300):
+        w, h = int(rng.integers(5, width // 2)), int(rng.integers(5, height // 3))
+        x, y = int(rng.integers(0, width - w)), int(rng.integers(0, height - h))
+        expected = _old_is_paragraph(bin_inv[y:y+h, x:x+w])
+        assert old_full.paragraph_checks(old_full.box_row_sums(table, x, y, w, h), w, h) == expected
+        outcomes.add(expected)
+    assert outcomes == {True, False}
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import os
+import tracemalloc
+import numpy as np
+import pytest
+import paragraph_extract_main as main
+from synthetic_data import make_page
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = [os.path.join(ROOT, "Converted Paper (8)", f"{i:03d}.png") for i in range(1, 9)]
+# counted by hand, tables and figures count as one paragraph
+COUNTS = [6, 8, 7, 8, 5, 8, 8, 8]
+
+
+@pytest.mark.parametrize("path, count", list(zip(PAGES, COUNTS)))
+def test_paragraph_counts(path, count):
+    assert len(main.extract_paragraphs(path)) == count
+
+
+@pytest.mark.parametrize("path", [PAGES[4], PAGES[6], PAGES[7]])
+def test_figures_inside_a_column_leave_the_page_as_it_was(path):
+    binary = main.to_binary(path)
+    regions = main.find_table_regions(binary)
+    assert regions
+    assert main.merging_regions(binary, regions) == []
+    assert main.extract_paragraph_boxes(path) == [box for box, _ in main.page_boxes(binary.copy(), [])]
+
+
+def test_table_across_the_columns_is_one_paragraph():
+    binary = main.to_binary(PAGES[3])
+    regions = main.merging_regions(binary, main.find_table_regions(binary))
+    assert len(regions) == 1
+    x, y, w, h = regions[0]
+    assert 190 <= y <= 210 and y + h <= 400
+    paragraphs = main.extract_paragraphs(PAGES[3])
+    assert paragraphs[0].shape == (h, main.page_boxes(binary, regions)[0][0][2])
+    assert not np.all(paragraphs[0] == 255)
+
+
+# The check as it was first written, on a copy of the page with the regions made white
+def _old_merging_regions(binary, regions):
+    if not regions:
+        return regions
+    masked = binary.copy()
+    for x, y, w, h in regions:
+        masked[y:y+h, x:x+w] = 255
+    masked_columns = main.segment_columns(masked)
+    columns = main.segment_columns(binary)
+    merging = []
+    for x, y, w, h in regions:
+        spans = sum(1 for x_start, x_end, _ in masked_columns if x_start < x + w and x < x_end)
+        merged = any(para_start < y or para_end > y + h
+                     for x_start, x_end, column_img in columns if x_start < x + w and x < x_end
+                     for para_start, para_end in main.paragraph_bounds(column_img) if para_start < y + h and para_end > y)
+        if spans > 1 or merged:
+            merging.append((x, y, w, h))
+    return merging
+
+
+def _binaries():
+    pages = [main.to_binary(path) for path in PAGES]
+    pages += [main.to_binary(make_page(columns=columns, table=True, seed=seed)[0])
+              for columns in (1, 2, 3) for seed in (50, 51)]
+    return pages
+
+
+def test_merging_regions_matches_masking_a_copy():
+    for binary in _binaries():
+        regions = main.find_table_regions(binary)
+        assert main.merging_regions(binary, regions) == _old_merging_regions(binary, regions)
+        # overlapping regions are only made white once
+        if regions:
+            x, y, w, h = regions[0]
+            overlapping = regions + [(x + w // 4, y + h // 4, w // 2, h)]
+            assert main.merging_regions(binary, overlapping) == _old_merging_regions(binary, overlapping)
+
+
+def test_merging_regions_does_not_copy_the_page():
+    binary = main.to_binary(PAGES[3])
+    regions = main.find_table_regions(binary)
+    tracemalloc.start()
+    main.merging_regions(binary, regions)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert peak < binary.nbytes // 4
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+from pip_compositor import PipCompositor, PipLayer, rounded_mask
+
+FRAME_SIZE = (160, 120)
+
+
+class _Clip:
+    def __init__(self, size, seed):
+        self.rng = np.random.default_rng(seed)
+        self.size = size
+
+    def next(self):
+        return self.rng.integers(0, 256, (self.size[1], self.size[0], 3), dtype=np.uint8)
+
+
+# Every layer blended over the whole frame in floating point, in z order, without any clipping,
+# cropping or bands: frame = frame * (255 - alpha) / 255 + colour * alpha / 255
+# layers in z order, sources = the matching frames of the clips (None for still images)
+def _reference(frame, layers, sources):
+    result = frame.astype(np.float64)
+    for layer, source in zip(layers, sources):
+        alpha, image = layer.alpha_and_image()
+        colour = (source if image is None else image).astype(np.float64)
+        x, y, w, h = layer.rect
+        canvas = np.zeros(result.shape, np.float64)
+        weight = np.zeros(result.shape[:2] + (1,), np.float64)
+        fx0, fy0 = max(0, x), max(0, y)
+        fx1, fy1 = min(FRAME_SIZE[0], x + w), min(FRAME_SIZE[1], y + h)
+        if fx1 > fx0 and fy1 > fy0:
+            canvas[fy0:fy1, fx0:fx1] = colour[fy0 - y:fy1 - y, fx0 - x:fx1 - x]
+            weight[fy0:fy1, fx0:fx1] = alpha[fy0 - y:fy1 - y, fx0 - x:fx1 - x]
+        result = np.rint((result * (255 - weight) + canvas * weight) / 255)
+    return result.astype(np.uint8)
+
+
+def _frame(seed):
+    return np.random.default_rng(seed).integers(0, 256, (FRAME_SIZE[1], FRAME_SIZE[0], 3), dtype=np.uint8)
+
+
+def _image(size, seed, channels=3):
+    return np.random.default_rng(seed).integers(0, 256, (size[1], size[0], channels), dtype=np.uint8)
+
+
+LAYOUTS = {
+    "opaque": lambda: [PipLayer(_image((40, 30), 1), (10, 10, 40, 30))],
+    "rounded clip": lambda: [PipLayer(_Clip((50, 40), 2), (100, 70, 50, 40), mask=rounded_mask((50, 40), 12))],
+    "half opacity": lambda: [PipLayer(_image((60, 20), 3), (20, 90, 60, 20), opacity=0.5)],
+    "bgra image": lambda: [PipLayer(_image((30, 30), 4, channels=4), (5, 60, 30, 30))],
+    "off the edges": lambda: [PipLayer(_image((50, 50), 5), (-20, -10, 50, 50), mask=rounded_mask((50, 50), 20)),
+                              PipLayer(_Clip((40, 40), 6), (140, 100, 40, 40), opacity=0.7)],
+    "stacked": lambda: [PipLayer(_image((80, 60), 7), (30, 20, 80, 60), opacity=0.8, z=2),
+                        PipLayer(_Clip((80, 60), 8), (60, 40, 80, 60), mask=rounded_mask((80, 60), 16), z=1),
+                        PipLayer(_image((160, 12), 9, channels=4), (0, 108, 160, 12), z=3)],
+    "outside": lambda: [PipLayer(_image((20, 20), 10), (200, 200, 20, 20))],
+}
+
+
+@pytest.mark.parametrize("layout", sorted(LAYOUTS))
+def test_composite_matches_the_float_blend(layout):
+    compositor = PipCompositor(LAYOUTS[layout](), FRAME_SIZE)
+    for seed in range(3):
+        frame = _frame(seed)
+        sources = compositor.prepare(frame)
+        expected = _reference(frame, compositor.layers, sources)
+        result = compositor.composite(frame, sources)
+        assert result is frame
+        assert np.array_equal(result, expected)
+
+
+def test_opaque_layer_is_the_old_paste():
+    frame, small = _frame(11), _image((40, 30), 12)
+    expected = frame.copy()
+    expected[20:50, 100:140] = small
+    compositor = PipCompositor([PipLayer(small, (100, 20, 40, 30))], FRAME_SIZE)
+    assert np.array_equal(compositor.composite(frame, compositor.prepare(frame)), expected)
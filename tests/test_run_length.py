@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+import paragraph_extract_main as main_extract
+import paragraph_extract_old_full as old_full
+from run_length import count_runs, find_runs
+
+
+# The element by element scans the extractors used before run_length
+def _old_find_regions(hist, min_width=1):
+    regions = []
+    in_region = False
+    for i in range(len(hist)):
+        if hist[i] > 0 and not in_region:
+            start = i
+            in_region = True
+        elif hist[i] == 0 and in_region:
+            end = i
+            in_region = False
+            if end - start > min_width:
+                regions.append((start, end))
+    return regions
+
+
+def _old_find_column_regions(hist, threshold=1, min_width=30):
+    is_text = hist > threshold
+    in_col = False
+    column_regions = []
+    for i in range(len(is_text)):
+        if is_text[i] and not in_col:
+            start = i
+            in_col = True
+        elif not is_text[i] and in_col:
+            end = i
+            in_col = False
+            if (end - start) >= min_width:
+                column_regions.append((start, end))
+    if in_col:
+        column_regions.append((start, len(hist)-1))
+    return column_regions if column_regions else [(0, len(hist)-1)]
+
+
+def _old_count_runs(active):
+    runs, in_run = 0, False
+    for flag in active:
+        if flag and not in_run:
+            runs += 1
+            in_run = True
+        elif not flag and in_run:
+            in_run = False
+    return runs
+
+
+def _histograms():
+    rng = np.random.default_rng(0)
+    fixed = [np.zeros(0, int), np.zeros(50, int), np.full(50, 5), np.r_[np.zeros(10), np.full(40, 3)],
+             np.r_[np.full(40, 3), np.zeros(10)], np.r_[np.zeros(5), np.full(30, 2), np.zeros(5)]]
+    random = []
+    for _ in range(200):
+        length = int(rng.integers(1, 400))
+        # runs of random lengths, so both short and long regions (and edge cases at the ends) show up
+        values = np.repeat(rng.integers(0, 4, 60), rng.integers(1, 40, 60))[:length]
+        random.append(values)
+    return fixed + random
+
+
+@pytest.mark.parametrize("min_width", [0, 1, 5, 30])
+def test_find_regions_matches_the_loop(min_width):
+    for hist in _histograms():
+        assert main_extract.find_regions(hist, min_width) == _old_find_regions(hist, min_width)
+
+
+@pytest.mark.parametrize("threshold, min_width", [(1, 30), (0, 1), (2, 10)])
+def test_find_column_regions_matches_the_loop(threshold, min_width):
+    for hist in _histograms():
+        if len(hist) == 0:
+            continue
+        assert old_full.find_column_regions(hist, threshold, min_width) == \
+            _old_find_column_regions(hist, threshold, min_width)
+
+
+def test_runs_match_the_loop():
+    for hist in _histograms():
+        mask = hist > 1
+        assert count_runs(mask) == _old_count_runs(mask)
+        starts, ends = find_runs(mask)
+        assert len(starts) == len(ends) == count_runs(mask)
+        assert all(mask[s:e].all() for s, e in zip(starts, ends))
+        assert np.count_nonzero(mask) == int((ends - starts).sum())
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+import cv2
+import numpy as np
+import pytest
+import frame_pipeline
+import segment_render
+from effect_graph import BrightnessStage, VideoInfo
+from script_loader import load_script
+
+
+@pytest.fixture(scope="module")
+def numbered_video(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("video") / "numbered.mp4")
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 25, (64, 48))
+    rng = np.random.default_rng(0)
+    for i in range(150):
+        frame = np.full((48, 64, 3), i * 7 % 256, np.uint8)
+        frame[:8, :8] = rng.integers(0, 256, (8, 8, 3))
+        out.write(frame)
+    out.release()
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return path, frames
+
+
+@pytest.mark.parametrize("target", [0, 1, 12, 49, 50, 51, 99, 149])
+def test_seek_lands_on_the_exact_frame(numbered_video, target):
+    path, frames = numbered_video
+    cap = cv2.VideoCapture(path)
+    assert frame_pipeline.seek_to_frame(cap, target, 25.0)
+    assert np.array_equal(cap.read()[1], frames[target])
+    cap.release()
+
+
+# Capture whose seeks land a few frames after the asked one, like a container with inexact seeking
+class _LateSeek:
+    def __init__(self, frames, late):
+        self.frames = frames
+        self.late = late
+        self.position = 0
+
+    def set(self, prop, value):
+        self.position = min(int(value) + self.late, len(self.frames)) if value else 0
+        return True
+
+    def get(self, prop):
+        return (self.position - 1) * 40.0
+
+    def grab(self):
+        if self.position >= len(self.frames):
+            return False
+        self.position += 1
+        return True
+
+    def read(self):
+        if not self.grab():
+            return False, None
+        return True, self.frames[self.position - 1]
+
+
+@pytest.mark.parametrize("late", [0, 3, 60])
+def test_seek_goes_further_back_when_it_lands_late(numbered_video, late):
+    _, frames = numbered_video
+    for target in (5, 70, 120):
+        cap = _LateSeek(frames, late)
+        assert frame_pipeline.seek_to_frame(cap, target, 25.0, back=10)
+        assert np.array_equal(cap.read()[1], frames[target])
+
+
+def test_seek_past_the_end(numbered_video):
+    path, _ = numbered_video
+    cap = cv2.VideoCapture(path)
+    assert not frame_pipeline.seek_to_frame(cap, 400, 25.0)
+    cap.release()
+
+
+def test_tail_builds_only_the_stages_that_add_frames(numbered_video, tmp_path):
+    path, frames = numbered_video
+    configs = [{"type": "pip", "overlay": str(tmp_path / "missing.mp4")},
+               {"type": "endscreen", "path": path}]
+    count = segment_render.render_tail(path, str(tmp_path / "tail.avi"), configs, "MJPG")
+    assert count == len(frames)
+
+
+def test_night_only_is_decided_once(numbered_video, monkeypatch):
+    path, _ = numbered_video
+    brightness = load_script("brightness")
+    calls = []
+    monkeypatch.setattr(brightness, "is_nighttime", lambda *args: calls.append(args) or True)
+    configs = segment_render.resolve_stage_configs(path, [{"type": "brightness", "night_only": True},
+                                                          {"type": "brightness"}])
+    assert configs[0]["is_night"] is True and "is_night" not in configs[1]
+    info = VideoInfo(path, 64, 48, 25.0, 150)
+    stages = [BrightnessStage(configs[0], info) for _ in range(4)]
+    assert len(calls) == 1
+    assert all(stage.enabled for stage in stages)
+    assert not BrightnessStage(dict(configs[0], is_night=False), info).enabled
+
+
+def test_segmented_render_writes_every_frame(numbered_video, tmp_path):
+    path, frames = numbered_video
+    configs = [{"type": "brightness", "contrast": 1.1, "brightness": 5}]
+    count = segment_render.render_segmented(path, str(tmp_path / "out.avi"), configs, segments=3, warmup=5, codec="MJPG")
+    assert count == len(frames)
+    cap = cv2.VideoCapture(str(tmp_path / "out.avi"))
+    assert int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) == len(frames)
+    cap.release()
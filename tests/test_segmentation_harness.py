@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+import segmentation_harness as harness
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_match_boxes_pairs_each_box_once():
+    truth = [(0, 0, 10, 10), (20, 0, 10, 10)]
+    assert harness.match_boxes(truth, [(0, 0, 10, 10)]) == [1.0, 0.0]
+    assert harness.match_boxes(truth, [(20, 0, 10, 10), (0, 0, 10, 10), (1, 0, 10, 10)]) == [1.0, 1.0]
+    assert harness.match_boxes(truth, []) == [0.0, 0.0]
+
+
+@pytest.fixture
+def reference(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    return harness.load_reference()
+
+
+def test_reference_boxes_are_reported_as_agreement_not_accuracy(reference):
+    pages = harness.test_pages(reference, synthetic=2)
+    summary, per_page = harness.evaluate(reference["reference_variant"], pages)
+    sample = [r for r in per_page if not r["page"].startswith("synthetic/")]
+    synthetic = [r for r in per_page if r["page"].startswith("synthetic/")]
+    assert all("mean_iou" not in r and r["agreement"] == 1.0 for r in sample)
+    assert all("agreement" not in r and "mean_iou" in r for r in synthetic)
+    assert summary["agreement"] == 1.0
+    assert summary["mean_iou"] == pytest.approx(sum(r["mean_iou"] for r in synthetic) / len(synthetic))
+
+
+def test_hand_counts_of_the_sample_pages(reference):
+    counts = [page["count"] for page in reference["pages"].values()]
+    assert counts == [6, 8, 7, 8, 5, 8, 8, 8]
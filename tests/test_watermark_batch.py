@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import cv2
+import numpy as np
+import pytest
+import endscreen_cache
+from script_loader import load_script
+from synthetic_data import make_video
+
+watermark = load_script("watermark")
+
+
+@pytest.fixture
+def assets(tmp_path, small_video, monkeypatch):
+    # watermarks, endscreen and a source video of their own in tmp_path, instead of the author's folder
+    mark = np.zeros((120, 160, 3), np.uint8)
+    cv2.rectangle(mark, (10, 10), (60, 40), (255, 255, 255), -1)
+    cv2.imwrite(str(tmp_path / "watermark1.png"), mark)
+    cv2.imwrite(str(tmp_path / "watermark2.png"), mark[::-1])
+    endscreen = str(tmp_path / "endscreen.mp4")
+    make_video(endscreen, (80, 60), 5, seed=4)
+    video = str(tmp_path / "talk.mp4")
+    shutil.copy(small_video, video)
+    monkeypatch.setattr(watermark, "WATERMARK1_PATH", str(tmp_path / "watermark1.png"))
+    monkeypatch.setattr(watermark, "WATERMARK2_PATH", str(tmp_path / "watermark2.png"))
+    monkeypatch.setattr(watermark, "ENDSCREEN_PATH", endscreen)
+    monkeypatch.setattr(endscreen_cache, "ENDSCREEN_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(endscreen_cache, "_loaded", {})
+    return video
+
+
+def _frame_count(path):
+    cap = cv2.VideoCapture(path)
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return count
+
+
+def _process(video):
+    return watermark.process_video(video, watermark.WATERMARK1_PATH, watermark.WATERMARK2_PATH,
+                                   watermark.ENDSCREEN_PATH, pipeline_workers=1, progress_step=50)
+
+
+def _touch(path, seconds):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 10 ** 9))
+
+
+def test_is_up_to_date(assets):
+    output = watermark.get_output_path(assets)
+    assert not watermark.is_up_to_date(assets)
+    shutil.copy(assets, output)
+    _touch(output, 10)
+    assert watermark.is_up_to_date(assets)
+    _touch(assets, 20)
+    assert not watermark.is_up_to_date(assets)
+
+
+def test_finished_video_replaces_the_partial_file(assets):
+    assert _process(assets) == 20
+    output = watermark.get_output_path(assets)
+    assert _frame_count(output) == 20 + 5
+    assert sorted(os.listdir(os.path.dirname(assets))) == sorted(
+        ["cache", "endscreen.mp4", "talk.mp4", "talk_final.mp4", "watermark1.png", "watermark2.png"])
+
+
+def test_failure_midway_leaves_no_partial_file(assets, monkeypatch):
+    calls = []
+
+    def broken(frame, layer):
+        calls.append(1)
+        if len(calls) == 5:
+            raise RuntimeError("blend failed")
+        return frame
+    monkeypatch.setattr(watermark, "blend_layer", broken)
+    with pytest.raises(RuntimeError):
+        _process(assets)
+    assert not [name for name in os.listdir(os.path.dirname(assets)) if "_final" in name]
+
+
+def test_unopenable_video_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        watermark.process_video(str(tmp_path / "missing.mp4"), "a.png", "b.png", "end.mp4")
+
+
+def test_batch_skips_up_to_date_videos(assets, capsys):
+    output = watermark.get_output_path(assets)
+    with open(output, "wb") as f:
+        f.write(b"already done")
+    _touch(output, 10)
+    assert watermark.run_batch([assets, watermark.ENDSCREEN_PATH], workers=1) == []
+    with open(output, "rb") as f:
+        assert f.read() == b"already done"
+    assert "1 already up to date, 0 to process" in capsys.readouterr().out
+
+
+def test_batch_reports_unopenable_video_as_failed(assets, tmp_path, capsys):
+    broken = str(tmp_path / "broken.mp4")
+    with open(broken, "wb") as f:
+        f.write(b"not a video")
+    results = {os.path.basename(r["video"]): r for r in watermark.run_batch([assets, broken], workers=1)}
+    assert results["talk.mp4"]["error"] is None and results["talk.mp4"]["frames"] == 20
+    assert results["broken.mp4"]["error"] and results["broken.mp4"]["frames"] == 0
+    assert " broken.mp4: 0 frames" in capsys.readouterr().out.split("Summary")[1].split("FAILED")[0]
+    assert not os.path.exists(watermark.get_output_path(broken))
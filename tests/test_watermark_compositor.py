@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import cv2
+import numpy as np
+import pytest
+from watermark_compositor import blend_colour, blend_layer, blend_premultiplied, build_layer
+
+
+# The per-frame float blend the watermark script used before the precomposited layer
+def _old_overlay_watermark(frame, watermark):
+    frame = frame.astype(float)
+    wm = cv2.resize(watermark, (frame.shape[1], frame.shape[0]))
+    overlay_color = wm[:, :, :3].astype(float)
+    overlay_alpha = wm[:, :, 3:] / 255.0
+    blended = frame * (1 - overlay_alpha) + overlay_color * overlay_alpha
+    return blended.astype(np.uint8)
+
+
+def _frame(seed, size=(160, 120)):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)
+
+
+def _watermark(seed, size=(160, 120), binary=False):
+    rng = np.random.default_rng(seed)
+    wm = np.zeros((size[1], size[0], 4), np.uint8)
+    x, y = rng.integers(0, size[0] // 2), rng.integers(0, size[1] // 2)
+    patch = rng.integers(0, 256, (size[1] // 3, size[0] // 3, 4), dtype=np.uint8)
+    if binary:
+        patch[:, :, 3] = np.where(patch[:, :, 3] > 127, 255, 0)
+    wm[y:y + patch.shape[0], x:x + patch.shape[1]] = patch
+    return wm
+
+
+def test_divide_matches_rounded_division():
+    x = np.arange(255 * 255 + 1, dtype=np.uint16).reshape(-1, 1, 1)
+    roi = np.zeros(x.shape, np.uint8)
+    blend_premultiplied(roi, x, np.zeros_like(x))
+    assert np.array_equal(roi[:, 0, 0], np.rint(np.arange(255 * 255 + 1) / 255).astype(np.uint8))
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_binary_watermarks_match_the_old_blend_exactly(seed):
+    frame = _frame(seed)
+    wm1, wm2 = _watermark(10 + seed, binary=True), _watermark(20 + seed, binary=True)
+    expected = _old_overlay_watermark(_old_overlay_watermark(frame, wm1), wm2)
+    assert np.array_equal(blend_layer(frame.copy(), build_layer([wm1, wm2])), expected)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_soft_watermarks_match_the_old_blend(seed):
+    frame = _frame(seed)
+    wm1, wm2 = _watermark(10 + seed), _watermark(20 + seed)
+    expected = _old_overlay_watermark(_old_overlay_watermark(frame, wm1), wm2)
+    result = blend_layer(frame.copy(), build_layer([wm1, wm2]))
+    # the old blend truncated after each watermark, the layer rounds once
+    assert np.abs(result.astype(int) - expected).max() <= 2
+
+
+def test_blend_is_in_place_and_only_touches_the_layer():
+    frame = _frame(5)
+    wm = _watermark(6)
+    layer = build_layer([wm])
+    result = blend_layer(frame, layer)
+    assert result is frame
+    outside = np.ones(frame.shape[:2], bool)
+    h, w = layer.shape[:2]
+    outside[layer.y:layer.y + h, layer.x:layer.x + w] = False
+    assert np.array_equal(frame[outside], _frame(5)[outside])
+
+
+def test_blend_colour_matches_float_blend():
+    roi, colour = _frame(7), _frame(8)
+    alpha = np.random.default_rng(9).integers(0, 256, roi.shape[:2] + (1,)).astype(np.uint16)
+    expected = np.rint((roi * (255.0 - alpha) + colour * alpha.astype(float)) / 255).astype(np.uint8)
+    blend_colour(roi, colour, alpha, 255 - alpha)
+    assert np.array_equal(roi, expected)
+
+
+def test_transparent_watermarks_leave_the_frame_alone():
+    frame = _frame(3)
+    layer = build_layer([np.zeros((120, 160, 4), np.uint8)])
+    assert layer.empty
+    assert np.array_equal(blend_layer(frame.copy(), layer), frame)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Precomposited watermark blending
+
+All the watermarks of a video are merged once into a single premultiplied alpha layer,
+which is cropped to the area where it is actually visible. Every frame then only blends
+that area, in place, with 16 bit integer math into buffers that are reused between frames.
+"""
+import threading
+import numpy as np
+from instrumentation import metrics
+
+
+class WatermarkLayer:
+
+    # x, y = top left corner of the layer in the frame
+    # premul = colour * alpha (0-65025) as uint16, inv_alpha = 255 - alpha as uint16
+    def __init__(self, x, y, premul, inv_alpha):
+        self.x = x
+        self.y = y
+        self.premul = premul
+        self.inv_alpha = inv_alpha
+
+    @property
+    def shape(self):
+        return self.premul.shape
+
+    @property
+    def empty(self):
+        return self.premul.size == 0
+
+
+# Merges RGBA (BGR + alpha) watermarks of the same size into one layer, the later ones drawn over the earlier ones
+# Only the bounding box of the pixels with non zero alpha is kept
+def build_layer(watermarks):
+    colour = None
+    alpha = None
+    for wm in watermarks:
+        a = wm[:, :, 3:].astype(np.float32) / 255.0
+        c = wm[:, :, :3].astype(np.float32)
+        if colour is None:
+            colour = c * a
+            alpha = a
+        else:
+            # "over" operator on premultiplied colours
+            colour = c * a + colour * (1 - a)
+            alpha = a + alpha * (1 - a)
+
+    if colour is None:
+        return WatermarkLayer(0, 0, np.zeros((0, 0, 3), np.uint16), np.zeros((0, 0, 1), np.uint16))
+
+    # Crop to where the watermarks are visible
+    rows = np.flatnonzero(alpha[:, :, 0].any(axis=1))
+    cols = np.flatnonzero(alpha[:, :, 0].any(axis=0))
+    if len(rows) == 0:
+        return WatermarkLayer(0, 0, np.zeros((0, 0, 3), np.uint16), np.zeros((0, 0, 1), np.uint16))
+    y0, y1 = rows[0], rows[-1] + 1
+    x0, x1 = cols[0], cols[-1] + 1
+
+    premul = np.rint(colour[y0:y1, x0:x1] * 255).astype(np.uint16)
+    inv_alpha = np.rint((1 - alpha[y0:y1, x0:x1]) * 255).astype(np.uint16)
+    return WatermarkLayer(int(x0), int(y0), premul, inv_alpha)
+
+
+# Working buffers, one set per thread and layer size, so the frame pipeline workers never share them
+_local = threading.local()
+
+def _buffers(shape):
+    cache = getattr(_local, "buffers", None)
+    if cache is None:
+        cache = _local.buffers = {}
+    if shape not in cache:
+        cache[shape] = (np.empty(shape, np.uint16), np.empty(shape, np.uint16))
+    return cache[shape]
+
+
+# roi = buf / 255 (in place), done as x / 255 ~ (x + 128 + ((x + 128) >> 8)) >> 8
+def _divide_into(roi, buf, tmp):
+    buf += 128
+    np.right_shift(buf, 8, out=tmp)
+    buf += tmp
+    np.right_shift(buf, 8, out=buf)
+    np.copyto(roi, buf, casting="unsafe")
+
+
+# Blends premultiplied colour onto roi (a uint8 view into the frame) in place
+# roi = roi * (255 - alpha) / 255 + colour * alpha / 255
+def blend_premultiplied(roi, premul, inv_alpha):
+    buf, tmp = _buffers(premul.shape)
+    np.multiply(roi, inv_alpha, out=buf)
+    buf += premul
+    _divide_into(roi, buf, tmp)
+
+
+# Blends a uint8 colour image of the same size as roi onto it in place, for colours that change
+# every frame (eg. a video), alpha and inv_alpha = 255 - alpha as uint16
+def blend_colour(roi, colour, alpha, inv_alpha):
+    buf, tmp = _buffers(roi.shape)
+    np.multiply(roi, inv_alpha, out=buf)
+    np.multiply(colour, alpha, out=tmp)
+    buf += tmp
+    _divide_into(roi, buf, tmp)
+
+
+# Blends the layer onto the frame in place (and returns the same frame)
+def blend_layer(frame, layer):
+    if layer.empty:
+        return frame
+    h, w = layer.shape[:2]
+    roi = frame[layer.y:layer.y + h, layer.x:layer.x + w]
+
+    with metrics.time("blend"):
+        blend_premultiplied(roi, layer.premul, layer.inv_alpha)
+    return frame